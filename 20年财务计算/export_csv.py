@@ -6,10 +6,15 @@
 
 import json
 import csv
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'generation'))
+from artifact_io import open_artifact
 
 def export_to_csv():
-    # 读取JSON数据
-    with open('financial_simulation_240months.json', 'r', encoding='utf-8') as f:
+    # 读取JSON数据（也可以是压缩的 .json.xz / .json.gz，自动解压）
+    with open_artifact('financial_simulation_240months.json', 'r') as f:
         data = json.load(f)
     
     monthly_data = data['monthly_data']
@@ -8,7 +8,13 @@
 import math
 from decimal import Decimal, ROUND_HALF_UP
 import json
+import sys
 from datetime import datetime
+from pathlib import Path
+
+# 复用 generation 目录下的产物压缩读写
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'generation'))
+from artifact_io import artifact_path, compression_for, open_artifact
 
 class FinancialSimulator:
     def __init__(self):
@@ -253,9 +259,10 @@ class FinancialSimulator:
         except:
             return None
     
-    def export_to_json(self, filename='financial_simulation_240months.json'):
+    def export_to_json(self, filename='financial_simulation_240months.json', compression=None):
         """
         导出完整数据到JSON文件
+        compression 为 auto/gzip/lzma 时压缩（文件名加 .xz/.gz），export_csv.py 可直接读取
         """
         monthly_data = self.simulate_20_years()
         summary = self.calculate_summary(monthly_data)
@@ -270,7 +277,8 @@ class FinancialSimulator:
             'monthly_data': monthly_data,
         }
         
-        with open(filename, 'w', encoding='utf-8') as f:
+        filename = artifact_path(filename, compression_for('simulation_json', compression))
+        with open_artifact(filename, 'w') as f:
             json.dump(output, f, ensure_ascii=False, indent=2)
         
         print(f"✅ 数据已导出到: {filename}")
@@ -283,9 +291,17 @@ class FinancialSimulator:
         return output
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='20年240个月财务模拟')
+    parser.add_argument('--compress', nargs='?', const='auto', default=None,
+                       choices=['none', 'auto', 'gzip', 'lzma'],
+                       help='压缩导出的JSON（不带参数时为 auto，即 lzma）')
+    args = parser.parse_args()
+    
     print("🚀 开始生成20年240个月财务模拟数据...\n")
     
     simulator = FinancialSimulator()
-    result = simulator.export_to_json()
+    result = simulator.export_to_json(compression=args.compress)
     
     print("\n✨ 模拟完成!")
@@ -8,20 +8,45 @@
 
 import json
 import csv
-import requests
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime
 from typing import Dict, List, Tuple
+from pathlib import Path
 import sys
 
+# 复用 generation 目录下的 PVGIS 客户端（共享响应缓存）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'generation'))
+import requests
+from pvgis_client import CircuitOpenError, PVGISClient, TimeBudgetExceeded, resolve_api_base_url
+from pvgis_stream import SeriescalcStream
+from hourly_store import HourlyColumnStore
+from artifact_io import artifact_path, compression_for, load_json, open_artifact
+
 class CompletePVGISSimulator:
     """
     完整的PVGIS集成模拟器
     可选择使用PVGIS API或理论值
     """
     
-    def __init__(self, use_pvgis_api=True):
+    def __init__(self, use_pvgis_api=True, client=None, api_base_url=None,
+                 generation_matrix_file=None, exceedance='p50', hourly_generation_file=None,
+                 yield_raster_file=None, allow_fallback=True, use_roof_capacity=False):
         self.use_pvgis_api = use_pvgis_api
+        # PVGIS 数据不可用时是否退回理论值；退回的原因记录在 fallback_reason 并写入导出结果
+        self.allow_fallback = allow_fallback
+        self.fallback_reason = None
+        # 多年 P50/P90 发电矩阵（pv_calculator_2023.py 的 multi_year 输出），优先于单年 seriescalc
+        self.generation_matrix_file = generation_matrix_file
+        self.exceedance = exceedance
+        # pv_calculator_2023.py 本地引擎输出的逐小时发电列存储（hourly_generation_2023*.pvcol）
+        self.hourly_generation_file = hourly_generation_file
+        # 为 True 时按逐小时发电文件中屋顶的实际装机容量模拟，不缩放到 system.size_kw
+        self.use_roof_capacity = use_roof_capacity
+        # 区域单位容量发电量栅格（yield_raster.py 生成），按坐标插值，不访问网络
+        self.yield_raster_file = yield_raster_file
+        self.client = client if client is not None else PVGISClient.from_config(None)
+        # 可指向本地 PVGIS 替身服务器，默认使用官方地址（或环境变量 PVGIS_API_BASE_URL）
+        self.api_base_url = resolve_api_base_url(api_base_url)
         
         # SA州Seaford Rise配置
         self.location = {
@@ -132,10 +157,19 @@ class CompletePVGISSimulator:
         print(f"地址: {self.location['address']}")
         print(f"坐标: {self.location['latitude']}, {self.location['longitude']}")
         
+        if self.generation_matrix_file:
+            return self._load_generation_matrix()
+        if self.hourly_generation_file:
+            return self._load_hourly_generation()
+        if self.yield_raster_file:
+            return self._load_yield_raster()
+        
         if not self.use_pvgis_api:
             print("⚠️  使用理论值模式（未启用PVGIS API）")
             return self._generate_theoretical_data()
         
+        url = f"{self.api_base_url}/seriescalc"
+        
         try:
             # PVGIS API参数
             params = {
@@ -153,32 +187,43 @@ class CompletePVGISSimulator:
             print(f"系统容量: {self.system['size_kw']} kW")
             print(f"系统损耗: {self.system['system_loss']}%")
             
-            # 获取小时数据
-            url = "https://re.jrc.ec.europa.eu/api/seriescalc"
-            response = requests.get(url, params=params, timeout=60)
-            response.raise_for_status()
-            
-            data = response.json()
+            # 获取小时数据（客户端负责重试、熔断）
+            # 流式解析：逐条记录直接累加到月×小时矩阵，不保留整个响应
+            with self.client.stream_bytes(url, params, timeout=60) as chunks:
+                stream = SeriescalcStream(chunks)
+                gen_data = self._process_pvgis_data(stream)
             
-            if 'outputs' in data and 'hourly' in data['outputs']:
-                hourly_data = data['outputs']['hourly']
-                print(f"✅ 成功获取 {len(hourly_data)} 条小时数据")
-                
-                # 处理数据
-                self.pvgis_data = self._process_pvgis_data(hourly_data)
+            if stream.count > 0:
+                print(f"✅ 成功获取 {stream.count} 条小时数据")
+                self.pvgis_data = gen_data
                 return self.pvgis_data
             else:
-                print("❌ PVGIS返回数据格式异常，使用理论值")
-                return self._generate_theoretical_data()
+                return self._fallback_to_theoretical("PVGIS返回数据格式异常（没有小时记录）")
                 
-        except Exception as e:
-            print(f"❌ PVGIS API请求失败: {e}")
-            print("使用理论值模式")
-            return self._generate_theoretical_data()
+        except CircuitOpenError as e:
+            return self._fallback_to_theoretical(f"PVGIS 不可用（熔断）: {e}")
+        except TimeBudgetExceeded as e:
+            return self._fallback_to_theoretical(f"PVGIS 时间预算已用完: {e}")
+        except requests.exceptions.RequestException as e:
+            return self._fallback_to_theoretical(f"PVGIS API请求失败（已重试 {self.client.retry_policy.max_retries} 次）: {e}")
+        except (ValueError, KeyError) as e:
+            return self._fallback_to_theoretical(f"PVGIS 数据解析失败: {e}")
+    
+    def _fallback_to_theoretical(self, reason):
+        """
+        PVGIS 数据不可用：记录原因后退回理论值；allow_fallback 为 False 时返回 None（模拟中止）
+        """
+        self.fallback_reason = reason
+        print(f"❌ {reason}")
+        if not self.allow_fallback:
+            print("未允许退回理论值，模拟中止")
+            return None
+        print("⚠️  退回理论值模式，结果中的 data_source 为 Theoretical，fallback_reason 记录了原因")
+        return self._generate_theoretical_data()
     
     def _process_pvgis_data(self, hourly_data):
         """
-        处理PVGIS小时数据，按月份和小时汇总
+        处理PVGIS小时数据（记录列表或流式解析的记录迭代器），按月份和小时汇总
         """
         print("\n处理PVGIS数据...")
         
@@ -223,6 +268,100 @@ class CompletePVGISSimulator:
             'source': 'PVGIS API'
         }
     
+    def _load_generation_matrix(self):
+        """
+        加载多年 P50/P90 发电矩阵（kWh/kWp，12个月×24小时），按本系统容量缩放
+        """
+        print(f"使用多年发电矩阵: {self.generation_matrix_file} ({self.exceedance.upper()})")
+        
+        matrix = load_json(self.generation_matrix_file)
+        
+        size_kw = self.system['size_kw']
+        monthly_hourly_gen = [
+            [Decimal(str(value)) * size_kw for value in month_hours]
+            for month_hours in matrix[f'{self.exceedance}_kwh_per_kwp']
+        ]
+        
+        monthly_totals = []
+        for month in range(12):
+            days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month]
+            monthly_totals.append(sum(monthly_hourly_gen[month]) * days)
+        annual_total = sum(monthly_totals)
+        
+        years = matrix['years']
+        print(f"✅ {len(years)} 年数据 ({years[0]}-{years[-1]})")
+        print(f"✅ 年发电量 ({self.exceedance.upper()}): {float(annual_total):.2f} kWh")
+        
+        self.pvgis_data = {
+            'monthly_hourly_generation': monthly_hourly_gen,
+            'monthly_totals': monthly_totals,
+            'annual_total': annual_total,
+            'source': f'PVGIS {years[0]}-{years[-1]} {self.exceedance.upper()}'
+        }
+        return self.pvgis_data
+    
+    def _load_hourly_generation(self):
+        """
+        从列存储（内存映射）读取逐小时发电功率，按本系统容量缩放后按月份和小时汇总
+        P_total(W) 为各坡面之和，多坡面屋顶的朝向组合按实际计算，不需要再请求 PVGIS
+        """
+        print(f"使用逐小时发电列存储: {self.hourly_generation_file}")
+        
+        with HourlyColumnStore(self.hourly_generation_file) as store:
+            roof_capacity = store.metadata['capacity_kwp']
+            if self.use_roof_capacity:
+                self.system['size_kw'] = Decimal(str(round(roof_capacity, 3)))
+                print(f"按屋顶实际装机容量模拟: {self.system['size_kw']} kWp")
+            else:
+                print(f"屋顶装机容量 {roof_capacity:.2f} kWp，按本系统容量 {self.system['size_kw']} kW 缩放")
+            scale = float(self.system['size_kw']) / roof_capacity
+            # 优先使用本地时间列
+            times = store.times('local_time' if 'local_time' in store else 'time')
+            power = store.column('P_total(W)')
+            records = ({'time': t, 'P': float(p) * scale} for t, p in zip(times, power))
+            gen_data = self._process_pvgis_data(records)
+            del power
+            source = store.metadata.get('source', '本地引擎')
+        
+        gen_data['source'] = f'PVGIS {source} 逐小时发电（各坡面合计）'
+        self.pvgis_data = gen_data
+        return self.pvgis_data
+    
+    def _load_yield_raster(self, tilt=23, aspect=0):
+        """
+        从区域栅格插值本地址的月×小时发电量（kWh/kWp），按本系统容量缩放；不在栅格范围内时使用理论值
+        朝向与 PVGIS 请求相同（倾角23°，正南）
+        """
+        from yield_raster import YieldRaster
+        
+        print(f"使用区域发电量栅格: {self.yield_raster_file}")
+        raster = YieldRaster(self.yield_raster_file)
+        profile = raster.profile_at(self.location['latitude'], self.location['longitude'], tilt, aspect)
+        if profile is None:
+            return self._fallback_to_theoretical("该地址不在栅格范围内或附近格点无数据")
+        
+        size_kw = self.system['size_kw']
+        monthly_hourly_gen = [
+            [Decimal(str(round(float(value), 6))) * size_kw for value in month_hours]
+            for month_hours in profile
+        ]
+        
+        monthly_totals = []
+        for month in range(12):
+            days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month]
+            monthly_totals.append(sum(monthly_hourly_gen[month]) * days)
+        annual_total = sum(monthly_totals)
+        
+        print(f"✅ 年发电量: {float(annual_total):.2f} kWh")
+        
+        self.pvgis_data = {
+            'monthly_hourly_generation': monthly_hourly_gen,
+            'monthly_totals': monthly_totals,
+            'annual_total': annual_total,
+            'source': f"PVGIS {raster.metadata['year']} 区域栅格"
+        }
+        return self.pvgis_data
+    
     def _generate_theoretical_data(self):
         """
         生成理论发电数据（当PVGIS不可用时）
@@ -475,6 +614,8 @@ class CompletePVGISSimulator:
             return None
         
         print(f"\n数据来源: {gen_data['source']}")
+        if self.fallback_reason:
+            print(f"⚠️  退回理论值的原因: {self.fallback_reason}")
         print(f"年发电量: {float(gen_data['annual_total']):.2f} kWh")
         
         # 步骤2: 逐月计算240个月
@@ -533,9 +674,10 @@ class CompletePVGISSimulator:
         print("\n✅ 240个月计算完成!")
         return results
     
-    def export_results(self, results):
+    def export_results(self, results, compression=None):
         """
         导出结果到JSON和CSV
+        compression: JSON 的压缩方式（none/auto/gzip/lzma，见 artifact_io），CSV 供表格软件打开，不压缩
         """
         if not results:
             print("❌ 无结果可导出")
@@ -555,6 +697,7 @@ class CompletePVGISSimulator:
                 'finance': {k: float(v) if isinstance(v, Decimal) else v 
                            for k, v in self.finance.items()},
                 'data_source': results[0]['generation'].get('source', 'Unknown'),
+                'fallback_reason': self.fallback_reason,
                 'generated_at': datetime.now().isoformat(),
                 'total_months': len(results)
             },
@@ -570,8 +713,8 @@ class CompletePVGISSimulator:
             'monthly_results': results
         }
         
-        json_file = '完整PVGIS模拟数据_240个月.json'
-        with open(json_file, 'w', encoding='utf-8') as f:
+        json_file = artifact_path('完整PVGIS模拟数据_240个月.json', compression_for('simulation_json', compression))
+        with open_artifact(json_file, 'w') as f:
             json.dump(output, f, ensure_ascii=False, indent=2)
         
         print(f"\n✅ JSON数据已导出: {json_file}")
@@ -621,6 +764,8 @@ class CompletePVGISSimulator:
         print("模拟总结")
         print("="*60)
         print(f"数据来源: {output['metadata']['data_source']}")
+        if self.fallback_reason:
+            print(f"⚠️  退回理论值的原因: {self.fallback_reason}")
         print(f"\n配置参数:")
         print(f"  - 电价通胀膨胀率: {output['metadata']['tariff']['price_indexation']*100:.1f}%/年")
         print(f"  - 贴现率: {output['metadata']['finance']['discount_rate']*100:.1f}%/年")
@@ -660,13 +805,40 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='完整PVGIS集成模拟器')
     parser.add_argument('--no-pvgis', action='store_true', 
                        help='不使用PVGIS API，使用理论值')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='不使用PVGIS响应缓存，强制重新请求')
+    parser.add_argument('--api-base-url', default=None,
+                       help='PVGIS API根地址，可指向本地替身服务器（如 http://127.0.0.1:8080/api）')
+    parser.add_argument('--generation-matrix', default=None,
+                       help='多年P50/P90发电矩阵文件（generation_matrix_p50_p90*.json，可为 .json.xz/.json.gz），代替单年PVGIS数据')
+    parser.add_argument('--hourly-generation', default=None,
+                       help='逐小时发电列存储文件（hourly_generation_2023*.pvcol），代替单年PVGIS请求')
+    parser.add_argument('--yield-raster', default=None,
+                       help='区域发电量栅格（yield_raster.py build 生成），按坐标插值，不访问网络')
+    parser.add_argument('--exceedance', choices=['p50', 'p90'], default='p50',
+                       help='使用发电矩阵的P50或P90（默认P50）')
+    parser.add_argument('--roof-capacity', action='store_true',
+                       help='配合 --hourly-generation：按屋顶实际装机容量模拟，不缩放到6.6kW')
+    parser.add_argument('--no-fallback', action='store_true',
+                       help='PVGIS数据不可用时中止，而不是退回理论值')
+    parser.add_argument('--compress', nargs='?', const='auto', default=None,
+                       choices=['none', 'auto', 'gzip', 'lzma'],
+                       help='压缩导出的JSON（不带参数时为 auto，即 lzma）')
     args = parser.parse_args()
     
     use_api = not args.no_pvgis
+    client = PVGISClient.from_config({'cache': {'enabled': not args.no_cache}})
     
-    simulator = CompletePVGISSimulator(use_pvgis_api=use_api)
+    simulator = CompletePVGISSimulator(use_pvgis_api=use_api, client=client,
+                                       api_base_url=args.api_base_url,
+                                       generation_matrix_file=args.generation_matrix,
+                                       exceedance=args.exceedance,
+                                       hourly_generation_file=args.hourly_generation,
+                                       yield_raster_file=args.yield_raster,
+                                       allow_fallback=not args.no_fallback,
+                                       use_roof_capacity=args.roof_capacity)
     results = simulator.run_complete_simulation()
     
     if results:
-        simulator.export_results(results)
+        simulator.export_results(results, compression=args.compress)
         print("\n✨ 模拟完成!")
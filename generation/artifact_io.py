@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+输出产物的压缩读写（gzip / lzma，仅用标准库）
+写出时按产物类型选择压缩方式，文件名加 .gz / .xz 后缀；读取时按后缀或文件头自动解压，
+并且在给出未压缩文件名而磁盘上只有压缩版本时自动找到它，调用方不需要关心文件是否压缩。
+读写都是流式的（gzip/lzma 文件对象），不会把整个文件读入内存。
+
+    from artifact_io import artifact_path, compression_for, load_json, open_artifact
+
+    path = artifact_path("results_2023.json", compression_for("results", "auto"))   # results_2023.json.xz
+    with open_artifact(path, 'w') as f:
+        json.dump(data, f)
+    load_json("results_2023.json")     # 找到 results_2023.json.xz 并解压读取
+
+以 'w' / 'wb' 打开时先写入同目录下的临时文件，关闭时用 os.replace 替换目标文件，
+不会原地截断已有文件（产物存储中的对象与输出文件是硬链接，原地重写会破坏已记录的对象）。
+
+列存储（.pvcol）需要内存映射，不压缩。
+"""
+
+import gzip
+import json
+import lzma
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "lzma": ".xz"}
+_SUFFIX_COMPRESSION = {suffix: name for name, suffix in COMPRESSION_SUFFIXES.items()}
+_MAGIC = {b"\x1f\x8b": "gzip", b"\xfd7zXZ\x00": "lzma"}
+
+# 启用压缩（"auto"）时各类产物的压缩方式：
+# 逐批流式写出的小时数据用 gzip（压缩快，不拖慢下载）；一次写出、反复读取的 JSON 用 lzma（压缩率高）
+DEFAULT_COMPRESSION = {
+    "hourly_radiation_csv": "gzip",
+    "hourly_radiation_json": "gzip",
+    "hourly_generation_csv": "gzip",
+    "generation_matrix": "lzma",
+    "results": "lzma",
+    "simulation_json": "lzma",
+}
+GZIP_LEVEL = 6
+
+PathLike = Union[str, Path]
+
+
+def compression_for(artifact_type: str, setting=None) -> Optional[str]:
+    """按配置决定某类产物的压缩方式，返回 "gzip"、"lzma" 或 None（不压缩）
+
+    setting: None / False / "none" 不压缩；True / "auto" 使用 DEFAULT_COMPRESSION；
+    "gzip" / "lzma" 所有产物使用同一种方式；字典按产物类型指定，未列出的类型使用默认表。
+    """
+    if isinstance(setting, dict):
+        setting = setting.get(artifact_type, "auto")
+    if setting in (None, False, "none"):
+        return None
+    if setting in (True, "auto"):
+        return DEFAULT_COMPRESSION.get(artifact_type)
+    if setting not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"未知的压缩方式: {setting}（可选 none、auto、gzip、lzma）")
+    return setting
+
+
+def artifact_path(path: PathLike, compression: Optional[str]) -> str:
+    """为文件名加上压缩后缀（compression 为 None 时原样返回）"""
+    return f"{path}{COMPRESSION_SUFFIXES[compression]}" if compression else str(path)
+
+
+def path_compression(path: PathLike) -> Optional[str]:
+    """按后缀判断文件的压缩方式"""
+    return _SUFFIX_COMPRESSION.get(Path(path).suffix)
+
+
+def artifact_suffix(path: PathLike) -> str:
+    """文件的完整后缀，压缩文件包含内层后缀（如 .csv.gz）"""
+    path = Path(path)
+    if path_compression(path) and len(path.suffixes) >= 2:
+        return "".join(path.suffixes[-2:])
+    return path.suffix
+
+
+def _variants(path: str):
+    """文件的未压缩版本和各压缩版本（results.json、results.json.gz、results.json.xz）"""
+    base = path[:-len(COMPRESSION_SUFFIXES[path_compression(path)])] if path_compression(path) else path
+    return [base] + [base + suffix for suffix in COMPRESSION_SUFFIXES.values()]
+
+
+def resolve_artifact(path: PathLike) -> Optional[str]:
+    """返回磁盘上实际存在的文件：原文件名，或其 .gz / .xz 压缩版本；都不存在时返回 None
+
+    给出未压缩文件名且同时存在多个版本时，返回最近修改的那个（切换压缩设置后旧版本可能还在）。
+    """
+    path = str(path)
+    if path_compression(path) is not None:
+        return path if os.path.exists(path) else None
+    newest = None
+    for candidate in _variants(path):
+        try:
+            mtime = os.stat(candidate).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        if newest is None or mtime > newest[0]:
+            newest = (mtime, candidate)
+    return newest[1] if newest else None
+
+
+def _remove_other_variants(path: str):
+    """写出一个版本后删除同名的其他压缩版本，避免读取时拿到旧数据"""
+    for candidate in _variants(path):
+        if candidate != path:
+            try:
+                os.unlink(candidate)
+            except FileNotFoundError:
+                pass
+
+
+def _sniff_compression(path: str) -> Optional[str]:
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, name in _MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+class _ReplaceOnClose:
+    """写入临时文件的文件对象：正常关闭时替换目标文件，with 块中出错时删除临时文件"""
+
+    def __init__(self, file, tmp_path: str, path: str):
+        self._file = file
+        self._tmp_path = tmp_path
+        self._path = path
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        os.replace(self._tmp_path, self._path)
+        _remove_other_variants(self._path)
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def _open(path: str, mode: str, compression: Optional[str], text_args: dict):
+    if compression is None:
+        return open(path, mode, **text_args)
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL, **text_args)
+    return lzma.open(path, mode, **text_args)
+
+
+def open_artifact(path: PathLike, mode: str = 'r', encoding: Optional[str] = 'utf-8',
+                  newline: Optional[str] = None):
+    """打开产物文件，压缩方式由后缀决定（读取时没有压缩后缀也会检查文件头）
+
+    mode 与 open() 相同（'r'、'w'、'a'、'rb'、'wb' 等）；文本模式下 encoding/newline 与 open() 相同。
+    读取时若文件不存在，会尝试同名的 .gz / .xz 文件。
+    以 'w' 打开时写入临时文件，关闭后才替换目标文件，并删除同名的其他压缩版本。
+    """
+    path = str(path)
+    reading = not any(flag in mode for flag in "wax")
+    if reading:
+        path = resolve_artifact(path) or path
+    compression = path_compression(path)
+    if compression is None and reading and os.path.exists(path):
+        compression = _sniff_compression(path)
+
+    binary = 'b' in mode
+    text_args = {} if binary else {"encoding": encoding, "newline": newline}
+    if compression is not None and not binary:
+        mode = mode.replace('t', '') + 't'
+    if 'w' not in mode or '+' in mode:
+        return _open(path, mode, compression, text_args)
+
+    name = os.path.basename(path)
+    tmp_path = os.path.join(os.path.dirname(path), f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    return _ReplaceOnClose(_open(tmp_path, mode, compression, text_args), tmp_path, path)
+
+
+def load_json(path: PathLike):
+    """读取 JSON 产物（自动解压）"""
+    with open_artifact(path, 'r') as f:
+        return json.load(f)
+
+
+def dump_json(data, path: PathLike, compression: Optional[str] = None, **kwargs) -> str:
+    """写出 JSON 产物，返回实际文件名（带压缩后缀）；kwargs 传给 json.dump"""
+    path = artifact_path(path, compression)
+    kwargs.setdefault("ensure_ascii", False)
+    with open_artifact(path, 'w') as f:
+        json.dump(data, f, **kwargs)
+    return path
+
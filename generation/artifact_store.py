@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+按内容寻址的输出产物存储和运行清单
+每次运行写出的文件按 sha256 存入 <输出目录>/objects/，原来带时间戳的文件替换为指向对象的硬链接，
+内容相同的输出（重复运行、批量运行）在磁盘上只保存一份。
+输出文件须整体替换（open_artifact / write_hourly_columns 先写临时文件再 os.replace），
+原地重写会同时改动硬链接的对象。
+
+每个地点目录下:
+    manifest.jsonl   每次运行一行: 运行ID、时间、各产物的路径/对象/哈希/大小、汇总指标
+    latest.json      最近一次运行的记录，查询"该地点最新结果"时直接读取，不扫描目录
+
+查询:
+    from artifact_store import latest_run, load_latest_results
+    latest_run("output", -41.1677, 146.3473)["artifacts"]["results"]["object"]
+    load_latest_results("output", -41.1677, 146.3473)["total_annual_energy"]
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from artifact_io import artifact_suffix, load_json
+
+OBJECTS_DIR = "objects"
+MANIFEST_FILE = "manifest.jsonl"
+LATEST_FILE = "latest.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+_manifest_lock = threading.Lock()
+
+
+def location_dir_name(lat: float, lon: float) -> str:
+    """按经纬度命名的地点目录，如 lat_41.1677S_lon_146.3473E"""
+    lat_str = f"{abs(lat):.4f}{'N' if lat >= 0 else 'S'}"
+    lon_str = f"{abs(lon):.4f}{'E' if lon >= 0 else 'W'}"
+    return f"lat_{lat_str}_lon_{lon_str}"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """<输出目录>/objects/ 下按内容哈希保存的对象"""
+
+    def __init__(self, base_output_dir: str):
+        self.base_dir = Path(base_output_dir)
+        self.objects_dir = self.base_dir / OBJECTS_DIR
+        self.stats = {"stored": 0, "new": 0, "deduplicated": 0, "bytes_saved": 0}
+
+    def object_path(self, digest: str, suffix: str = "") -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}{suffix}"
+
+    def store(self, path: str) -> Dict:
+        """把文件存入对象库，返回 {"path", "object", "sha256", "bytes"}
+
+        对象不存在时为该文件建立硬链接（不复制数据）；对象已存在且内容相同时，
+        把该文件替换为指向对象的硬链接，释放重复的数据。文件系统不支持硬链接时只记录哈希。
+        """
+        path = Path(path)
+        digest = file_sha256(str(path))
+        size = path.stat().st_size
+        target = self.object_path(digest, artifact_suffix(path))
+        record = {"path": str(path), "object": str(target), "sha256": digest, "bytes": size}
+        self.stats["stored"] += 1
+
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            created = False
+            if not target.exists():
+                try:
+                    os.link(path, target)
+                    created = True
+                    self.stats["new"] += 1
+                except FileExistsError:
+                    # 另一个线程/进程刚存入了相同内容
+                    pass
+            if not created and not os.path.samefile(path, target):
+                tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.link")
+                os.link(target, tmp_path)
+                os.replace(tmp_path, path)
+                self.stats["deduplicated"] += 1
+                self.stats["bytes_saved"] += size
+        except OSError as e:
+            print(f"警告: 无法为 {path} 建立硬链接，保留原文件: {e}")
+            record["object"] = None
+        return record
+
+
+class RunManifest:
+    """单个地点目录下的运行清单"""
+
+    def __init__(self, location_dir: str):
+        self.location_dir = Path(location_dir)
+        self.manifest_path = self.location_dir / MANIFEST_FILE
+        self.latest_path = self.location_dir / LATEST_FILE
+
+    def record(self, run_id: str, artifacts: Dict[str, Dict], summary: Optional[Dict] = None) -> Dict:
+        """追加一次运行的记录，并更新 latest.json"""
+        entry = {
+            "run_id": run_id,
+            "created_at": datetime.now().isoformat(),
+            "artifacts": artifacts,
+            "summary": summary or {},
+        }
+        self.location_dir.mkdir(parents=True, exist_ok=True)
+        # 同一地点的多个设计方案可能在批量模式中并发记录
+        with _manifest_lock:
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+            tmp_path = self.latest_path.with_name(f"{LATEST_FILE}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.latest_path)
+        return entry
+
+    def latest(self) -> Optional[Dict]:
+        if not self.latest_path.exists():
+            return None
+        with open(self.latest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def runs(self):
+        """按时间顺序逐条返回全部运行记录"""
+        if not self.manifest_path.exists():
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def latest_run(base_output_dir: str, lat: float, lon: float) -> Optional[Dict]:
+    """该地点最近一次运行的清单记录，没有则返回 None"""
+    return RunManifest(os.path.join(base_output_dir, location_dir_name(lat, lon))).latest()
+
+
+def artifact_file(artifact: Dict) -> Optional[str]:
+    """产物的可读路径：优先使用对象（原文件被删除后仍可读取）"""
+    for candidate in (artifact.get("object"), artifact.get("path")):
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def load_latest_results(base_output_dir: str, lat: float, lon: float) -> Optional[Dict]:
+    """该地点最新的 results_2023 JSON 内容"""
+    run = latest_run(base_output_dir, lat, lon)
+    if run is None or "results" not in run["artifacts"]:
+        return None
+    path = artifact_file(run["artifacts"]["results"])
+    if path is None:
+        return None
+    return load_json(path)
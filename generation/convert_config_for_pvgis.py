@@ -1,9 +1,32 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+"""
+Convert bearing-based configs (azimuth 0°=North, clockwise) to PVGIS aspect (0°=South).
 
+Usage:
+    python3 convert_config_for_pvgis.py [input.json] [output.json]
+    python3 convert_config_for_pvgis.py crm_export.jsonl converted.jsonl --workers 8
+    python3 convert_config_for_pvgis.py configs/ converted.jsonl --rejects rejects.jsonl
+    python3 convert_config_for_pvgis.py crm_export.jsonl.gz converted.jsonl   # gzip/xz input is read transparently
+
+A directory of *.json files or a JSONL file (one config per line) is converted in batch mode:
+records are streamed through a process pool and written, in input order, as one JSONL file
+that pv_batch_2023.py can read directly. Records that fail to parse or validate go to the
+reject file (default: <output>.rejects.jsonl) with their errors.
+"""
+
+import argparse
 import json
+import math
 import sys
+import threading
+from multiprocessing import Pool
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from artifact_io import artifact_suffix, open_artifact
+
+CONVERTED_FLAG = 'azimuth converted to PVGIS aspect (0°=South)'
 
 
 def normalize_to_180(x: float) -> float:
@@ -20,10 +43,72 @@ def looks_swapped_latlon(lat: float, lon: float) -> bool:
     return abs(lat) > 90 and abs(lon) <= 90
 
 
-def convert_config(input_path: Path, output_path: Path) -> None:
-    with input_path.open('r', encoding='utf-8') as f:
-        cfg = json.load(f)
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def validate_config(cfg: Dict) -> List[str]:
+    """Check a bearing-based config before conversion; returns a list of errors (empty if valid).
+
+    Follows pv_calculator_2023.py: system_loss, panel_spec.power_watts/annual_degradation and each
+    surface's panel_count and azimuth are required; a missing or null tilt_angle defaults to 23°.
+    """
+    errors = []
+    if not isinstance(cfg, dict):
+        return ['config is not a JSON object']
 
+    location = cfg.get('location')
+    if not isinstance(location, dict):
+        errors.append('missing location')
+    else:
+        lat, lon = location.get('latitude'), location.get('longitude')
+        if not _is_number(lat) or not _is_number(lon):
+            errors.append(f'latitude/longitude must be numbers: {lat!r}, {lon!r}')
+        else:
+            if looks_swapped_latlon(lat, lon):
+                lat, lon = lon, lat
+            if not -90 <= lat <= 90:
+                errors.append(f'latitude out of range [-90, 90]: {lat}')
+            if not -180 <= lon <= 180:
+                errors.append(f'longitude out of range [-180, 180]: {lon}')
+        if CONVERTED_FLAG in str(location.get('description', '')):
+            errors.append('config has already been converted')
+
+    if not (_is_number(cfg.get('system_loss')) and 0 <= cfg['system_loss'] <= 100):
+        errors.append(f"system_loss must be a number in [0, 100]: {cfg.get('system_loss')!r}")
+
+    panel_spec = cfg.get('panel_spec')
+    if not isinstance(panel_spec, dict):
+        errors.append('missing panel_spec')
+    else:
+        if not (_is_number(panel_spec.get('power_watts')) and panel_spec['power_watts'] > 0):
+            errors.append(f"panel_spec.power_watts must be a positive number: {panel_spec.get('power_watts')!r}")
+        if not _is_number(panel_spec.get('annual_degradation')):
+            errors.append(f"panel_spec.annual_degradation must be a number: {panel_spec.get('annual_degradation')!r}")
+
+    surfaces = cfg.get('roof_surfaces')
+    if not isinstance(surfaces, list) or not surfaces:
+        errors.append('roof_surfaces must be a non-empty list')
+        return errors
+    for i, s in enumerate(surfaces):
+        name = s.get('name', f'#{i + 1}') if isinstance(s, dict) else f'#{i + 1}'
+        if not isinstance(s, dict):
+            errors.append(f'surface {name}: not a JSON object')
+            continue
+        bearing = s.get('azimuth')
+        if not _is_number(bearing) or not -360 <= bearing <= 360:
+            errors.append(f'surface {name}: azimuth (bearing) must be a number in [-360, 360]: {bearing!r}')
+        tilt = s.get('tilt_angle')
+        if tilt is not None and (not _is_number(tilt) or not 0 <= tilt <= 90):
+            errors.append(f'surface {name}: tilt_angle out of range [0, 90]: {tilt!r}')
+        panels = s.get('panel_count')
+        if not isinstance(panels, int) or isinstance(panels, bool) or panels <= 0:
+            errors.append(f'surface {name}: panel_count must be a positive integer: {panels!r}')
+    return errors
+
+
+def convert_record(cfg: Dict) -> Dict:
+    """Convert one config in place (lat/lon fix + bearing -> aspect) and return it."""
     # Fix location if obviously swapped
     lat = cfg['location']['latitude']
     lon = cfg['location']['longitude']
@@ -50,11 +135,21 @@ def convert_config(input_path: Path, output_path: Path) -> None:
     flags = []
     if swapped:
         flags.append('lat/lon corrected')
-    flags.append('azimuth converted to PVGIS aspect (0°=South)')
+    flags.append(CONVERTED_FLAG)
     if loc_desc:
         cfg['location']['description'] = f"{loc_desc} | {'; '.join(flags)}"
     else:
         cfg['location']['description'] = '; '.join(flags)
+    return cfg
+
+
+def convert_config(input_path: Path, output_path: Path) -> None:
+    with input_path.open('r', encoding='utf-8') as f:
+        cfg = json.load(f)
+
+    for error in validate_config(cfg):
+        print(f"Warning: {error}")
+    convert_record(cfg)
 
     with output_path.open('w', encoding='utf-8') as f:
         json.dump(cfg, f, ensure_ascii=False, indent=2)
@@ -62,27 +157,114 @@ def convert_config(input_path: Path, output_path: Path) -> None:
     print(f"Converted config written to: {output_path}")
 
 
+# ---------------------------------------------------------------- batch mode
+
+def iter_source_records(source: Path) -> Iterator[Tuple[str, str]]:
+    """Yield (record_id, raw JSON text) from a directory of *.json files or a JSONL file."""
+    if source.is_dir():
+        for path in sorted(source.glob('*.json')):
+            yield path.stem, path.read_text(encoding='utf-8')
+        return
+    with open_artifact(source, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                yield f'line_{line_number}', line
+
+
+def process_record(item: Tuple[str, str]) -> Tuple[str, Optional[str], Optional[Dict]]:
+    """Worker: parse, validate and convert one record.
+
+    Returns (record_id, converted JSONL line, None) or (record_id, None, reject entry).
+    """
+    record_id, text = item
+    try:
+        cfg = json.loads(text)
+    except ValueError as e:
+        return record_id, None, {'record_id': record_id, 'errors': [f'invalid JSON: {e}'], 'input': text.strip()}
+
+    # Keep the record identity so pv_batch_2023.py names the site after the source record
+    if isinstance(cfg, dict):
+        record_id = str(cfg.get('site_id') or record_id)
+    errors = validate_config(cfg)
+    if errors:
+        return record_id, None, {'record_id': record_id, 'errors': errors, 'input': cfg}
+
+    cfg.setdefault('site_id', record_id)
+    convert_record(cfg)
+    return record_id, json.dumps(cfg, ensure_ascii=False), None
+
+
+def _bounded(items: Iterator, slots: threading.BoundedSemaphore) -> Iterator:
+    """Hold back the pool's task feeder so only a bounded number of records are in flight."""
+    for item in items:
+        slots.acquire()
+        yield item
+
+
+def convert_batch(source: Path, output_path: Path, reject_path: Path,
+                  workers: int = 4, chunksize: int = 64) -> Dict[str, int]:
+    """Stream records through a worker pool; converted records and rejects are written in one pass.
+
+    Output order follows input order. Memory stays bounded by the in-flight window
+    (workers × chunksize × 4 records) regardless of input size.
+    """
+    stats = {'records': 0, 'converted': 0, 'rejected': 0}
+    records = iter_source_records(source)
+
+    with output_path.open('w', encoding='utf-8') as out, reject_path.open('w', encoding='utf-8') as rejects:
+        def write(result):
+            _, line, reject = result
+            stats['records'] += 1
+            if reject is None:
+                out.write(line + '\n')
+                stats['converted'] += 1
+            else:
+                rejects.write(json.dumps(reject, ensure_ascii=False) + '\n')
+                stats['rejected'] += 1
+
+        if workers <= 1:
+            for item in records:
+                write(process_record(item))
+        else:
+            slots = threading.BoundedSemaphore(workers * chunksize * 4)
+            with Pool(workers) as pool:
+                for result in pool.imap(process_record, _bounded(records, slots), chunksize):
+                    slots.release()
+                    write(result)
+    return stats
+
+
 def main():
     # Default paths
     default_input = Path(__file__).with_name('config_australia.json')
     default_output = Path(__file__).with_name('config_pvgis_converted.json')
 
-    args = sys.argv[1:]
-    if len(args) == 0:
-        input_path = default_input
-        output_path = default_output
-    elif len(args) == 1:
-        input_path = Path(args[0])
-        output_path = default_output
-    else:
-        input_path = Path(args[0])
-        output_path = Path(args[1])
+    parser = argparse.ArgumentParser(description='Convert bearing-based configs to PVGIS aspect')
+    parser.add_argument('input', nargs='?', type=Path, default=default_input,
+                        help='config JSON, a directory of *.json configs, or a JSONL file')
+    parser.add_argument('output', nargs='?', type=Path,
+                        help='output JSON (single config) or JSONL (batch mode)')
+    parser.add_argument('--rejects', type=Path, help='batch mode reject file (default: <output>.rejects.jsonl)')
+    parser.add_argument('--workers', type=int, default=4, help='batch mode worker processes (default: 4)')
+    parser.add_argument('--chunksize', type=int, default=64, help='records per worker task (default: 64)')
+    args = parser.parse_args()
 
+    input_path = args.input
     if not input_path.exists():
         print(f"Error: input config not found: {input_path}")
         sys.exit(1)
 
-    convert_config(input_path, output_path)
+    if not (input_path.is_dir() or artifact_suffix(input_path).startswith('.jsonl')):
+        convert_config(input_path, args.output or default_output)
+        return
+
+    base_name = input_path.name[:len(input_path.name) - len(artifact_suffix(input_path))]
+    output_path = args.output or input_path.with_name(f"{base_name}_pvgis.jsonl")
+    reject_path = args.rejects or output_path.with_suffix('.rejects.jsonl')
+    stats = convert_batch(input_path, output_path, reject_path, max(1, args.workers), max(1, args.chunksize))
+    print(f"Converted {stats['converted']}/{stats['records']} records to: {output_path}")
+    if stats['rejected']:
+        print(f"Rejected {stats['rejected']} records, see: {reject_path}")
 
 
 if __name__ == '__main__':
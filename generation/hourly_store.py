@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+小时数据列存储（.pvcol）
+每个字段保存为一段定长类型数组，文件头是一小段 JSON 元数据，
+读取时内存映射整个文件，各列直接返回零拷贝视图（有 numpy 时为 ndarray，否则为 memoryview）。
+
+文件布局（小端）:
+    8 字节   魔数 b"PVCOL\\x01\\n\\x00"
+    8 字节   头部长度 (uint64)
+    头部     JSON: {"version", "n_rows", "columns": [{"name", "dtype", "offset", "nbytes"}], "metadata"}
+    数据     各列依次存放，起始位置按 8 字节对齐；offset 相对于数据区起点
+
+时间列（PVGIS 的 YYYYMMDD:HHMM 字符串）保存为自 1970-01-01 起的分钟数 (int64)，
+数值列默认保存为 float32（PVGIS 数据只有两位小数，精度足够）。
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+    NUMPY_SUPPORT = True
+except ImportError:
+    NUMPY_SUPPORT = False
+
+
+MAGIC = b"PVCOL\x01\n\x00"
+ALIGNMENT = 8
+FILE_SUFFIX = ".pvcol"
+
+# 按 PVGIS 时间字符串存储、读取时可还原的列
+TIME_COLUMNS = ("time", "local_time")
+TIME_DTYPE = "<i8"
+DEFAULT_VALUE_DTYPE = "<f4"
+
+# dtype → array/memoryview 的类型码
+_TYPECODES = {"<f4": "f", "<f8": "d", "<i8": "q", "<i4": "i"}
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _days_from_civil(year: int, month: int, day: int) -> int:
+    """公历日期 → 自 1970-01-01 起的天数（不依赖 datetime，便于批量计算）"""
+    year -= month <= 2
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def pvgis_time_to_minutes(times: Sequence[str]) -> array:
+    """PVGIS 时间字符串 → 自 1970-01-01 起的分钟数"""
+    minutes = array("q")
+    for t in times:
+        days = _days_from_civil(int(t[0:4]), int(t[4:6]), int(t[6:8]))
+        minutes.append(days * 1440 + int(t[9:11]) * 60 + int(t[11:13]))
+    return minutes
+
+
+def minutes_to_pvgis_time(minutes) -> List[str]:
+    """分钟数 → PVGIS 时间字符串列表"""
+    if NUMPY_SUPPORT and isinstance(minutes, np.ndarray):
+        chars = np.datetime_as_string(minutes.astype("datetime64[m]"), unit="m").astype("U16").view("U1").reshape(-1, 16)
+        chars = chars[:, [0, 1, 2, 3, 5, 6, 8, 9, 10, 11, 12, 14, 15]]
+        chars[:, 8] = ":"
+        return np.ascontiguousarray(chars).view("U13").ravel().tolist()
+    return [(_EPOCH + timedelta(minutes=m)).strftime("%Y%m%d:%H%M") for m in minutes]
+
+
+def write_hourly_columns(path: str, columns: Dict[str, Sequence], metadata: Optional[Dict] = None,
+                         value_dtype: str = DEFAULT_VALUE_DTYPE) -> str:
+    """写出列存储文件（原子替换）
+
+    columns: 字段名 → 序列；TIME_COLUMNS 中的字段为 PVGIS 时间字符串，其余为数值。
+    所有列的长度必须相同。
+    """
+    n_rows = None
+    encoded = []
+    for name, values in columns.items():
+        if n_rows is None:
+            n_rows = len(values)
+        elif len(values) != n_rows:
+            raise ValueError(f"列 {name} 的长度 {len(values)} 与其他列 {n_rows} 不一致")
+
+        if name in TIME_COLUMNS:
+            dtype = TIME_DTYPE
+            data = pvgis_time_to_minutes(values).tobytes()
+        else:
+            dtype = value_dtype
+            if NUMPY_SUPPORT and isinstance(values, np.ndarray):
+                data = values.astype(dtype).tobytes()
+            else:
+                data = array(_TYPECODES[dtype], values).tobytes()
+        encoded.append((name, dtype, data))
+
+    descriptors = []
+    offset = 0
+    for name, dtype, data in encoded:
+        descriptors.append({"name": name, "dtype": dtype, "offset": offset, "nbytes": len(data)})
+        offset += len(data) + (-len(data) % ALIGNMENT)
+
+    header = json.dumps({
+        "version": 1,
+        "n_rows": n_rows or 0,
+        "columns": descriptors,
+        "metadata": metadata or {},
+    }, ensure_ascii=False).encode("utf-8")
+    header += b" " * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for _, _, data in encoded:
+            f.write(data)
+            f.write(b"\0" * (-len(data) % ALIGNMENT))
+    os.replace(tmp_path, path)
+    return str(path)
+
+
+class HourlyColumnStore:
+    """内存映射的列存储读取器
+
+    store = HourlyColumnStore("hourly_radiation_2023.pvcol")
+    store.column("G(i)")   # 零拷贝视图
+    store.times()          # PVGIS 时间字符串列表
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        if bytes(self._buffer[:len(MAGIC)]) != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} 不是列存储文件")
+        (header_len,) = struct.unpack_from("<Q", self._buffer, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(bytes(self._buffer[header_start:header_start + header_len]))
+
+        self.n_rows = header["n_rows"]
+        self.metadata = header["metadata"]
+        self._data_start = header_start + header_len
+        self._columns = {c["name"]: c for c in header["columns"]}
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._columns)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def column(self, name: str):
+        """返回列的零拷贝视图；时间列以 datetime64[m]（无 numpy 时为分钟数）表示"""
+        descriptor = self._columns[name]
+        start = self._data_start + descriptor["offset"]
+        if NUMPY_SUPPORT:
+            values = np.frombuffer(self._buffer, dtype=descriptor["dtype"], count=self.n_rows, offset=start)
+            return values.view("datetime64[m]") if name in TIME_COLUMNS else values
+        return self._buffer[start:start + descriptor["nbytes"]].cast(_TYPECODES[descriptor["dtype"]])
+
+    def times(self, name: str = "time") -> List[str]:
+        """把时间列还原为 PVGIS 时间字符串"""
+        values = self.column(name)
+        if NUMPY_SUPPORT:
+            return minutes_to_pvgis_time(values.view("<i8"))
+        return minutes_to_pvgis_time(values)
+
+    def columns(self, names: Optional[Sequence[str]] = None) -> Dict:
+        """多列视图；time/local_time 还原为字符串列表（与 LocalPVEngine 的输入格式一致）"""
+        names = names or self.names
+        return {
+            name: self.times(name) if name in TIME_COLUMNS else self.column(name)
+            for name in names if name in self._columns
+        }
+
+    def close(self):
+        """释放内存映射；仍有列视图被引用时无法关闭，留给垃圾回收"""
+        try:
+            self._buffer.release()
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def __enter__(self) -> "HourlyColumnStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+多站点批量计算 - 2023年数据版本
+输入为站点配置目录（*.json）或 JSONL 文件（每行一个站点配置），
+所有站点共享一个 PVGIS 客户端（连接池、响应缓存、限流器），并以有限并发运行。
+
+用法:
+    python3 pv_batch_2023.py sites/ --workers 4
+    python3 pv_batch_2023.py sites.jsonl --workers 8 --output-dir output
+    python3 pv_batch_2023.py sites.jsonl --time-budget 1800   # 整个批次最多等待 PVGIS 30 分钟
+
+PVGIS 不可用时客户端熔断，剩余站点快速失败并记入失败报告，而不是逐个等待超时。
+
+输出:
+    - 各站点结果照常写入 <输出目录>/lat_*_lon_*/
+    - <输出目录>/batch_summary_<时间戳>.csv  汇总表（年发电量、单位容量发电量、容量因子）
+    - <输出目录>/batch_failures_<时间戳>.json  失败站点报告
+    - <输出目录>/batch_metrics_<时间戳>.json   各站点运行指标汇总（阶段耗时、HTTP、瓶颈分布）
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from artifact_io import open_artifact
+from pv_calculator_2023 import PVGISCalculator2023
+from pvgis_client import PVGISClient
+from run_metrics import aggregate_metrics
+
+
+SUMMARY_FIELDS = [
+    "site_id", "description", "latitude", "longitude", "surfaces",
+    "capacity_kwp", "annual_energy_kwh", "specific_yield_kwh_per_kwp",
+    "capacity_factor_percent", "status", "run_seconds", "bound", "output_directory"
+]
+
+
+def load_site_configs(source: str) -> Tuple[List[Tuple[str, Dict]], List[Dict]]:
+    """读取站点配置，返回 ([(站点ID, 配置)], [无法解析的条目])"""
+    path = Path(source)
+    sites = []
+    failures = []
+
+    if path.is_dir():
+        for config_file in sorted(path.glob("*.json")):
+            try:
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    sites.append((config_file.stem, json.load(f)))
+            except (OSError, ValueError) as e:
+                failures.append({"site_id": config_file.stem, "stage": "load", "error": str(e)})
+    else:
+        with open_artifact(path, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    config = json.loads(line)
+                except ValueError as e:
+                    failures.append({"site_id": f"line_{line_number}", "stage": "load", "error": str(e)})
+                    continue
+                # 没有 site_id 时用地址描述加行号：同一地址的多个设计方案描述相同
+                site_id = config.get("site_id")
+                if not site_id:
+                    description = config.get("location", {}).get("description")
+                    site_id = f"{description}_line_{line_number}" if description else f"line_{line_number}"
+                sites.append((str(site_id), config))
+
+    return _unique_site_ids(sites), failures
+
+
+def _unique_site_ids(sites: List[Tuple[str, Dict]]) -> List[Tuple[str, Dict]]:
+    """重复的站点ID依次加后缀 _2、_3…（站点ID也是输出文件名和运行ID的标签，不能重复）"""
+    seen = {site_id for site_id, _ in sites}
+    counts = {}
+    unique = []
+    for site_id, config in sites:
+        counts[site_id] = counts.get(site_id, 0) + 1
+        if counts[site_id] > 1:
+            n = counts[site_id]
+            while f"{site_id}_{n}" in seen:
+                n += 1
+            counts[site_id] = n
+            site_id = f"{site_id}_{n}"
+            seen.add(site_id)
+        unique.append((site_id, config))
+    return unique
+
+
+def summarize_site(site_id: str, calculator: PVGISCalculator2023) -> Dict:
+    """提取单个站点的汇总指标"""
+    results = calculator.results
+    location = calculator.config["location"]
+    capacity = sum(s["peak_power_kw"] for s in results["surfaces"])
+    energy = results["total_annual_energy"]
+
+    if results["failed_surfaces"]:
+        status = "partial" if results["surfaces"] else "failed"
+    else:
+        status = "ok"
+    metrics = calculator.metrics.to_dict()
+
+    return {
+        "site_id": site_id,
+        "description": location.get("description", ""),
+        "latitude": location["latitude"],
+        "longitude": location["longitude"],
+        "surfaces": len(results["surfaces"]),
+        "capacity_kwp": round(capacity, 3),
+        "annual_energy_kwh": round(energy, 2),
+        "specific_yield_kwh_per_kwp": round(energy / capacity, 1) if capacity else 0,
+        "capacity_factor_percent": round(energy / (capacity * 8760) * 100, 2) if capacity else 0,
+        "status": status,
+        "run_seconds": round(metrics["wall_seconds"], 2),
+        "bound": metrics["bound"] or "",
+        "output_directory": calculator.output_dir,
+    }
+
+
+def run_site(site_id: str, config: Dict, client: PVGISClient, output_dir: str = None) -> Tuple[Dict, Dict, Dict]:
+    """计算单个站点，返回 (汇总行, 失败信息或None, 运行指标)；异常不会中断整个批次"""
+    if output_dir:
+        config.setdefault("output", {})["output_directory"] = output_dir
+    # 坐标相同的站点（同一地址的多个设计方案）共用地点目录，按站点ID区分输出文件和运行记录
+    config.setdefault("output", {}).setdefault("run_label", site_id)
+
+    try:
+        calculator = PVGISCalculator2023(config, client=client)
+        calculator.run()
+    except Exception as e:
+        return None, {
+            "site_id": site_id,
+            "stage": "calculate",
+            "error": f"{type(e).__name__}: {e}",
+            "traceback": traceback.format_exc(),
+        }, None
+
+    summary = summarize_site(site_id, calculator)
+    failure = None
+    if summary["status"] != "ok":
+        failure = {
+            "site_id": site_id,
+            "stage": "surfaces",
+            "error": f"坡面计算失败: {', '.join(calculator.results['failed_surfaces'])}",
+            "failed_surfaces": calculator.results["failed_surfaces"],
+        }
+    return summary, failure, calculator.metrics.to_dict()
+
+
+def run_batch(source: str, workers: int = 4, output_dir: str = "output",
+              pvgis_config: Dict = None) -> Dict:
+    """批量计算所有站点，写出汇总表和失败报告"""
+    sites, failures = load_site_configs(source)
+    total_sites = len(sites) + len(failures)
+    print(f"共 {total_sites} 个站点，并发数 {workers}")
+
+    pvgis_config = dict(pvgis_config or {})
+    pvgis_config.setdefault("max_workers", workers)
+    client = PVGISClient.from_config(pvgis_config)
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            outcomes = list(executor.map(
+                lambda site: run_site(site[0], site[1], client, output_dir), sites
+            ))
+    finally:
+        client.close()
+    batch_seconds = time.perf_counter() - start
+
+    summaries = []
+    site_metrics = []
+    for summary, failure, metrics in outcomes:
+        if summary:
+            summaries.append(summary)
+        if failure:
+            failures.append(failure)
+        if metrics:
+            site_metrics.append(metrics)
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    summary_file = os.path.join(output_dir, f"batch_summary_{timestamp}.csv")
+    failures_file = os.path.join(output_dir, f"batch_failures_{timestamp}.json")
+    metrics_file = os.path.join(output_dir, f"batch_metrics_{timestamp}.json")
+
+    with open(summary_file, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    with open(failures_file, 'w', encoding='utf-8') as f:
+        json.dump({"total_sites": total_sites, "failed": len(failures), "failures": failures},
+                  f, indent=2, ensure_ascii=False)
+
+    # 各站点耗时按线程累计，并发运行时总和大于批次的墙钟时间
+    batch_metrics = aggregate_metrics(site_metrics)
+    batch_metrics["batch_wall_seconds"] = round(batch_seconds, 4)
+    batch_metrics["workers"] = workers
+    with open(metrics_file, 'w', encoding='utf-8') as f:
+        json.dump(batch_metrics, f, indent=2, ensure_ascii=False)
+
+    ok_count = sum(1 for s in summaries if s["status"] == "ok")
+    partial_count = sum(1 for s in summaries if s["status"] == "partial")
+    stats = client.cache_stats()
+    breakdown = batch_metrics["time_breakdown"]
+    http = batch_metrics["http"]["total"]
+    print("\n" + "=" * 60)
+    print("批量计算完成")
+    print("=" * 60)
+    print(f"成功: {ok_count} 个站点")
+    print(f"部分失败: {partial_count} 个站点")
+    print(f"失败: {total_sites - ok_count - partial_count} 个站点")
+    print(f"PVGIS缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, 合并并发重复请求 {stats['coalesced']} 次, "
+          f"复用邻近地址辐照 {stats['spatial_reuses']} 次")
+    if stats["circuit_trips"] or http["rejected"]:
+        print(f"⚠️  PVGIS 熔断 {stats['circuit_trips']} 次，{http['rejected']} 个请求因熔断或时间预算用完未发出")
+    print(f"批次耗时: {batch_seconds:.1f} 秒, 瓶颈: {batch_metrics['bound'] or '-'} "
+          f"(各站点合计: 网络 {breakdown['network_seconds']:.1f} 秒, 限流等待 {breakdown['rate_limit_wait_seconds']:.1f} 秒, "
+          f"读缓存 {breakdown['cache_read_seconds']:.1f} 秒, 写文件 {breakdown['file_write_seconds']:.1f} 秒, "
+          f"解析/计算 {breakdown['processing_seconds']:.1f} 秒)")
+    print(f"HTTP: {http['requests']} 次请求, 下载 {http['bytes_downloaded'] / 1024 / 1024:.2f} MB, "
+          f"重试 {http['retries']} 次, 错误 {http['errors']} 次")
+    print(f"汇总表: {summary_file}")
+    print(f"失败报告: {failures_file}")
+    print(f"运行指标: {metrics_file}")
+
+    return {"summary_file": summary_file, "failures_file": failures_file, "metrics_file": metrics_file,
+            "summaries": summaries, "failures": failures, "metrics": batch_metrics}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多站点光伏发电量批量计算 (2023年数据)')
+    parser.add_argument('source', help='站点配置目录（*.json）或 JSONL 文件')
+    parser.add_argument('--workers', type=int, default=4, help='同时计算的站点数')
+    parser.add_argument('--output-dir', default='output', help='输出根目录')
+    parser.add_argument('--requests-per-second', type=float, default=None, help='PVGIS 请求速率上限')
+    parser.add_argument('--api-base-url', default=None, help='PVGIS API 根地址（可指向本地替身服务器）')
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help='整个批次访问 PVGIS 的总时间预算（秒），用完后剩余请求直接失败')
+    args = parser.parse_args()
+
+    if args.api_base_url:
+        os.environ["PVGIS_API_BASE_URL"] = args.api_base_url
+
+    pvgis_config = {}
+    if args.requests_per_second is not None:
+        pvgis_config["requests_per_second"] = args.requests_per_second
+    if args.time_budget is not None:
+        pvgis_config["time_budget_seconds"] = args.time_budget
+
+    run_batch(args.source, workers=args.workers, output_dir=args.output_dir, pvgis_config=pvgis_config)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,31 +5,84 @@
 默认只获取2023年的小时辐射数据，并使用本地时间
 """
 
+import copy
+import hashlib
 import json
 import requests
 import csv
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Dict, List, Any
+from contextlib import nullcontext
+from typing import Dict, List, Any, Optional, Tuple, Union
 from pathlib import Path
+from pvgis_client import DEFAULT_API_BASE_URL, PVGISClient, resolve_api_base_url
+from artifact_io import artifact_path, compression_for, open_artifact
+from artifact_store import ArtifactStore, RunManifest, location_dir_name
+from run_metrics import RunMetrics, bind
+from pv_yield import (
+    NORMALIZED_PEAK_POWER_KW, build_pvcalc_params, build_seriescalc_params, normalize_aspect,
+    scale_pvcalc_output, surface_group_key
+)
+from hourly_store import FILE_SUFFIX as STORE_SUFFIX, HourlyColumnStore, write_hourly_columns
+from radiation_archive import RadiationArchive
+from pvgis_stream import HourlyColumnCollector, SeriescalcJSONWriter, SeriescalcStream, iter_batches
+from yield_table import DEFAULT_TABLE_FILE, YieldTable, monthly_records_per_kwp
 try:
-    from timezonefinder import TimezoneFinder
-    import pytz
-    TIMEZONE_SUPPORT = True
+    from pv_engine import REQUIRED_FIELDS, LocalPVEngine, monthly_records
+    from pv_multiyear import DEFAULT_END_YEAR, DEFAULT_START_YEAR, compute_generation_matrices
+    from pv_hourly_profile import roof_hourly_generation
+    from yield_raster import YieldRaster
+    LOCAL_ENGINE_SUPPORT = True
 except ImportError:
-    TIMEZONE_SUPPORT = False
-    print("提示: 未安装时区库，将使用UTC时间。如需本地时间转换，请运行: pip install timezonefinder pytz")
+    LOCAL_ENGINE_SUPPORT = False
+from timezone_utils import (
+    convert_utc_to_local, get_local_time_converter, resolve_timezone_name,
+    timezone_support, utc_offset_hours
+)
+
+
+# 流式写入小时数据时每批的记录数（一年）
+HOURLY_WRITE_BATCH = 8760
+
+# 增量计算状态（各坡面输入指纹及结果），保存在该地点输出目录下，不带时间戳
+INCREMENTAL_STATE_FILE = "incremental_state.json"
+
+
+def _fingerprint(value: Any) -> str:
+    """输入参数的指纹（规范化 JSON 的 sha256 前16位）"""
+    encoded = json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
 
 
 class PVGISCalculator2023:
     """PVGIS API 调用和计算类 - 2023年版本"""
     
-    PVCALC_API = "https://re.jrc.ec.europa.eu/api/PVcalc"
-    SERIESCALC_API = "https://re.jrc.ec.europa.eu/api/seriescalc"
+    PVCALC_API = f"{DEFAULT_API_BASE_URL}/PVcalc"
+    SERIESCALC_API = f"{DEFAULT_API_BASE_URL}/seriescalc"
+    # 小时辐射数据在 results 中的文件字段（增量计算时整体复用）
+    RADIATION_RESULT_KEYS = ("hourly_radiation_file", "hourly_radiation_json", "hourly_radiation_store")
     
-    def __init__(self, config_path: str = "config_australia.json"):
-        """初始化计算器"""
+    def __init__(self, config_path: Union[str, Dict] = "config_australia.json", api_base_url: str = None,
+                 client: PVGISClient = None):
+        """初始化计算器
+        
+        config_path 可以是配置文件路径，也可以是已加载的配置字典（批量模式）。
+        api_base_url 可指向本地 PVGIS 替身服务器；也可通过配置 pvgis.api_base_url
+        或环境变量 PVGIS_API_BASE_URL 设置。
+        client 用于在多个站点之间共享连接池、缓存和限流器。
+        """
         self.config = self._load_config(config_path)
+        self.client = client if client is not None else PVGISClient.from_config(self.config.get("pvgis"))
+        
+        base_url = resolve_api_base_url(api_base_url or self.config.get("pvgis", {}).get("api_base_url"))
+        if base_url != DEFAULT_API_BASE_URL:
+            self.PVCALC_API = f"{base_url}/PVcalc"
+            self.SERIESCALC_API = f"{base_url}/seriescalc"
+            print(f"PVGIS API 地址: {base_url}")
         self.timezone_info = self._get_timezone_info()
         self._setup_output_directory()
         
@@ -39,14 +92,25 @@ class PVGISCalculator2023:
             "timezone_info": self.timezone_info,
             "panel_spec": self.config["panel_spec"],
             "surfaces": [],
+            "failed_surfaces": [],
             "total_annual_energy": 0,
             "hourly_radiation_file": None
         }
+        # 本地引擎模式下按列保留辐照数据，供 calculate_all_surfaces 使用
+        self.hourly_radiation_columns = None
+        self._radiation_store = None
+        # 上次运行的指纹和结果，只重新计算输入有变化的部分
+        self._incremental_state = self._load_incremental_state()
+        # 各阶段耗时和 PVGIS 调用指标，run() 期间记录，写入 results_2023.json 的 metrics 字段
+        self.metrics = RunMetrics()
     
-    def _load_config(self, config_path: str) -> Dict:
+    def _load_config(self, config_path: Union[str, Dict]) -> Dict:
         """加载配置文件"""
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+        if isinstance(config_path, dict):
+            config = copy.deepcopy(config_path)
+        else:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
         
         # 设置默认倾斜角为23度
         for surface in config.get("roof_surfaces", []):
@@ -58,6 +122,26 @@ class PVGISCalculator2023:
             config["output"] = {}
         if "convert_to_local_time" not in config["output"]:
             config["output"]["convert_to_local_time"] = True
+        # 小时辐射数据的附加格式: columnar（列存储，默认）、json 或 both（CSV 始终输出）
+        config["output"].setdefault("hourly_radiation_format", "columnar")
+        # 小时辐射归档目录：设置后每次下载的辐射数据按站点和月份追加到归档（见 radiation_archive.py）
+        config["output"].setdefault("radiation_archive", None)
+        # 输出文件压缩: null（不压缩，默认）、"auto"（按产物类型选择 gzip/lzma）、"gzip"、"lzma"，
+        # 或按产物类型指定的字典（类型见 artifact_io.DEFAULT_COMPRESSION）；列存储不压缩
+        config["output"].setdefault("compression", None)
+        compression_for("results", config["output"]["compression"])
+        
+        # 发电量计算引擎: pvcalc（逐组请求 PVcalc，默认）、local（本地 NumPy 引擎）
+        # table（从预先构建的 倾角×方位角 查找表插值）或 raster（从区域栅格插值），后两者不访问网络
+        calculation = config.setdefault("calculation", {})
+        calculation.setdefault("engine", "pvcalc")
+        if calculation["engine"] in ("local", "raster") and not LOCAL_ENGINE_SUPPORT:
+            print(f"提示: 未安装 numpy，{calculation['engine']} 引擎不可用，改用 PVcalc。如需使用，请运行: pip install numpy")
+            calculation["engine"] = "pvcalc"
+        # PVcalc 模式下另外请求各朝向的 seriescalc（pvcalculation=1），输出各坡面及屋顶逐小时发电
+        calculation.setdefault("hourly_profile", False)
+        # 流水线模式: 为 true 时互不依赖的阶段并行执行（日志会交错），默认按顺序执行
+        calculation.setdefault("pipelined", False)
         
         return config
     
@@ -77,7 +161,9 @@ class PVGISCalculator2023:
                 "conversion_enabled": False
             }
         
-        if not TIMEZONE_SUPPORT:
+        # 时区库延迟导入：只有需要转换本地时间时才加载
+        if not timezone_support():
+            print("提示: 未安装时区库，将使用UTC时间。如需本地时间转换，请运行: pip install timezonefinder pytz")
             return {
                 "timezone_name": "UTC",
                 "utc_offset": 0,
@@ -86,15 +172,12 @@ class PVGISCalculator2023:
             }
         
         try:
-            tf = TimezoneFinder()
-            timezone_name = tf.timezone_at(lat=lat, lng=lon)
+            # 进程内共享一个 TimezoneFinder，结果按坐标缓存到磁盘
+            timezone_name = resolve_timezone_name(lat, lon)
             
             if timezone_name:
-                tz = pytz.timezone(timezone_name)
                 # 使用2023年1月1日来获取该地区的时区偏移（包含夏令时）
-                sample_date = datetime(2023, 1, 1, 12, 0, 0)
-                localized_date = tz.localize(sample_date)
-                utc_offset = localized_date.utcoffset().total_seconds() / 3600
+                utc_offset = utc_offset_hours(timezone_name, datetime(2023, 1, 1, 12, 0, 0))
                 
                 return {
                     "timezone_name": timezone_name,
@@ -125,15 +208,13 @@ class PVGISCalculator2023:
         lon = self.config["location"]["longitude"]
         
         # 创建基于经纬度的目录名
-        lat_str = f"{abs(lat):.4f}{'N' if lat >= 0 else 'S'}"
-        lon_str = f"{abs(lon):.4f}{'E' if lon >= 0 else 'W'}"
-        location_dir = f"lat_{lat_str}_lon_{lon_str}"
+        location_dir = location_dir_name(lat, lon)
         
         # 基础输出目录
-        base_output_dir = self.config.get("output", {}).get("output_directory", "output")
+        self.base_output_dir = self.config.get("output", {}).get("output_directory", "output")
         
         # 完整输出路径
-        self.output_dir = os.path.join(base_output_dir, location_dir)
+        self.output_dir = os.path.join(self.base_output_dir, location_dir)
         
         # 创建目录
         Path(self.output_dir).mkdir(parents=True, exist_ok=True)
@@ -147,6 +228,11 @@ class PVGISCalculator2023:
             self.timestamp_suffix = f"_{timestamp}"
         else:
             self.timestamp_suffix = ""
+        # 运行标签（批量模式为站点ID）：同一地址的多个设计方案共用地点目录，
+        # 标签加在文件名和运行ID中，避免同一秒内的运行互相覆盖
+        run_label = self.config.get("output", {}).get("run_label")
+        if run_label:
+            self.timestamp_suffix += "_" + re.sub(r"[^\w.-]+", "_", str(run_label))
     
     def _get_output_path(self, filename: str) -> str:
         """获取带时间戳的输出文件路径"""
@@ -154,13 +240,14 @@ class PVGISCalculator2023:
         timestamped_name = f"{name}{self.timestamp_suffix}{ext}"
         return os.path.join(self.output_dir, timestamped_name)
     
+    def _artifact_path(self, filename: str, artifact_type: str) -> str:
+        """带时间戳的输出文件路径，按 output.compression 为该类产物加上 .gz / .xz 后缀"""
+        return artifact_path(self._get_output_path(filename),
+                             compression_for(artifact_type, self.config["output"]["compression"]))
+    
     def normalize_azimuth(self, azimuth: float) -> float:
         """将方位角转换为 PVGIS API 可接受的范围 (-180° 到 +180°)"""
-        while azimuth > 180:
-            azimuth -= 360
-        while azimuth <= -180:
-            azimuth += 360
-        return azimuth
+        return normalize_aspect(azimuth)
     
     def get_hourly_radiation_2023(self) -> str:
         """获取2023年的小时级辐射数据"""
@@ -173,14 +260,12 @@ class PVGISCalculator2023:
         print(f"年份: 2023")
         print(f"时区转换: {self.timezone_info['description']}")
         
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "startyear": 2023,          # 只获取2023年
-            "endyear": 2023,            # 只获取2023年
-            "pvcalculation": 0,         # 不计算PV，只要辐射数据
-            "outputformat": "json"
-        }
+        # 只获取2023年的辐射数据；本地引擎需要水平面直射/散射分量
+        params = build_seriescalc_params(lat, lon, 2023, components=self._use_local_engine())
+        
+        radiation_fingerprint = self._radiation_fingerprint(params)
+        if self._reuse_hourly_radiation(radiation_fingerprint):
+            return self.results["hourly_radiation_file"]
         
         # 注意: seriescalc API 不支持 localtime 参数，我们在后处理中转换时间
         
@@ -189,28 +274,42 @@ class PVGISCalculator2023:
             print(f"API URL: {self.SERIESCALC_API}")
             print(f"参数: {params}")
             
-            response = requests.get(self.SERIESCALC_API, params=params, timeout=120)
-            response.raise_for_status()
+            output_file = self._artifact_path("hourly_radiation_2023.csv", "hourly_radiation_csv")
+            hourly_format = self.config["output"]["hourly_radiation_format"]
+            json_file = self._artifact_path("hourly_radiation_2023.json", "hourly_radiation_json") if hourly_format in ("json", "both") else None
+            store_file = self._get_output_path(f"hourly_radiation_2023{STORE_SUFFIX}") if hourly_format in ("columnar", "both") else None
             
-            data = response.json()
-            
-            # 在 JSON 中添加我们使用的参数信息
-            data["request_params"] = params
-            data["timezone_conversion"] = self.timezone_info
-            
-            # 保存到 CSV 文件
-            output_file = self._get_output_path("hourly_radiation_2023.csv")
-            self._save_hourly_radiation_csv(data, output_file)
-            
-            # 同时保存原始 JSON（包含请求参数）
-            json_file = self._get_output_path("hourly_radiation_2023.json")
-            with open(json_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            print(f"✓ JSON数据已保存到: {json_file}")
+            # 边下载边解析，逐批写入 CSV/JSON/列存储，不在内存中保留整个响应
+            try:
+                with self.client.stream_bytes(self.SERIESCALC_API, params, timeout=120) as chunks:
+                    stream = SeriescalcStream(chunks)
+                    columns = self._save_hourly_radiation_streaming(
+                        stream, output_file, json_file, store_file, params,
+                        collect_columns=self._use_local_engine() or bool(self.config["output"]["radiation_archive"])
+                    )
+            except BaseException:
+                # 下载或解析中断时删除写了一半的文件
+                for path in (output_file, json_file, store_file):
+                    if path and os.path.exists(path):
+                        os.remove(path)
+                raise
             
             self.results["hourly_radiation_file"] = output_file
-            self.results["hourly_radiation_json"] = json_file
+            if json_file:
+                print(f"✓ JSON数据已保存到: {json_file}")
+                self.results["hourly_radiation_json"] = json_file
+            if store_file:
+                self.results["hourly_radiation_store"] = store_file
             
+            if self._use_local_engine():
+                self.hourly_radiation_columns = columns
+            if self.config["output"]["radiation_archive"]:
+                self._archive_hourly_radiation(columns)
+            
+            self._incremental_state["radiation"] = {
+                "fingerprint": radiation_fingerprint,
+                "files": {key: self.results[key] for key in self.RADIATION_RESULT_KEYS if key in self.results},
+            }
             return output_file
             
         except requests.exceptions.RequestException as e:
@@ -218,6 +317,72 @@ class PVGISCalculator2023:
             if hasattr(e, 'response') and e.response is not None:
                 print(f"响应内容: {e.response.text[:500]}")
             return None
+        except ValueError as e:
+            print(f"✗ 小时辐射数据解析失败: {e}")
+            return None
+    
+    def _archive_hourly_radiation(self, columns: Dict):
+        """把本次下载的小时辐射追加到归档；归档失败只提示，不影响本次计算"""
+        archive_dir = self.config["output"]["radiation_archive"]
+        try:
+            with self.metrics.file_write():
+                chunks = RadiationArchive(archive_dir).add_columns(
+                    self.config["location"]["latitude"], self.config["location"]["longitude"],
+                    columns, source=self.results.get("hourly_radiation_file")
+                )
+            print(f"✓ 小时辐射已归档: {archive_dir}（{chunks} 个月度块）")
+        except (OSError, ValueError) as e:
+            print(f"警告: 小时辐射归档失败: {e}")
+    
+    def _incremental_enabled(self) -> bool:
+        return self.config["calculation"].get("incremental", True)
+    
+    def _load_incremental_state(self) -> Dict:
+        """读取上次运行保存的指纹和结果；calculation.incremental 为 false 时总是全部重新计算"""
+        state = {"radiation": None, "surfaces": {}, "hourly_generation": None}
+        path = os.path.join(self.output_dir, INCREMENTAL_STATE_FILE)
+        if self._incremental_enabled() and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    state.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"警告: 无法读取增量计算状态 {path}: {e}")
+        return state
+    
+    def _save_incremental_state(self):
+        path = os.path.join(self.output_dir, INCREMENTAL_STATE_FILE)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._incremental_state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    def _radiation_fingerprint(self, params: Dict) -> str:
+        """小时辐射数据的指纹：请求参数、输出格式和时区转换设置"""
+        return _fingerprint({
+            "url": self.SERIESCALC_API,
+            "params": params,
+            "format": self.config["output"]["hourly_radiation_format"],
+            "timezone": self.timezone_info["timezone_name"] if self.timezone_info["conversion_enabled"] else None,
+        })
+    
+    def _reuse_hourly_radiation(self, fingerprint: str) -> bool:
+        """指纹与上次相同且文件仍在时复用上次的小时辐射数据（本地引擎从列存储读取）"""
+        previous = self._incremental_state.get("radiation")
+        if not self._incremental_enabled() or not previous or previous.get("fingerprint") != fingerprint:
+            return False
+        files = previous["files"]
+        if not files.get("hourly_radiation_file") or not all(os.path.exists(path) for path in files.values()):
+            return False
+        if self._use_local_engine():
+            store_file = files.get("hourly_radiation_store")
+            if not store_file:
+                return False
+            self._radiation_store = HourlyColumnStore(store_file)
+            self.hourly_radiation_columns = self._radiation_store.columns(REQUIRED_FIELDS)
+        
+        self.results.update(files)
+        print(f"✓ 位置和请求参数未变，复用上次的小时辐射数据: {files['hourly_radiation_file']}")
+        return True
     
     def _convert_utc_to_local(self, utc_time_str: str) -> str:
         """将UTC时间转换为本地时间"""
@@ -225,70 +390,152 @@ class PVGISCalculator2023:
             return utc_time_str
         
         try:
-            # 解析UTC时间
-            utc_dt = datetime.strptime(utc_time_str, "%Y%m%d:%H%M")
-            utc_dt = utc_dt.replace(tzinfo=pytz.UTC)
-            
-            # 转换为本地时间
-            local_tz = pytz.timezone(self.timezone_info["timezone_name"])
-            local_dt = utc_dt.astimezone(local_tz)
-            
-            return local_dt.strftime("%Y%m%d:%H%M")
+            return convert_utc_to_local(utc_time_str, self.timezone_info["timezone_name"])
         except Exception as e:
             print(f"警告: 时间转换失败: {e}")
             return utc_time_str
     
-    def _save_hourly_radiation_csv(self, data: Dict, filename: str):
-        """将小时辐射数据保存为 CSV"""
-        if "outputs" not in data or "hourly" not in data["outputs"]:
-            print("警告: API 返回数据格式不符合预期")
-            print(f"返回的数据键: {data.keys()}")
-            return
+    def _convert_utc_column(self, utc_times: List[str]) -> List[str]:
+        """批量将整列UTC时间转换为本地时间（时区切换表只解析一次）"""
+        if not self.timezone_info["conversion_enabled"]:
+            return list(utc_times)
         
-        hourly_data = data["outputs"]["hourly"]
+        try:
+            converter = get_local_time_converter(self.timezone_info["timezone_name"])
+            return converter.convert(utc_times)
+        except Exception as e:
+            print(f"警告: 批量时间转换失败，改为逐行转换: {e}")
+            return [self._convert_utc_to_local(t) for t in utc_times]
+    
+    def _save_hourly_radiation_streaming(self, stream: SeriescalcStream, csv_file: str,
+                                         json_file: Optional[str], store_file: Optional[str],
+                                         params: Dict, collect_columns: bool = False) -> Optional[Dict]:
+        """把流式解析的小时记录逐批（每批一年）写入 CSV，以及可选的 JSON 和列存储
         
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
+        需要列存储或本地引擎时按列收集所有字段，返回列字典（含 local_time），否则返回 None。
+        """
+        conversion_enabled = self.timezone_info["conversion_enabled"]
+        headers = None
+        time_index = 0
+        collector = None
+        local_time_column = []
+        collect_columns = collect_columns or store_file is not None
+        write_seconds = 0.0
+        
+        with open_artifact(csv_file, 'w', newline='') as f_csv, \
+                (open_artifact(json_file, 'w') if json_file else nullcontext()) as f_json:
+            writer = csv.writer(f_csv)
+            json_writer = None
+            if f_json is not None:
+                json_writer = SeriescalcJSONWriter(f_json, {
+                    "request_params": params,
+                    "timezone_conversion": self.timezone_info,
+                })
             
-            # 写入表头
-            if len(hourly_data) > 0:
-                headers = list(hourly_data[0].keys())
-                
-                # 如果启用了时区转换，添加本地时间列
-                if self.timezone_info["conversion_enabled"]:
-                    # 在 time 列后面插入 local_time 列
-                    time_index = headers.index('time') if 'time' in headers else 0
-                    headers.insert(time_index + 1, 'local_time')
+            for batch in iter_batches(stream, HOURLY_WRITE_BATCH):
+                if headers is None:
+                    headers = list(batch[0].keys())
+                    if collect_columns:
+                        collector = HourlyColumnCollector(headers)
+                    # 如果启用了时区转换，在 time 列后面插入 local_time 列
+                    if conversion_enabled:
+                        time_index = headers.index('time') if 'time' in headers else 0
+                        writer.writerow([*headers[:time_index + 1], 'local_time', *headers[time_index + 1:]])
+                    else:
+                        writer.writerow(headers)
                 
-                writer.writerow(headers)
+                if conversion_enabled:
+                    local_times = self._convert_utc_column([row['time'] for row in batch])
+                    write_start = time.perf_counter()
+                    writer.writerows(
+                        [*values[:time_index + 1], local_time, *values[time_index + 1:]]
+                        for values, local_time in zip((list(row.values()) for row in batch), local_times)
+                    )
+                    if collector is not None:
+                        local_time_column.extend(local_times)
+                else:
+                    write_start = time.perf_counter()
+                    writer.writerows(row.values() for row in batch)
                 
-                # 写入数据
-                for row in hourly_data:
-                    row_values = list(row.values())
-                    
-                    # 如果启用了时区转换，添加本地时间
-                    if self.timezone_info["conversion_enabled"]:
-                        utc_time = row['time']
-                        local_time = self._convert_utc_to_local(utc_time)
-                        time_index = list(row.keys()).index('time')
-                        row_values.insert(time_index + 1, local_time)
-                    
-                    writer.writerow(row_values)
-        
-        print(f"✓ 小时辐射数据已保存到: {filename}")
-        print(f"  共保存 {len(hourly_data)} 条小时数据")
+                if json_writer is not None:
+                    json_writer.write_records(batch)
+                write_seconds += time.perf_counter() - write_start
+                if collector is not None:
+                    for row in batch:
+                        collector.add(row)
+            
+            if json_writer is not None:
+                json_writer.finish(stream.document)
+        self.metrics.add_file_write(write_seconds, (csv_file, json_file))
+        
+        print(f"✓ 小时辐射数据已保存到: {csv_file}")
+        print(f"  共保存 {stream.count} 条小时数据")
         
         # 显示数据列说明
-        if len(hourly_data) > 0:
-            if self.timezone_info["conversion_enabled"]:
-                print(f"  数据列: time(UTC), local_time({self.timezone_info['timezone_name']}), {', '.join(list(hourly_data[0].keys())[1:])}")
+        if headers:
+            if conversion_enabled:
+                print(f"  数据列: time(UTC), local_time({self.timezone_info['timezone_name']}), {', '.join(headers[1:])}")
                 print(f"  ✓ 已添加本地时间列: {self.timezone_info['timezone_name']}")
             else:
-                print(f"  数据列: {', '.join(hourly_data[0].keys())}")
+                print(f"  数据列: {', '.join(headers)}")
                 print(f"  时间格式: UTC")
+        
+        if collector is None:
+            return None
+        
+        columns = collector.columns()
+        if conversion_enabled:
+            columns["local_time"] = local_time_column
+        
+        if store_file is not None:
+            metadata = {"request_params": params, "timezone_conversion": self.timezone_info}
+            metadata.update((key, value) for key, value in stream.document.items() if key != "outputs")
+            with self.metrics.file_write(store_file):
+                write_hourly_columns(store_file, columns, metadata)
+            print(f"✓ 列存储数据已保存到: {store_file}")
+        return columns
+    
+    def _surface_group_key(self, surface: Dict) -> Tuple:
+        """坡面分组键（位置、倾角、方位角、损耗、衰减率）"""
+        return surface_group_key(
+            self.config["location"]["latitude"],
+            self.config["location"]["longitude"],
+            surface.get("tilt_angle", 23),
+            surface["azimuth"],
+            self.config["system_loss"],
+            self.config["panel_spec"]["annual_degradation"]
+        )
+    
+    def fetch_normalized_yield(self, surface: Dict) -> Dict:
+        """请求坡面朝向下 1 kWp 的 PVcalc 结果（单位容量发电量）"""
+        params = build_pvcalc_params(
+            self.config["location"]["latitude"],
+            self.config["location"]["longitude"],
+            surface.get("tilt_angle", 23),
+            surface["azimuth"],
+            self.config["system_loss"],
+            self.config["panel_spec"]["annual_degradation"]
+        )
+        
+        try:
+            print(f"  正在请求 PVGIS PVcalc API (单位容量, 倾角 {params['angle']}°, 方位角 {params['aspect']}°)...")
+            data = self.client.get_json(self.PVCALC_API, params, timeout=30)
+            
+            if "outputs" in data and "totals" in data["outputs"]:
+                return data
+            
+            print(f"  ✗ API 返回数据格式异常")
+            return None
+                
+        except requests.exceptions.RequestException as e:
+            print(f"  ✗ API 请求失败: {e}")
+            return None
     
-    def calculate_surface_energy(self, surface: Dict) -> Dict:
-        """计算单个坡面的发电量"""
+    def calculate_surface_energy(self, surface: Dict, normalized_yield: Dict = None) -> Dict:
+        """计算单个坡面的发电量
+        
+        normalized_yield 为同组坡面共享的 1 kWp PVcalc 结果；未提供时单独请求。
+        """
         print(f"\n--- 计算坡面: {surface['name']} ---")
         
         # 计算坡面总功率
@@ -312,74 +559,417 @@ class PVGISCalculator2023:
         else:
             print(f"  方位角: {original_azimuth}°")
         
-        # 构造 API 请求参数
-        params = {
-            "lat": self.config["location"]["latitude"],
-            "lon": self.config["location"]["longitude"],
-            "peakpower": peak_power_kw,
-            "loss": self.config["system_loss"],
-            "angle": tilt_angle,
-            "aspect": normalized_azimuth,
-            "outputformat": "json"
+        if normalized_yield is None:
+            normalized_yield = self.fetch_normalized_yield(surface)
+            if normalized_yield is None:
+                return None
+        
+        # 按装机容量缩放单位容量结果
+        data = scale_pvcalc_output(normalized_yield, peak_power_kw)
+        totals = data["outputs"]["totals"]["fixed"]
+        monthly = data["outputs"]["monthly"]["fixed"]
+        
+        result = {
+            "name": surface["name"],
+            "panel_count": panel_count,
+            "peak_power_kw": peak_power_kw,
+            "tilt_angle": tilt_angle,
+            "azimuth": surface["azimuth"],
+            "annual_energy_kwh": totals["E_y"],
+            "specific_yield_kwh_per_kwp": normalized_yield["outputs"]["totals"]["fixed"]["E_y"] / NORMALIZED_PEAK_POWER_KW,
+            "monthly_energy": monthly,
+            "api_response": data
         }
         
-        # 添加衰减率参数
-        if self.config["panel_spec"]["annual_degradation"] > 0:
-            params["pvtechchoice"] = "crystSi"
-            params["pv_degradation"] = self.config["panel_spec"]["annual_degradation"]
+        print(f"  ✓ 年发电量: {totals['E_y']:.2f} kWh")
+        print(f"  ✓ 平均日发电量: {totals['E_d']:.2f} kWh/day")
+        
+        return result
+    
+    def _use_local_engine(self) -> bool:
+        return self.config["calculation"]["engine"] == "local"
+    
+    def _use_yield_table(self) -> bool:
+        """table 和 raster 引擎都从查找表插值，只是表的来源不同"""
+        return self.config["calculation"]["engine"] in ("table", "raster")
+    
+    def _engine_surface_specs(self) -> List[Dict]:
+        """本地引擎使用的坡面参数（倾角、PVGIS方位角、装机容量）"""
+        panel_spec = self.config["panel_spec"]
+        return [
+            {
+                "tilt": surface.get("tilt_angle", 23),
+                "aspect": self.normalize_azimuth(surface["azimuth"]),
+                "peak_power_kw": panel_spec["power_watts"] * surface["panel_count"] / 1000
+            }
+            for surface in self.config["roof_surfaces"]
+        ]
+    
+    def calculate_all_surfaces_local(self) -> List[Dict]:
+        """本地引擎：用已下载的小时辐照一次性计算所有坡面，返回按配置顺序的结果列表"""
+        if self.hourly_radiation_columns is None:
+            self.get_hourly_radiation_2023()
+        if self.hourly_radiation_columns is None:
+            print("✗ 没有可用的小时辐照数据，无法使用本地引擎")
+            return [None] * len(self.config["roof_surfaces"])
+        
+        lat = self.config["location"]["latitude"]
+        lon = self.config["location"]["longitude"]
+        panel_spec = self.config["panel_spec"]
+        surfaces = self.config["roof_surfaces"]
+        
+        specs = self._engine_surface_specs()
         
+        engine = LocalPVEngine(self.hourly_radiation_columns, lat, lon)
+        print(f"本地引擎: {len(surfaces)} 个坡面 × {engine.n_hours} 小时")
+        output = engine.simulate(
+            specs,
+            system_loss=self.config["system_loss"],
+            temperature_coefficient=panel_spec.get("temperature_coefficient_pmax", 0),
+            albedo=self.config["calculation"].get("albedo", 0.2)
+        )
+        
+        results = []
+        for i, (surface, spec) in enumerate(zip(surfaces, specs)):
+            annual = float(output["annual_energy_kwh"][i])
+            results.append({
+                "name": surface["name"],
+                "panel_count": surface["panel_count"],
+                "peak_power_kw": spec["peak_power_kw"],
+                "tilt_angle": spec["tilt"],
+                "azimuth": surface["azimuth"],
+                "annual_energy_kwh": annual,
+                "specific_yield_kwh_per_kwp": annual / spec["peak_power_kw"] if spec["peak_power_kw"] else 0.0,
+                "monthly_energy": monthly_records(output["monthly_energy_kwh"][i], output["monthly_days"])
+            })
+            print(f"  ✓ {surface['name']}: 年发电量 {annual:.2f} kWh")
+        
+        self._save_hourly_generation_csv(engine.times, surfaces, output["hourly_power_w"])
+        return results
+    
+    def _load_yield_table(self) -> Optional[YieldTable]:
+        """加载查找表（calculation.yield_table，默认为该地点输出目录下不带时间戳的 yield_table.json），并检查参数是否一致
+        
+        raster 引擎从区域栅格（calculation.yield_raster）插值出该地址的查找表。
+        """
+        if self.config["calculation"]["engine"] == "raster":
+            return self._load_yield_table_from_raster()
+        
+        table_file = self.config["calculation"].get("yield_table") or os.path.join(self.output_dir, DEFAULT_TABLE_FILE)
+        if not os.path.exists(table_file):
+            print(f"✗ 查找表不存在: {table_file}")
+            print(f"  请先运行: python3 yield_table.py <配置文件>")
+            return None
+        
+        table = YieldTable.load(table_file)
+        metadata = table.metadata
+        loc = self.config["location"]
+        table_loc = metadata.get("location", {})
+        if (abs(table_loc.get("latitude", loc["latitude"]) - loc["latitude"]) > 0.01
+                or abs(table_loc.get("longitude", loc["longitude"]) - loc["longitude"]) > 0.01):
+            print(f"⚠️  查找表位置 ({table_loc.get('latitude')}, {table_loc.get('longitude')}) 与配置不一致")
+        if metadata.get("system_loss", self.config["system_loss"]) != self.config["system_loss"]:
+            print(f"⚠️  查找表系统损耗 {metadata['system_loss']}% 与配置 {self.config['system_loss']}% 不一致")
+        
+        self.results["yield_table_file"] = table_file
+        print(f"✓ 已加载查找表: {table_file} ({len(table.tilts)} 个倾角 × {len(table.aspects)} 个方位角)")
+        return table
+    
+    def _load_yield_table_from_raster(self) -> Optional[YieldTable]:
+        raster_file = self.config["calculation"].get("yield_raster")
+        if not raster_file:
+            print("✗ raster 引擎需要设置 calculation.yield_raster（由 yield_raster.py build 生成）")
+            return None
+        
+        raster = YieldRaster(raster_file)
+        lat = self.config["location"]["latitude"]
+        lon = self.config["location"]["longitude"]
+        table = raster.table_at(lat, lon)
+        if table is None:
+            print(f"✗ 坐标 ({lat}, {lon}) 不在栅格 {raster.path} 范围内，或附近格点无数据")
+            return None
+        if raster.metadata.get("system_loss") != self.config["system_loss"]:
+            print(f"⚠️  栅格系统损耗 {raster.metadata.get('system_loss')}% 与配置 {self.config['system_loss']}% 不一致")
+        
+        self.results["yield_table_file"] = raster.path
+        print(f"✓ 已从区域栅格插值: {raster.path} ({len(table.tilts)} 个倾角 × {len(table.aspects)} 个方位角)")
+        return table
+    
+    def calculate_all_surfaces_table(self) -> List[Dict]:
+        """查找表模式：按倾角、方位角插值单位容量发电量，再按装机容量缩放（不访问网络）"""
+        surfaces = self.config["roof_surfaces"]
+        table = self._load_yield_table()
+        if table is None:
+            return [None] * len(surfaces)
+        
+        results = []
+        for surface, spec in zip(surfaces, self._engine_surface_specs()):
+            estimate = table.lookup(spec["tilt"], spec["aspect"])
+            specific_yield = estimate["annual_kwh_per_kwp"]
+            annual = specific_yield * spec["peak_power_kw"]
+            results.append({
+                "name": surface["name"],
+                "panel_count": surface["panel_count"],
+                "peak_power_kw": spec["peak_power_kw"],
+                "tilt_angle": spec["tilt"],
+                "azimuth": surface["azimuth"],
+                "annual_energy_kwh": annual,
+                "specific_yield_kwh_per_kwp": specific_yield,
+                "monthly_energy": monthly_records_per_kwp(estimate["monthly_kwh_per_kwp"], spec["peak_power_kw"])
+            })
+            print(f"  ✓ {surface['name']}: 年发电量 {annual:.2f} kWh")
+        return results
+    
+    def _use_hourly_profile(self) -> bool:
+        """PVcalc 模式下是否另外请求逐小时发电曲线（本地引擎本身就输出逐小时发电）"""
+        return self.config["calculation"]["engine"] == "pvcalc" and self.config["calculation"]["hourly_profile"]
+    
+    def calculate_hourly_profile(self) -> Optional[str]:
+        """各坡面逐小时交流功率（PVGIS seriescalc，pvcalculation=1）→ 屋顶 8760 小时曲线
+        
+        相同朝向只请求一次 1 kWp 的数据再按容量缩放；输出与本地引擎相同的
+        hourly_generation_2023 CSV 和列存储（P_total(W) 为屋顶合计），财务模拟直接读取列存储。
+        """
+        print("\n=== 各坡面逐小时发电曲线 (seriescalc, pvcalculation=1) ===")
+        if not LOCAL_ENGINE_SUPPORT:
+            print("✗ 逐小时发电曲线需要 numpy，请运行: pip install numpy")
+            return None
+        
+        surfaces = self.config["roof_surfaces"]
         try:
-            print(f"  正在请求 PVGIS PVcalc API...")
-            response = requests.get(self.PVCALC_API, params=params, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # 提取结果
-            if "outputs" in data and "totals" in data["outputs"]:
-                totals = data["outputs"]["totals"]["fixed"]
-                monthly = data["outputs"]["monthly"]["fixed"]
-                
-                result = {
-                    "name": surface["name"],
-                    "panel_count": panel_count,
-                    "peak_power_kw": peak_power_kw,
-                    "tilt_angle": tilt_angle,
-                    "azimuth": surface["azimuth"],
-                    "annual_energy_kwh": totals["E_y"],
-                    "monthly_energy": monthly,
-                    "api_response": data
-                }
-                
-                print(f"  ✓ 年发电量: {totals['E_y']:.2f} kWh")
-                print(f"  ✓ 平均日发电量: {totals['E_d']:.2f} kWh/day")
-                
-                return result
-            else:
-                print(f"  ✗ API 返回数据格式异常")
-                return None
-                
+            profile = roof_hourly_generation(
+                self.client, self.SERIESCALC_API,
+                self.config["location"]["latitude"], self.config["location"]["longitude"],
+                self._engine_surface_specs(), self.config["system_loss"], year=2023,
+                max_workers=self.config.get("pvgis", {}).get("max_workers", 4)
+            )
         except requests.exceptions.RequestException as e:
-            print(f"  ✗ API 请求失败: {e}")
+            print(f"✗ 获取逐小时发电曲线失败: {e}")
+            return None
+        except ValueError as e:
+            print(f"✗ 逐小时发电数据解析失败: {e}")
             return None
+        
+        hourly_power_w = profile["hourly_power_w"]
+        print(f"{len(surfaces)} 个坡面，{profile['requests']} 组朝向，{hourly_power_w.shape[1]} 小时")
+        for surface, power in zip(surfaces, hourly_power_w):
+            print(f"  ✓ {surface['name']}: 年发电量 {power.sum() / 1000:.2f} kWh")
+        print(f"  ✓ 屋顶合计: {hourly_power_w.sum() / 1000:.2f} kWh")
+        self._save_hourly_generation_csv(profile["times"], surfaces, hourly_power_w, source="seriescalc")
+        return self.results["hourly_generation_store"]
+    
+    def _save_hourly_generation_csv(self, times, surfaces: List[Dict], hourly_power_w, source: str = "本地引擎"):
+        """保存各坡面逐小时交流功率（W，即每小时 Wh），CSV 之外另存一份列存储供财务模拟读取
+        
+        source 记入列存储元数据，说明逐小时发电的来源。
+        """
+        output_file = self._artifact_path("hourly_generation_2023.csv", "hourly_generation_csv")
+        total = hourly_power_w.sum(axis=0)
+        
+        with self.metrics.file_write(output_file), open_artifact(output_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["time"] + [f"P_{s['name']}(W)" for s in surfaces] + ["P_total(W)"])
+            for hour, time_str in enumerate(times):
+                writer.writerow([time_str] + [f"{p:.2f}" for p in hourly_power_w[:, hour]] + [f"{total[hour]:.2f}"])
+        
+        self.results["hourly_generation_file"] = output_file
+        print(f"✓ 各坡面小时发电数据已保存到: {output_file}")
+        
+        columns = {"time": times}
+        if self.timezone_info["conversion_enabled"]:
+            columns["local_time"] = self._convert_utc_column(times)
+        for surface, power in zip(surfaces, hourly_power_w):
+            columns[f"P_{surface['name']}(W)"] = power
+        columns["P_total(W)"] = total
+        
+        panel_spec = self.config["panel_spec"]
+        store_file = self._get_output_path(f"hourly_generation_2023{STORE_SUFFIX}")
+        with self.metrics.file_write(store_file):
+            write_hourly_columns(store_file, columns, {
+                "location": self.config["location"],
+                "timezone_conversion": self.timezone_info,
+                "capacity_kwp": sum(panel_spec["power_watts"] * s["panel_count"] / 1000 for s in surfaces),
+                "units": "W（每小时 Wh）",
+                "source": source,
+            })
+        self.results["hourly_generation_store"] = store_file
+        print(f"✓ 小时发电列存储已保存到: {store_file}")
     
     def calculate_all_surfaces(self):
-        """计算所有坡面的发电量"""
+        """计算所有坡面的发电量
+        
+        输入指纹与上次运行相同的坡面直接复用上次结果（见 _cached_surface_results）。
+        calculation.engine 为 local 时使用本地引擎，为 table/raster 时从查找表/区域栅格插值，否则：
+        倾角、方位角等参数相同的坡面合并为一组，每组只请求一次 1 kWp 的 PVcalc，
+        再按各坡面容量缩放。pvgis.max_workers > 1 时并发请求各组（受客户端令牌桶限流），
+        结果始终按配置文件中的坡面顺序汇总。
+        """
         print("\n=== 开始计算各坡面发电量 ===")
         
+        surfaces = self.config["roof_surfaces"]
+        fingerprints = [self._surface_fingerprint(surface) for surface in surfaces]
+        cached = self._cached_surface_results(fingerprints)
+        pending = [surface for surface, result in zip(surfaces, cached) if result is None]
+        
+        if not pending:
+            print(f"增量计算: {len(surfaces)} 个坡面的输入均未变化，复用上次结果")
+            results = cached
+            if self._use_local_engine():
+                self.results.update(self._incremental_state["hourly_generation"])
+        elif self._use_local_engine():
+            results = self.calculate_all_surfaces_local()
+        elif self._use_yield_table():
+            results = self.calculate_all_surfaces_table()
+        else:
+            if len(pending) < len(surfaces):
+                print(f"增量计算: 复用 {len(surfaces) - len(pending)} 个未变化坡面的结果，重新计算 {len(pending)} 个")
+            computed = iter(self._calculate_all_surfaces_pvcalc(pending))
+            results = [result if result is not None else next(computed) for result in cached]
+        
+        # 只保留当前配置中坡面的结果
+        self._incremental_state["surfaces"] = {
+            fingerprint: {key: value for key, value in result.items() if key != "api_response"}
+            for fingerprint, result in zip(fingerprints, results) if result
+        }
+        if self._use_local_engine() and "hourly_generation_file" in self.results:
+            self._incremental_state["hourly_generation"] = {
+                key: self.results[key] for key in ("hourly_generation_file", "hourly_generation_store")
+                if key in self.results
+            }
+        
         total_energy = 0
         
-        for surface in self.config["roof_surfaces"]:
-            result = self.calculate_surface_energy(surface)
-            
+        for surface, result in zip(surfaces, results):
             if result:
                 self.results["surfaces"].append(result)
                 total_energy += result["annual_energy_kwh"]
+            else:
+                self.results["failed_surfaces"].append(surface["name"])
         
         self.results["total_annual_energy"] = total_energy
         
         print(f"\n=== 计算完成 ===")
         print(f"总年发电量: {total_energy:.2f} kWh")
+        if self.results["failed_surfaces"]:
+            print(f"⚠️  以下坡面重试后仍计算失败，未计入总发电量: {', '.join(self.results['failed_surfaces'])}")
+    
+    def _surface_fingerprint(self, surface: Dict) -> str:
+        """坡面输入的指纹：位置、坡面参数、面板功率、损耗/衰减以及引擎相关参数"""
+        calculation = self.config["calculation"]
+        panel_spec = self.config["panel_spec"]
+        inputs = {
+            "engine": calculation["engine"],
+            "location": [self.config["location"]["latitude"], self.config["location"]["longitude"]],
+            "surface": [surface["name"], surface["panel_count"], surface.get("tilt_angle", 23), surface["azimuth"]],
+            "power_watts": panel_spec["power_watts"],
+            "system_loss": self.config["system_loss"],
+            "annual_degradation": panel_spec["annual_degradation"],
+        }
+        if self._use_local_engine():
+            inputs["temperature_coefficient"] = panel_spec.get("temperature_coefficient_pmax", 0)
+            inputs["albedo"] = calculation.get("albedo", 0.2)
+        return _fingerprint(inputs)
+    
+    def _cached_surface_results(self, fingerprints: List[str]) -> List[Optional[Dict]]:
+        """按指纹取上次的坡面结果（没有则为 None）
+        
+        查找表/栅格模式本身不访问网络，总是重新插值；本地引擎只有全部坡面未变
+        且逐小时发电文件仍在时才复用（逐小时文件包含所有坡面）。
+        """
+        if not self._incremental_enabled() or self._use_yield_table():
+            return [None] * len(fingerprints)
+        cached = [self._incremental_state["surfaces"].get(fingerprint) for fingerprint in fingerprints]
+        if self._use_local_engine():
+            hourly_generation = self._incremental_state.get("hourly_generation")
+            if (None in cached or not hourly_generation
+                    or not all(os.path.exists(path) for path in hourly_generation.values())):
+                return [None] * len(fingerprints)
+        return cached
+    
+    def _calculate_all_surfaces_pvcalc(self, surfaces: List[Dict]) -> List[Dict]:
+        """PVcalc 模式：按朝向分组请求，返回按配置顺序的结果列表（失败的坡面为 None）"""
+        # 按分组键合并相同朝向的坡面（保持首次出现的顺序）
+        groups = {}
+        for surface in surfaces:
+            groups.setdefault(self._surface_group_key(surface), surface)
+        group_keys = list(groups.keys())
+        if len(group_keys) < len(surfaces):
+            print(f"{len(surfaces)} 个坡面合并为 {len(group_keys)} 组朝向，只需 {len(group_keys)} 次 PVcalc 请求")
+        
+        max_workers = self.config.get("pvgis", {}).get("max_workers", 1)
+        
+        if max_workers > 1 and len(group_keys) > 1:
+            print(f"并发模式: {min(max_workers, len(group_keys))} 个工作线程")
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(group_keys))) as executor:
+                yields = list(executor.map(bind(self.fetch_normalized_yield), groups.values()))
+        else:
+            yields = [self.fetch_normalized_yield(surface) for surface in groups.values()]
+        normalized_yields = dict(zip(group_keys, yields))
+        
+        results = []
+        for surface in surfaces:
+            normalized_yield = normalized_yields[self._surface_group_key(surface)]
+            if normalized_yield is None:
+                results.append(None)
+            else:
+                results.append(self.calculate_surface_energy(surface, normalized_yield))
+        return results
+    
+    def calculate_generation_matrices(self) -> str:
+        """多年辐照 → 月×小时 P50/P90 发电矩阵（calculation.multi_year 启用时调用）
+        
+        按年分块并发下载，每年归约为 12×24 矩阵后立即释放原始数据，
+        结果供20年财务模拟使用（单位 kWh/kWp，可按任意系统容量缩放）。
+        """
+        multi_year = self.config["calculation"].get("multi_year", {})
+        start_year = multi_year.get("start_year", DEFAULT_START_YEAR)
+        end_year = multi_year.get("end_year", DEFAULT_END_YEAR)
+        print(f"\n=== 多年辐照 P50/P90 发电矩阵 ({start_year}-{end_year}) ===")
+        
+        if not LOCAL_ENGINE_SUPPORT:
+            print("✗ 多年矩阵需要本地引擎，请运行: pip install numpy")
+            return None
+        
+        lat = self.config["location"]["latitude"]
+        lon = self.config["location"]["longitude"]
+        specs = self._engine_surface_specs()
+        timezone_name = self.timezone_info["timezone_name"] if self.timezone_info["conversion_enabled"] else None
+        
+        try:
+            matrices = compute_generation_matrices(
+                self.client, self.SERIESCALC_API, lat, lon, specs,
+                system_loss=self.config["system_loss"],
+                temperature_coefficient=self.config["panel_spec"].get("temperature_coefficient_pmax", 0),
+                albedo=self.config["calculation"].get("albedo", 0.2),
+                timezone_name=timezone_name,
+                start_year=start_year,
+                end_year=end_year,
+                max_workers=multi_year.get("max_workers", self.config.get("pvgis", {}).get("max_workers", 4))
+            )
+        except ValueError as e:
+            print(f"✗ 多年发电矩阵计算失败: {e}")
+            return None
+        
+        matrices.update({
+            "location": self.config["location"],
+            "capacity_kwp": sum(spec["peak_power_kw"] for spec in specs),
+            "time_basis": timezone_name or "UTC",
+            "units": "kWh/kWp，月均一天中每小时的发电量",
+        })
+        
+        output_file = self._artifact_path("generation_matrix_p50_p90.json", "generation_matrix")
+        with self.metrics.file_write(output_file), open_artifact(output_file, 'w') as f:
+            json.dump(matrices, f, indent=2, ensure_ascii=False)
+        
+        self.results["generation_matrix_file"] = output_file
+        self.results["annual_p50_kwh_per_kwp"] = matrices["annual_p50_kwh_per_kwp"]
+        self.results["annual_p90_kwh_per_kwp"] = matrices["annual_p90_kwh_per_kwp"]
+        print(f"年发电量 P50: {matrices['annual_p50_kwh_per_kwp']:.1f} kWh/kWp, "
+              f"P90: {matrices['annual_p90_kwh_per_kwp']:.1f} kWh/kWp ({len(matrices['years'])} 年)")
+        if matrices["failed_years"]:
+            print(f"⚠️  以下年份下载或计算失败，未计入: {', '.join(matrices['failed_years'])}")
+        print(f"✓ 发电矩阵已保存到: {output_file}")
+        return output_file
     
     def generate_report(self):
         """生成报告"""
@@ -390,7 +980,7 @@ class PVGISCalculator2023:
         
         # 保存到文件
         report_file = self._get_output_path("report_2023.txt")
-        with open(report_file, 'w', encoding='utf-8') as f:
+        with self.metrics.file_write(report_file), open_artifact(report_file, 'w') as f:
             f.write(report_content)
         
         print(f"\n报告已保存到: {report_file}")
@@ -411,6 +1001,15 @@ class PVGISCalculator2023:
         lines.append(f"  数据年份: 2023")
         lines.append(f"  系统损耗: {self.config['system_loss']}%")
         lines.append(f"  API数据源: PVGIS (European Commission JRC)")
+        if self._use_local_engine():
+            lines.append(f"  计算引擎: 本地引擎 (seriescalc辐照 + NumPy)")
+        elif self._use_yield_table():
+            source = "区域栅格" if self.config["calculation"]["engine"] == "raster" else "倾角×方位角查找表"
+            lines.append(f"  计算引擎: {source}插值 ({self.results.get('yield_table_file')})")
+        else:
+            lines.append(f"  计算引擎: PVGIS PVcalc")
+            if self._use_hourly_profile():
+                lines.append(f"  逐小时发电: PVGIS seriescalc (pvcalculation=1)")
         
         # 位置信息
         loc = self.results["location"]
@@ -455,6 +1054,7 @@ class PVGISCalculator2023:
             lines.append(f"     方位角: {surface['azimuth']}°")
             lines.append(f"     方位说明: (0°=南, -90°=东, 90°=西)")
             lines.append(f"     年发电量: {surface['annual_energy_kwh']:.2f} kWh")
+            lines.append(f"     单位容量发电量: {surface['specific_yield_kwh_per_kwp']:.0f} kWh/kWp")
             
             # 月度发电量
             lines.append("")
@@ -464,6 +1064,12 @@ class PVGISCalculator2023:
                 e_d = month_data["E_d"]
                 lines.append(f"       {month}月: {e_d:.2f}")
         
+        if self.results["failed_surfaces"]:
+            lines.append("")
+            lines.append("【计算失败的坡面】")
+            for name in self.results["failed_surfaces"]:
+                lines.append(f"  ✗ {name} (未计入总发电量)")
+        
         # 发电量总计
         lines.append("")
         lines.append("【发电量总计】")
@@ -479,6 +1085,12 @@ class PVGISCalculator2023:
             lines.append(f"  容量因子: {capacity_factor:.1f}%")
             lines.append(f"  单位容量发电量: {specific_yield:.0f} kWh/kWp/year")
         
+        if "generation_matrix_file" in self.results:
+            p50 = self.results["annual_p50_kwh_per_kwp"]
+            p90 = self.results["annual_p90_kwh_per_kwp"]
+            lines.append(f"  多年单位容量发电量 P50: {p50:.0f} kWh/kWp/year ({p50 * total_power:.0f} kWh)")
+            lines.append(f"  多年单位容量发电量 P90: {p90:.0f} kWh/kWp/year ({p90 * total_power:.0f} kWh)")
+        
         # 数据文件
         lines.append("")
         lines.append("【数据文件】")
@@ -486,8 +1098,16 @@ class PVGISCalculator2023:
             lines.append(f"  小时辐射数据(CSV): {self.results['hourly_radiation_file']}")
         if "hourly_radiation_json" in self.results:
             lines.append(f"  小时辐射数据(JSON): {self.results['hourly_radiation_json']}")
+        if "hourly_radiation_store" in self.results:
+            lines.append(f"  小时辐射数据(列存储): {self.results['hourly_radiation_store']}")
+        if "hourly_generation_file" in self.results:
+            lines.append(f"  各坡面小时发电数据(CSV): {self.results['hourly_generation_file']}")
+        if "hourly_generation_store" in self.results:
+            lines.append(f"  各坡面小时发电数据(列存储): {self.results['hourly_generation_store']}")
+        if "generation_matrix_file" in self.results:
+            lines.append(f"  多年P50/P90发电矩阵(JSON): {self.results['generation_matrix_file']}")
         
-        results_file = self._get_output_path("results_2023.json")
+        results_file = self._artifact_path("results_2023.json", "results")
         lines.append(f"  计算结果数据: {results_file}")
         lines.append(f"  报告文件: {self._get_output_path('report_2023.txt')}")
         
@@ -507,7 +1127,7 @@ class PVGISCalculator2023:
     
     def save_results(self):
         """保存计算结果为JSON"""
-        results_file = self._get_output_path("results_2023.json")
+        results_file = self._artifact_path("results_2023.json", "results")
         
         # 准备保存的数据（移除api_response以减小文件大小）
         save_data = {
@@ -515,8 +1135,19 @@ class PVGISCalculator2023:
             "location": self.results["location"],
             "panel_spec": self.results["panel_spec"],
             "total_annual_energy": self.results["total_annual_energy"],
+            "failed_surfaces": self.results["failed_surfaces"],
             "surfaces": []
         }
+        if "generation_matrix_file" in self.results:
+            save_data["generation_matrix_file"] = self.results["generation_matrix_file"]
+            save_data["annual_p50_kwh_per_kwp"] = self.results["annual_p50_kwh_per_kwp"]
+            save_data["annual_p90_kwh_per_kwp"] = self.results["annual_p90_kwh_per_kwp"]
+        if "yield_table_file" in self.results:
+            save_data["yield_table_file"] = self.results["yield_table_file"]
+        if "hourly_generation_store" in self.results:
+            save_data["hourly_generation_store"] = self.results["hourly_generation_store"]
+        # 写入本文件之前的运行指标（不含写本文件和产物存储的耗时）
+        save_data["metrics"] = self.metrics.to_dict()
         
         for surface in self.results["surfaces"]:
             surface_data = {
@@ -526,33 +1157,152 @@ class PVGISCalculator2023:
                 "tilt_angle": surface["tilt_angle"],
                 "azimuth": surface["azimuth"],
                 "annual_energy_kwh": surface["annual_energy_kwh"],
+                "specific_yield_kwh_per_kwp": surface["specific_yield_kwh_per_kwp"],
                 "monthly_energy": surface["monthly_energy"]
             }
             save_data["surfaces"].append(surface_data)
         
-        with open(results_file, 'w', encoding='utf-8') as f:
+        with open_artifact(results_file, 'w') as f:
             json.dump(save_data, f, indent=2, ensure_ascii=False)
         
         print(f"\n结果已保存到: {results_file}")
+        if self._incremental_enabled():
+            self._save_incremental_state()
         return results_file
     
+    # 记入运行清单的输出文件（results 中的字段）
+    ARTIFACT_RESULT_KEYS = (
+        "hourly_radiation_file", "hourly_radiation_json", "hourly_radiation_store",
+        "hourly_generation_file", "hourly_generation_store", "generation_matrix_file",
+    )
+    
+    def record_run(self, extra_files: Dict[str, str]) -> Dict:
+        """把本次运行的输出文件按内容哈希存入 <输出目录>/objects/（相同内容只保存一份，原路径为硬链接），
+        并在地点目录的 manifest.jsonl / latest.json 中记录本次运行
+        """
+        files = {key: self.results[key] for key in self.ARTIFACT_RESULT_KEYS if self.results.get(key)}
+        files.update({role: path for role, path in extra_files.items() if path})
+        
+        store = ArtifactStore(self.base_output_dir)
+        artifacts = {role: store.store(path) for role, path in files.items() if os.path.exists(path)}
+        entry = RunManifest(self.output_dir).record(
+            run_id=self.timestamp_suffix.lstrip("_") or self.results["timestamp"],
+            artifacts=artifacts,
+            summary={
+                "engine": self.config["calculation"]["engine"],
+                "total_annual_energy": self.results["total_annual_energy"],
+                "surfaces": len(self.results["surfaces"]),
+                "failed_surfaces": self.results["failed_surfaces"],
+            },
+        )
+        
+        stats = store.stats
+        print(f"产物存储: {stats['stored']} 个文件，新增 {stats['new']} 个对象，"
+              f"{stats['deduplicated']} 个与已有内容相同（节省 {stats['bytes_saved'] / 1024 / 1024:.2f} MB）")
+        return entry
+    
+    def _run_calculation_stages(self):
+        """顺序执行：小时辐射数据 → 各坡面发电量 → 逐小时发电曲线（可选） → 多年矩阵（可选）"""
+        # 1. 获取小时级辐射数据（查找表模式不访问网络，跳过）
+        if self._use_yield_table():
+            print("查找表模式: 跳过小时辐射数据下载")
+        else:
+            self._timed_stage("radiation", self.get_hourly_radiation_2023)()
+        
+        # 2. 计算各坡面发电量
+        self._timed_stage("surfaces", self.calculate_all_surfaces)()
+        
+        # 2a. 各坡面逐小时发电曲线（PVcalc 模式，可选）
+        if self._use_hourly_profile():
+            self._timed_stage("hourly_profile", self.calculate_hourly_profile)()
+        
+        # 2b. 多年 P50/P90 发电矩阵（可选）
+        if self.config["calculation"].get("multi_year", {}).get("enabled", False):
+            self._timed_stage("multi_year", self.calculate_generation_matrices)()
+    
+    def _timed_stage(self, name: str, func):
+        """包装一个计算阶段，执行时把耗时记入 metrics.stages[name]"""
+        def run_stage():
+            with self.metrics.stage(name):
+                return func()
+        return run_stage
+    
+    def _run_calculation_stages_pipelined(self):
+        """流水线执行：互不依赖的阶段同时进行，全部完成后再生成报告
+        
+        PVcalc 模式下小时辐射下载、各坡面请求和逐小时发电曲线（可选）同时进行；本地引擎需要辐照数据，
+        两者在同一线程内先后执行。多年矩阵与它们并行。
+        各阶段写入 self.results 的不同字段，客户端（缓存、限流、连接池）是线程安全的。
+        """
+        radiation = self._timed_stage("radiation", self.get_hourly_radiation_2023)
+        surfaces = self._timed_stage("surfaces", self.calculate_all_surfaces)
+        stages = []
+        if self._use_yield_table():
+            print("查找表模式: 跳过小时辐射数据下载")
+            stages.append(surfaces)
+        elif self._use_local_engine():
+            stages.append(lambda: (radiation(), surfaces()))
+        else:
+            stages.append(radiation)
+            stages.append(surfaces)
+            if self._use_hourly_profile():
+                stages.append(self._timed_stage("hourly_profile", self.calculate_hourly_profile))
+        if self.config["calculation"].get("multi_year", {}).get("enabled", False):
+            stages.append(self._timed_stage("multi_year", self.calculate_generation_matrices))
+        
+        if len(stages) == 1:
+            stages[0]()
+            return
+        
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+            futures = [executor.submit(bind(stage)) for stage in stages]
+            for future in futures:
+                future.result()
+        print(f"\n流水线计算耗时: {time.perf_counter() - start:.1f} 秒（{len(stages)} 个阶段并行）")
+    
     def run(self):
-        """运行完整的计算流程"""
+        """运行完整的计算流程
+        
+        calculation.pipelined 为 true 时互不依赖的阶段并行执行，默认按顺序执行。
+        各阶段耗时和 PVGIS 调用指标记入 self.metrics。
+        """
         print("="*60)
         print("屋顶光伏发电量计算程序 (2023年数据版本)")
         print("="*60)
         
-        # 1. 获取小时级辐射数据
-        self.get_hourly_radiation_2023()
-        
-        # 2. 计算各坡面发电量
-        self.calculate_all_surfaces()
-        
-        # 3. 生成报告
-        self.generate_report()
+        with self.metrics.activate():
+            if self.config["calculation"]["pipelined"]:
+                self._run_calculation_stages_pipelined()
+            else:
+                self._run_calculation_stages()
+            
+            # 3. 生成报告
+            report_file = self._timed_stage("report", self.generate_report)()
+            
+            # 4. 保存结果
+            results_file = self.save_results()
+            
+            # 5. 产物存入内容寻址存储并记录运行清单
+            if self.config["output"].get("artifact_store", True):
+                self.record_run({"report": report_file, "results": results_file})
         
-        # 4. 保存结果
-        self.save_results()
+        stats = self.client.cache_stats()
+        print(f"\nPVGIS缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次")
+        if stats["spatial_reuses"]:
+            print(f"  其中复用邻近地址的辐照数据 {stats['spatial_reuses']} 次")
+        self._print_metrics_summary()
+    
+    def _print_metrics_summary(self):
+        metrics = self.metrics.to_dict()
+        http = metrics["http"]["total"]
+        breakdown = metrics["time_breakdown"]
+        print(f"运行耗时: {metrics['wall_seconds']:.2f} 秒, 瓶颈: {metrics['bound'] or '-'}")
+        print(f"  网络 {breakdown['network_seconds']:.2f} 秒, 限流等待 {breakdown['rate_limit_wait_seconds']:.2f} 秒, "
+              f"读缓存 {breakdown['cache_read_seconds']:.2f} 秒, 写文件 {breakdown['file_write_seconds']:.2f} 秒, "
+              f"解析/计算 {breakdown['processing_seconds']:.2f} 秒")
+        print(f"  HTTP: {http['requests']} 次请求, 下载 {http['bytes_downloaded'] / 1024 / 1024:.2f} MB, "
+              f"重试 {http['retries']} 次, 错误 {http['errors']} 次")
 
 
 def main():
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+本地光伏发电量引擎（NumPy 向量化）
+只需一次 seriescalc 下载（components=1 的水平面直射/散射辐照、T2m、WS10m），
+即可在本地一次性算出所有坡面、全部小时的交流发电功率，不再逐坡面请求 PVcalc。
+
+计算模型（简化版，与 PVcalc 结果通常相差几个百分点）:
+  1. 太阳位置: NOAA 近似公式（UTC 时间）
+  2. 倾斜面辐照: 直射按入射角投影 + Martin-Ruiz 入射角损失；散射按各向同性天空模型；地面反射按反照率
+  3. 电池温度: Faiman 模型（PVGIS 晶硅参数 U0=26.9, U1=6.2）
+  4. 功率: P = Pnom × G/1000 × (1 + γ×(Tc-25)) × (1 - 系统损耗)
+"""
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+DEFAULT_ALBEDO = 0.2
+FAIMAN_U0 = 26.9          # W/m²K
+FAIMAN_U1 = 6.2           # W·s/m³K
+IAM_AR = 0.16             # Martin-Ruiz 入射角修正系数
+MIN_COS_ZENITH = 0.0175   # 太阳高度低于约1°时不计直射，避免投影发散
+
+# seriescalc (components=1) 中引擎需要的字段
+REQUIRED_FIELDS = ("time", "Gb(i)", "Gd(i)", "T2m", "WS10m")
+
+
+def parse_pvgis_times(times: Sequence[str]) -> Dict[str, np.ndarray]:
+    """解析 PVGIS 时间字符串 (YYYYMMDD:HHMM)，返回年/月/小时/分钟、年内日序和 datetime64 时间"""
+    digits = np.frombuffer("".join(times).encode("ascii"), dtype=np.uint8).reshape(-1, 13).astype(np.int32) - ord("0")
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    hour = digits[:, 9] * 10 + digits[:, 10]
+    minute = digits[:, 11] * 10 + digits[:, 12]
+
+    year_start = (year - 1970).astype("datetime64[Y]")
+    date = (year_start.astype("datetime64[M]") + (month - 1)).astype("datetime64[D]") + (day - 1)
+    day_of_year = (date - year_start.astype("datetime64[D]")).astype(np.int32) + 1
+    timestamp = date.astype("datetime64[m]") + hour * 60 + minute
+
+    return {
+        "year": year,
+        "month": month,
+        "hour": hour,
+        "minute": minute,
+        "day_of_year": day_of_year,
+        "timestamp": timestamp,
+    }
+
+
+def solar_position(day_of_year: np.ndarray, hour: np.ndarray, minute: np.ndarray,
+                   lat: float, lon: float) -> Dict[str, np.ndarray]:
+    """计算太阳天顶角余弦和方位角（NOAA 近似公式，输入为 UTC 时间）
+
+    方位角使用 PVGIS 约定：0°=南，-90°=东，90°=西。
+    """
+    hours = hour + minute / 60.0
+    gamma = 2 * np.pi / 365 * (day_of_year - 1 + (hours - 12) / 24)
+
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                       - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+            - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+            - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+
+    true_solar_minutes = hours * 60 + eqtime + 4 * lon
+    hour_angle = np.radians(true_solar_minutes / 4 - 180)
+    phi = np.radians(lat)
+
+    cos_zenith = np.sin(phi) * np.sin(decl) + np.cos(phi) * np.cos(decl) * np.cos(hour_angle)
+    cos_zenith = np.clip(cos_zenith, -1.0, 1.0)
+    # 以南为0、向西为正的方位角
+    azimuth = np.arctan2(np.sin(hour_angle),
+                         np.cos(hour_angle) * np.sin(phi) - np.tan(decl) * np.cos(phi))
+
+    return {"cos_zenith": cos_zenith, "azimuth": azimuth}
+
+
+class LocalPVEngine:
+    """基于一次 seriescalc 辐照下载的本地多坡面发电量引擎"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], lat: float, lon: float):
+        """columns 为按字段组织的小时数据（time 为 PVGIS 时间字符串，其余为数值数组）"""
+        missing = [name for name in REQUIRED_FIELDS if name not in columns]
+        if missing:
+            raise ValueError(f"辐照数据缺少字段 {missing}，seriescalc 请求需设置 components=1")
+
+        self.lat = lat
+        self.lon = lon
+        self.times = columns["time"]
+        parsed = parse_pvgis_times(self.times)
+        self.month = parsed["month"]
+        self.year = parsed["year"]
+        self.timestamp = parsed["timestamp"]
+
+        self.beam_h = np.asarray(columns["Gb(i)"], dtype=np.float64)
+        self.diffuse_h = np.asarray(columns["Gd(i)"], dtype=np.float64)
+        self.t2m = np.asarray(columns["T2m"], dtype=np.float64)
+        self.ws10m = np.asarray(columns["WS10m"], dtype=np.float64)
+
+        sun = solar_position(parsed["day_of_year"], parsed["hour"], parsed["minute"], lat, lon)
+        self.cos_zenith = sun["cos_zenith"]
+        self.sun_azimuth = sun["azimuth"]
+
+    @classmethod
+    def from_seriescalc(cls, data: Dict, lat: float, lon: float) -> "LocalPVEngine":
+        """从 seriescalc JSON 响应创建引擎"""
+        hourly = data["outputs"]["hourly"]
+        if not hourly:
+            raise ValueError("辐照数据为空")
+        columns = {"time": [record["time"] for record in hourly]}
+        for name in REQUIRED_FIELDS[1:]:
+            if name in hourly[0]:
+                columns[name] = np.fromiter((record[name] for record in hourly), dtype=np.float64, count=len(hourly))
+        return cls(columns, lat, lon)
+
+    @property
+    def n_hours(self) -> int:
+        return len(self.times)
+
+    def plane_of_array(self, tilt: np.ndarray, aspect: np.ndarray,
+                       albedo: float = DEFAULT_ALBEDO) -> np.ndarray:
+        """计算各坡面的倾斜面辐照度，返回形状 (坡面数, 小时数) 的 W/m² 数组"""
+        beta = np.radians(np.asarray(tilt, dtype=np.float64))[:, None]
+        gamma = np.radians(np.asarray(aspect, dtype=np.float64))[:, None]
+
+        cos_z = self.cos_zenith[None, :]
+        sin_z = np.sqrt(1 - cos_z ** 2)
+        cos_aoi = cos_z * np.cos(beta) + sin_z * np.sin(beta) * np.cos(self.sun_azimuth[None, :] - gamma)
+        cos_aoi = np.clip(cos_aoi, 0.0, 1.0)
+
+        sun_up = cos_z > MIN_COS_ZENITH
+        beam = np.where(sun_up, self.beam_h[None, :] * cos_aoi / np.where(sun_up, cos_z, 1.0), 0.0)
+        # Martin-Ruiz 入射角损失（只作用于直射）
+        iam = (1 - np.exp(-cos_aoi / IAM_AR)) / (1 - np.exp(-1 / IAM_AR))
+        beam *= iam
+
+        diffuse = self.diffuse_h[None, :] * (1 + np.cos(beta)) / 2
+        reflected = (self.beam_h + self.diffuse_h)[None, :] * albedo * (1 - np.cos(beta)) / 2
+
+        return beam + diffuse + reflected
+
+    def simulate(self, surfaces: List[Dict], system_loss: float,
+                 temperature_coefficient: float, albedo: float = DEFAULT_ALBEDO) -> Dict:
+        """一次性计算所有坡面
+
+        surfaces: [{"tilt": 倾角, "aspect": PVGIS方位角, "peak_power_kw": 装机容量}, ...]
+        temperature_coefficient: 功率温度系数 (%/°C)，如 -0.3
+        返回:
+          hourly_power_w: (坡面数, 小时数) 交流功率 W（小时数据即为每小时 Wh）
+          annual_energy_kwh: (坡面数,) 年均发电量
+          monthly_energy_kwh: (坡面数, 12) 月均发电量
+          monthly_days: (12,) 每月天数
+        """
+        tilt = np.array([s["tilt"] for s in surfaces], dtype=np.float64)
+        aspect = np.array([s["aspect"] for s in surfaces], dtype=np.float64)
+        peak_power_w = np.array([s["peak_power_kw"] for s in surfaces], dtype=np.float64)[:, None] * 1000
+
+        poa = self.plane_of_array(tilt, aspect, albedo)
+        cell_temp = self.t2m[None, :] + poa / (FAIMAN_U0 + FAIMAN_U1 * self.ws10m[None, :])
+        temp_factor = 1 + temperature_coefficient / 100 * (cell_temp - 25)
+
+        power = peak_power_w * poa / 1000 * temp_factor * (1 - system_loss / 100)
+        power = np.clip(power, 0.0, None)
+
+        # 按月汇总（多年数据取年均）
+        n_years = len(np.unique(self.year))
+        month_onehot = np.zeros((self.n_hours, 12))
+        month_onehot[np.arange(self.n_hours), self.month - 1] = 1
+        monthly_energy_kwh = power @ month_onehot / 1000 / n_years
+        monthly_days = month_onehot.sum(axis=0) / 24 / n_years
+
+        return {
+            "hourly_power_w": power,
+            "annual_energy_kwh": monthly_energy_kwh.sum(axis=1),
+            "monthly_energy_kwh": monthly_energy_kwh,
+            "monthly_days": monthly_days,
+        }
+
+
+def monthly_records(monthly_energy_kwh: np.ndarray, monthly_days: np.ndarray) -> List[Dict]:
+    """将单个坡面的月度发电量转换为与 PVcalc monthly.fixed 相同的结构"""
+    return [
+        {
+            "month": month + 1,
+            "E_d": float(monthly_energy_kwh[month] / monthly_days[month]) if monthly_days[month] else 0.0,
+            "E_m": float(monthly_energy_kwh[month]),
+        }
+        for month in range(12)
+    ]
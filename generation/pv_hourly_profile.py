@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+屋顶逐小时发电曲线（PVGIS 模型）
+每组朝向请求一次 1 kWp 的 seriescalc（pvcalculation=1），流式解析时只保留 P 列（W/kWp），
+按各坡面装机容量缩放得到各坡面逐小时交流功率，求和即屋顶 8760 小时曲线。
+与 PVcalc 一样，相同朝向的坡面只请求一次；请求经客户端缓存、限流和重试。
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from pv_yield import build_seriescalc_pv_params, surface_group_key
+from pvgis_stream import HourlyColumnCollector, read_seriescalc
+from run_metrics import bind
+
+
+def fetch_hourly_power_per_kwp(client, seriescalc_url: str, params: Dict) -> Dict:
+    """请求一组朝向的逐小时发电，返回 {"time": [...], "P": 每 kWp 的交流功率(W)}"""
+    collector = HourlyColumnCollector(["P"])
+    with client.stream_bytes(seriescalc_url, params, timeout=120) as chunks:
+        read_seriescalc(chunks, collector)
+    columns = collector.columns()
+    if not collector.times or "P" not in columns:
+        raise ValueError("seriescalc 响应中没有逐小时发电功率 P")
+    return {"time": columns["time"], "P": np.asarray(columns["P"], dtype=np.float64)}
+
+
+def roof_hourly_generation(client, seriescalc_url: str, lat: float, lon: float, surfaces: List[Dict],
+                           system_loss: float, year: int = 2023, max_workers: int = 4) -> Dict:
+    """各坡面及屋顶的逐小时交流功率
+
+    surfaces: [{"tilt", "aspect", "peak_power_kw"}, ...]，与 LocalPVEngine.simulate 相同。
+    返回 {"times": UTC 时间字符串, "hourly_power_w": (坡面数, 小时数) 数组, "requests": 请求的朝向组数}。
+    任一朝向失败时抛出异常（屋顶总量不能缺少坡面）；没有坡面时抛出 ValueError。
+    """
+    if not surfaces:
+        raise ValueError("没有坡面")
+
+    def group_key(spec: Dict):
+        return surface_group_key(lat, lon, spec["tilt"], spec["aspect"], system_loss, 0)
+
+    groups = {}
+    for spec in surfaces:
+        groups.setdefault(group_key(spec), spec)
+
+    def fetch(spec: Dict) -> Dict:
+        params = build_seriescalc_pv_params(lat, lon, spec["tilt"], spec["aspect"], system_loss, year)
+        return fetch_hourly_power_per_kwp(client, seriescalc_url, params)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as executor:
+        profiles = dict(zip(groups.keys(), executor.map(bind(fetch), groups.values())))
+
+    times = next(iter(profiles.values()))["time"]
+    if any(profile["time"] != times for profile in profiles.values()):
+        raise ValueError("各朝向 seriescalc 的时间序列不一致")
+
+    hourly_power_w = np.vstack([profiles[group_key(spec)]["P"] * spec["peak_power_kw"] for spec in surfaces])
+    return {"times": times, "hourly_power_w": hourly_power_w, "requests": len(groups)}
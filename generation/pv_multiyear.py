@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+多年辐照 → 月×小时 P50/P90 发电矩阵
+按年分块并发流式下载 seriescalc（components=1，只按列保留引擎需要的字段），
+每年下载完成后立即用本地引擎算出该年 12×24 的月均逐时发电量（每 kWp），
+原始小时数据随即释放。
+因此峰值内存只与并发线程数有关，与年份数无关。
+
+矩阵单位: kWh/kWp，即该月"平均一天"中该小时的发电量（本地时间，若时区可用）。
+P50 为各年的中位数；P90 为 90% 年份都能超过的值（第10百分位），逐格计算，偏保守。
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from pv_engine import DEFAULT_ALBEDO, REQUIRED_FIELDS, LocalPVEngine, parse_pvgis_times
+from pvgis_client import PVGISClient
+from pv_yield import build_seriescalc_params
+from pvgis_stream import HourlyColumnCollector, read_seriescalc
+from run_metrics import bind
+
+
+# PVGIS-SARAH3 覆盖的年份范围
+DEFAULT_START_YEAR = 2005
+DEFAULT_END_YEAR = 2023
+
+
+def month_hour_profile(times: List[str], power_w: np.ndarray,
+                       timezone_name: Optional[str] = None) -> np.ndarray:
+    """把逐小时功率 (W) 归约为 12×24 的月均逐时发电量 (kWh)
+
+    timezone_name 不为空时先把 UTC 时间转换为本地时间再按月/小时分组。
+    """
+    if timezone_name:
+        from timezone_utils import get_local_time_converter
+        times = get_local_time_converter(timezone_name).convert(times)
+    parsed = parse_pvgis_times(times)
+    cell = (parsed["month"] - 1) * 24 + parsed["hour"]
+
+    sums = np.bincount(cell, weights=power_w, minlength=288)
+    counts = np.bincount(cell, minlength=288)
+    profile = np.divide(sums, counts, out=np.zeros(288), where=counts > 0) / 1000
+    return profile.reshape(12, 24)
+
+
+def reduce_year(columns: Dict, lat: float, lon: float, surfaces: List[Dict], system_loss: float,
+                temperature_coefficient: float, albedo: float = DEFAULT_ALBEDO,
+                timezone_name: Optional[str] = None) -> Dict:
+    """单年小时数据（按列） → {"profile": 12×24 kWh/kWp, "annual_kwh_per_kwp": 年发电量}"""
+    capacity_kw = sum(s["peak_power_kw"] for s in surfaces)
+    engine = LocalPVEngine(columns, lat, lon)
+    output = engine.simulate(surfaces, system_loss, temperature_coefficient, albedo)
+
+    total_power_w = output["hourly_power_w"].sum(axis=0) / capacity_kw
+    return {
+        "profile": month_hour_profile(engine.times, total_power_w, timezone_name),
+        "annual_kwh_per_kwp": float(total_power_w.sum() / 1000),
+    }
+
+
+class MonthHourExceedance:
+    """逐年累积 12×24 矩阵并计算 P50/P90（只保留每年 288 个数，不保留小时数据）"""
+
+    def __init__(self):
+        self.profiles = {}
+        self.annual = {}
+
+    def add_year(self, year: int, reduced: Dict):
+        self.profiles[year] = reduced["profile"]
+        self.annual[year] = reduced["annual_kwh_per_kwp"]
+
+    @property
+    def years(self) -> List[int]:
+        return sorted(self.profiles)
+
+    def result(self) -> Dict:
+        if not self.profiles:
+            raise ValueError("没有任何年份的数据")
+        stack = np.stack([self.profiles[year] for year in self.years])
+        annual = np.array([self.annual[year] for year in self.years])
+        return {
+            "years": self.years,
+            "p50_kwh_per_kwp": np.percentile(stack, 50, axis=0).round(6).tolist(),
+            "p90_kwh_per_kwp": np.percentile(stack, 10, axis=0).round(6).tolist(),
+            "annual_kwh_per_kwp": {str(year): round(self.annual[year], 3) for year in self.years},
+            "annual_p50_kwh_per_kwp": round(float(np.percentile(annual, 50)), 3),
+            "annual_p90_kwh_per_kwp": round(float(np.percentile(annual, 10)), 3),
+        }
+
+
+def compute_generation_matrices(client: PVGISClient, seriescalc_url: str, lat: float, lon: float,
+                                surfaces: List[Dict], system_loss: float,
+                                temperature_coefficient: float, albedo: float = DEFAULT_ALBEDO,
+                                timezone_name: Optional[str] = None,
+                                start_year: int = DEFAULT_START_YEAR, end_year: int = DEFAULT_END_YEAR,
+                                max_workers: int = 4) -> Dict:
+    """按年并发下载并归约，返回 P50/P90 矩阵及失败年份
+
+    surfaces: [{"tilt", "aspect", "peak_power_kw"}, ...]，与 LocalPVEngine.simulate 相同。
+    下载和归约在同一个工作线程内完成，线程返回时只带回 12×24 矩阵。
+    """
+    def fetch_and_reduce(year: int) -> Dict:
+        collector = HourlyColumnCollector(REQUIRED_FIELDS)
+        with client.stream_bytes(seriescalc_url, build_seriescalc_params(lat, lon, year, components=True), timeout=120) as chunks:
+            read_seriescalc(chunks, collector)
+        if not collector.times:
+            raise ValueError("辐照数据为空")
+        return reduce_year(collector.columns(), lat, lon, surfaces, system_loss, temperature_coefficient,
+                           albedo, timezone_name)
+
+    years = list(range(start_year, end_year + 1))
+    accumulator = MonthHourExceedance()
+    failed_years = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(years)))) as executor:
+        futures = {executor.submit(bind(fetch_and_reduce), year): year for year in years}
+        for future in as_completed(futures):
+            year = futures[future]
+            try:
+                accumulator.add_year(year, future.result())
+                print(f"  ✓ {year} 年: {accumulator.annual[year]:.1f} kWh/kWp")
+            except Exception as e:
+                failed_years[str(year)] = f"{type(e).__name__}: {e}"
+                print(f"  ✗ {year} 年失败: {e}")
+
+    result = accumulator.result()
+    result["failed_years"] = failed_years
+    return result
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+单位容量(per-kWp)发电量工具
+PVcalc 的发电量与 peakpower 成正比，因此相同朝向的坡面只需请求一次 1 kWp 的结果，
+再按各坡面的装机容量缩放。
+"""
+
+import copy
+from typing import Dict, Tuple
+
+
+# 请求 PVcalc 时使用的参考装机容量
+NORMALIZED_PEAK_POWER_KW = 1.0
+
+
+def normalize_aspect(azimuth: float) -> float:
+    """将方位角转换为 PVGIS API 可接受的范围 (-180° 到 +180°)"""
+    while azimuth > 180:
+        azimuth -= 360
+    while azimuth <= -180:
+        azimuth += 360
+    return azimuth
+
+
+def surface_group_key(lat: float, lon: float, tilt: float, aspect: float,
+                      loss: float, degradation: float) -> Tuple:
+    """坡面分组键：这些参数相同的坡面，单位容量发电量完全相同"""
+    return (
+        round(float(lat), 6),
+        round(float(lon), 6),
+        round(float(tilt), 4),
+        round(normalize_aspect(float(aspect)), 4),
+        round(float(loss), 4),
+        round(float(degradation), 4),
+    )
+
+
+def build_pvcalc_params(lat: float, lon: float, tilt: float, aspect: float,
+                        loss: float, degradation: float,
+                        peak_power_kw: float = NORMALIZED_PEAK_POWER_KW) -> Dict:
+    """构造 PVcalc 请求参数（默认按 1 kWp 请求）"""
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "peakpower": peak_power_kw,
+        "loss": loss,
+        "angle": tilt,
+        "aspect": normalize_aspect(aspect),
+        "outputformat": "json"
+    }
+
+    # 添加衰减率参数
+    if degradation > 0:
+        params["pvtechchoice"] = "crystSi"
+        params["pv_degradation"] = degradation
+
+    return params
+
+
+def build_seriescalc_params(lat: float, lon: float, year: int = 2023, components: bool = False) -> Dict:
+    """构造单年 seriescalc 小时辐射请求参数（只要辐射数据，不计算PV）
+
+    components=True 时返回水平面直射/散射分量（本地引擎需要）。
+    计算器和缓存预取都用这里的参数，保证缓存键一致。
+    """
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "startyear": year,
+        "endyear": year,
+        "pvcalculation": 0,
+        "outputformat": "json"
+    }
+    if components:
+        params["components"] = 1
+    return params
+
+
+def build_seriescalc_pv_params(lat: float, lon: float, tilt: float, aspect: float, loss: float,
+                               year: int = 2023, peak_power_kw: float = NORMALIZED_PEAK_POWER_KW) -> Dict:
+    """构造单年 seriescalc 逐小时发电请求参数（pvcalculation=1，默认按 1 kWp 请求）
+
+    响应中每小时的 P 为交流功率(W)，与 peakpower 成正比，相同朝向的坡面只需请求一次。
+    """
+    return {
+        "lat": lat,
+        "lon": lon,
+        "startyear": year,
+        "endyear": year,
+        "pvcalculation": 1,
+        "peakpower": peak_power_kw,
+        "loss": loss,
+        "angle": tilt,
+        "aspect": normalize_aspect(aspect),
+        "outputformat": "json"
+    }
+
+
+def _is_energy_field(name: str) -> bool:
+    """E_d/E_m/E_y 及其标准差 SD_m/SD_y 与装机容量成正比；辐照量和损失百分比不变"""
+    return name.startswith("E_") or name.startswith("SD_")
+
+
+def _scale_record(record: Dict, factor: float) -> Dict:
+    return {
+        key: value * factor if _is_energy_field(key) and isinstance(value, (int, float)) else value
+        for key, value in record.items()
+    }
+
+
+def scale_pvcalc_output(data: Dict, peak_power_kw: float,
+                        reference_kw: float = NORMALIZED_PEAK_POWER_KW) -> Dict:
+    """将参考容量下的 PVcalc 响应缩放到指定装机容量，返回新的响应字典"""
+    factor = peak_power_kw / reference_kw
+    scaled = copy.deepcopy(data)
+    outputs = scaled.get("outputs", {})
+
+    if "totals" in outputs and "fixed" in outputs["totals"]:
+        outputs["totals"]["fixed"] = _scale_record(outputs["totals"]["fixed"], factor)
+    if "monthly" in outputs and "fixed" in outputs["monthly"]:
+        outputs["monthly"]["fixed"] = [
+            _scale_record(month, factor) for month in outputs["monthly"]["fixed"]
+        ]
+
+    if "inputs" in scaled and "pv_module" in scaled["inputs"]:
+        scaled["inputs"]["pv_module"]["peak_power"] = peak_power_kw
+
+    return scaled
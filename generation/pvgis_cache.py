@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+PVGIS API 响应磁盘缓存
+按 "接口地址 + 规范化参数" 做内容寻址，支持 TTL 过期、按容量的 LRU 淘汰和命中统计。
+缓存保存的是原始响应体（bytes），由调用方自行解析。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "PVGIS_CACHE_DIR", str(Path.home() / ".cache" / "pvgis")
+)
+DEFAULT_TTL_HOURS = 24 * 30        # PVGIS 历史数据基本不变，默认缓存30天
+DEFAULT_MAX_SIZE_MB = 512
+# 写入多少次后即使估计值未超限也重新扫描一次目录
+EVICTION_RESCAN_STORES = 256
+# 超限时淘汰到上限的这个比例，留出余量，缓存满时不会每次写入都扫描目录
+EVICTION_LOW_WATER = 0.9
+
+
+def normalize_params(params: Dict) -> Dict[str, str]:
+    """规范化请求参数，使等价的参数组合得到同一个键
+
+    - 去掉值为 None 的参数
+    - 布尔值转为 0/1
+    - 数字（包括查询字符串中的数字文本）保留6位小数并去掉多余的0（23.0、"23.0" 与 23 视为相同）
+    - 其余值转为字符串
+    """
+    normalized = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            text = str(int(value))
+        elif isinstance(value, (int, float)):
+            text = _format_number(value)
+        else:
+            text = str(value)
+            try:
+                text = _format_number(float(text))
+            except ValueError:
+                pass
+        normalized[str(key)] = text
+    return dict(sorted(normalized.items()))
+
+
+def _format_number(value: float) -> str:
+    text = f"{value:.6f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def make_request_key(endpoint: str, params: Dict) -> str:
+    """根据接口地址和规范化参数生成内容寻址键（sha256）"""
+    payload = json.dumps(
+        {"endpoint": endpoint, "params": normalize_params(params)},
+        sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PVGISResponseCache:
+    """PVGIS 响应缓存
+
+    每条缓存是 <目录>/<键前两位>/<键>.json 文件：
+    - 文件修改时间(mtime)作为写入时间，用于 TTL 判断
+    - 文件访问时间(atime)在每次命中时显式更新，用于 LRU 淘汰
+    不依赖额外的索引文件，多个进程可以共享同一个缓存目录。
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR,
+                 ttl_hours: float = DEFAULT_TTL_HOURS,
+                 max_size_mb: float = DEFAULT_MAX_SIZE_MB,
+                 enabled: bool = True):
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.ttl_seconds = ttl_hours * 3600 if ttl_hours else None
+        self.max_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0, "evictions": 0}
+        # 缓存总大小的估计值（上次扫描的结果加上之后写入的条目），超过上限或每隔
+        # EVICTION_RESCAN_STORES 次写入才重新扫描目录（其他进程也可能在写入）
+        self._estimated_bytes = None
+        self._stores_since_scan = 0
+
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cache_config: Optional[Dict]) -> "PVGISResponseCache":
+        """从配置文件的 pvgis.cache 段创建缓存"""
+        cache_config = cache_config or {}
+        return cls(
+            cache_dir=cache_config.get("directory", DEFAULT_CACHE_DIR),
+            ttl_hours=cache_config.get("ttl_hours", DEFAULT_TTL_HOURS),
+            max_size_mb=cache_config.get("max_size_mb", DEFAULT_MAX_SIZE_MB),
+            enabled=cache_config.get("enabled", True),
+        )
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _lookup(self, endpoint: str, params: Dict) -> Optional[Path]:
+        """返回未过期的缓存文件路径（并更新访问时间），未命中返回 None"""
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(make_request_key(endpoint, params))
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+
+        now = time.time()
+        if self.ttl_seconds is not None and now - stat.st_mtime > self.ttl_seconds:
+            self._count("expired")
+            self._count("misses")
+            self._remove(path)
+            return None
+
+        try:
+            # 显式更新访问时间，保留写入时间
+            os.utime(path, (now, stat.st_mtime))
+        except FileNotFoundError:
+            # 可能刚被其他进程淘汰
+            self._count("misses")
+            return None
+        return path
+
+    def contains(self, endpoint: str, params: Dict) -> bool:
+        """是否有未过期的缓存条目（只检查文件和 TTL，不计入命中统计、不更新访问时间）"""
+        if not self.enabled:
+            return False
+        try:
+            stat = self._entry_path(make_request_key(endpoint, params)).stat()
+        except FileNotFoundError:
+            return False
+        return self.ttl_seconds is None or time.time() - stat.st_mtime <= self.ttl_seconds
+
+    def get(self, endpoint: str, params: Dict) -> Optional[bytes]:
+        """读取缓存，未命中或已过期返回 None"""
+        path = self._lookup(endpoint, params)
+        if path is None:
+            return None
+        try:
+            body = path.read_bytes()
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return body
+
+    def open(self, endpoint: str, params: Dict) -> Optional[BinaryIO]:
+        """以二进制文件对象打开缓存条目（用于流式读取），未命中返回 None"""
+        path = self._lookup(endpoint, params)
+        if path is None:
+            return None
+        try:
+            reader = open(path, "rb")
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+
+        self._count("hits")
+        return reader
+
+    def put(self, endpoint: str, params: Dict, body: bytes):
+        """写入缓存（原子替换），并在超出容量时执行 LRU 淘汰"""
+        with self.writer(endpoint, params) as entry:
+            entry.write(body)
+            entry.commit()
+
+    def writer(self, endpoint: str, params: Dict) -> "CacheEntryWriter":
+        """流式写入缓存：边写边落盘到临时文件，commit() 后在退出时原子替换"""
+        if not self.enabled:
+            return CacheEntryWriter(self, None)
+        path = self._entry_path(make_request_key(endpoint, params))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return CacheEntryWriter(self, path)
+
+    def _stored(self, size: int = 0):
+        self._count("stores")
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            self._stores_since_scan += 1
+            if self._estimated_bytes is not None:
+                self._estimated_bytes += size
+            needs_scan = (self._estimated_bytes is None
+                          or self._estimated_bytes > self.max_bytes
+                          or self._stores_since_scan >= EVICTION_RESCAN_STORES)
+        if needs_scan:
+            self._evict()
+
+    def _remove(self, path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """扫描缓存目录，超过上限时按最近访问时间淘汰最旧的条目（淘汰到上限的 EVICTION_LOW_WATER），并校正大小估计值"""
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICTION_LOW_WATER
+            entries.sort(key=lambda e: e[0])
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                self._remove(path)
+                total -= size
+                self._count("evictions")
+
+        with self._lock:
+            self._estimated_bytes = total
+            self._stores_since_scan = 0
+
+    def clear(self):
+        """清空缓存目录中的所有条目"""
+        for path in self.cache_dir.glob("*/*.json"):
+            self._remove(path)
+        with self._lock:
+            self._estimated_bytes = 0
+
+    def stats(self) -> Dict:
+        """返回命中/未命中等计数"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+class CacheEntryWriter:
+    """单个缓存条目的流式写入器
+
+    只有调用了 commit() 且 with 块正常结束时才替换正式文件，
+    中途出错或响应不完整时丢弃临时文件，保证缓存中只有完整的响应。
+    """
+
+    def __init__(self, cache: PVGISResponseCache, path: Optional[Path]):
+        self.cache = cache
+        self.path = path
+        self._file = None
+        self._tmp_path = None
+        self._committed = False
+        self.stored = False
+
+    def __enter__(self) -> "CacheEntryWriter":
+        if self.path is not None:
+            self._tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            self._file = open(self._tmp_path, "wb")
+        return self
+
+    def write(self, data: bytes):
+        if self._file is not None:
+            self._file.write(data)
+
+    def commit(self):
+        self._committed = True
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._file is None:
+            return False
+        self._file.close()
+        if exc_type is None and self._committed:
+            size = os.path.getsize(self._tmp_path)
+            os.replace(self._tmp_path, self.path)
+            self.stored = True
+            self.cache._stored(size)
+        else:
+            self.cache._remove(self._tmp_path)
+        return False
@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+"""
+PVGIS API 客户端
+所有 PVGIS 调用（PVcalc / seriescalc）统一经过这里，以便共享响应缓存和限流器。
+同一进程内参数完全相同、且仍在进行中的请求只发起一次网络调用（single-flight），
+其余调用方等待并拿到同一个解析结果；流式请求的等待方从缓存条目（缓存关闭时从临时文件）读取响应体。
+每次调用的网络耗时、字节数、缓存命中和限流等待记入当前运行的指标（run_metrics）。
+启用空间索引时，seriescalc 请求可以复用容差范围内邻近地址的缓存响应。
+
+网络请求失败（连接错误、超时、429/5xx）时按带抖动的指数退避重试，重试次数受全局重试预算限制；
+连续失败达到阈值时熔断，熔断期间直接失败而不等待超时；可为整个批次设置总时间预算。
+"""
+
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pvgis_cache import PVGISResponseCache, make_request_key
+from run_metrics import record_http, timed_chunks
+from spatial_index import RadiationSpatialIndex
+
+
+DEFAULT_API_BASE_URL = "https://re.jrc.ec.europa.eu/api"
+
+# PVGIS 对每个IP限制为每秒30次请求，默认留出余量
+DEFAULT_REQUESTS_PER_SECOND = 25
+# 连接池大小（保持长连接的数量），应不小于并发线程数
+DEFAULT_POOL_SIZE = 10
+# 流式读取响应体的块大小
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 重试：每个请求最多重试次数、退避基数和上限（秒）
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_BACKOFF_SECONDS = 2
+DEFAULT_MAX_BACKOFF_SECONDS = 30
+# 重试预算：保底额度，以及每个请求补充的额度（重试次数长期不超过请求数的 20%）
+DEFAULT_RETRY_BUDGET = 10
+DEFAULT_RETRY_BUDGET_RATIO = 0.2
+# 熔断：连续失败次数阈值，熔断后多少秒放行一个试探请求
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_SECONDS = 30
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """PVGIS 连续失败已熔断，请求未发出"""
+
+
+class TimeBudgetExceeded(requests.exceptions.RequestException):
+    """总时间预算已用完，请求未发出"""
+
+
+def resolve_api_base_url(configured: Optional[str] = None) -> str:
+    """确定 PVGIS API 根地址：显式配置 > 环境变量 PVGIS_API_BASE_URL > 官方地址
+
+    指向本地替身服务器（pvgis_standin.py）即可离线运行和压测。
+    """
+    base_url = configured or os.environ.get("PVGIS_API_BASE_URL") or DEFAULT_API_BASE_URL
+    return base_url.rstrip("/")
+
+
+class TokenBucket:
+    """令牌桶限流器（线程安全）
+
+    以 rate 个/秒的速度补充令牌，最多积累 capacity 个；
+    acquire() 在没有令牌时阻塞等待。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """取一个令牌，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RetryPolicy:
+    """带完全抖动(full jitter)的指数退避：第 n 次重试前等待 0 ~ min(上限, 基数×2^n) 秒的随机时间
+
+    抖动使并发失败的请求不会在同一时刻一起重试；429/503 带 Retry-After 时至少等待该时间（不超过上限）。
+    """
+
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_seconds: float = DEFAULT_RETRY_BACKOFF_SECONDS,
+                 max_backoff_seconds: float = DEFAULT_MAX_BACKOFF_SECONDS):
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+    def delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        delay = random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * (2 ** attempt)))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.max_backoff_seconds))
+            except ValueError:
+                pass
+        return delay
+
+
+class RetryBudget:
+    """全局重试预算（线程安全）
+
+    额度上限为 capacity，每次重试消耗 1，每个新请求补充 ratio。
+    PVGIS 整体故障时，用完保底额度后重试次数被限制在请求数的 ratio 倍以内，不会成倍放大负载。
+    """
+
+    def __init__(self, capacity: float = DEFAULT_RETRY_BUDGET, ratio: float = DEFAULT_RETRY_BUDGET_RATIO):
+        self.capacity = float(capacity)
+        self.ratio = float(ratio)
+        self._balance = self.capacity
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._balance = min(self.capacity, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        """取一次重试额度，额度不足返回 False"""
+        with self._lock:
+            if self._balance >= 1:
+                self._balance -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """熔断器（线程安全）
+
+    连续 failure_threshold 次请求失败（连接错误、超时、5xx）后进入熔断状态，期间请求直接失败；
+    reset_seconds 秒后放行一个试探请求，成功则恢复，失败则继续熔断。
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_seconds: float = DEFAULT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """是否允许发出请求（熔断期满后只放行一个试探请求）"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                print("  ✓ PVGIS 试探请求得到响应，恢复正常请求")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    print(f"  ⚠️  PVGIS 连续失败 {self._failures} 次，熔断 {self.reset_seconds:.0f} 秒")
+                    self.trips += 1
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class _StreamSpool:
+    """缓存关闭时，领头的流式请求把响应体写入临时文件，等待中的相同请求读取该文件
+
+    领头请求和每个等待方各持有一个引用，最后一个释放时删除临时文件。
+    """
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix="pvgis_stream_", suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+        self.complete = False
+        self._references = 1
+        self._lock = threading.Lock()
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+
+    def commit(self):
+        """响应体已完整写出"""
+        self._file.close()
+        self.complete = True
+
+    def acquire(self):
+        with self._lock:
+            self._references += 1
+
+    def release(self):
+        self._file.close()
+        with self._lock:
+            self._references -= 1
+            last = self._references == 0
+        if last:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class PVGISClient:
+    """带磁盘缓存、限流、连接池、重试和熔断的 PVGIS 客户端，可在多个线程间共享"""
+
+    def __init__(self, cache: Optional[PVGISResponseCache] = None,
+                 rate_limiter: Optional[TokenBucket] = None,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 spatial_index: Optional[RadiationSpatialIndex] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 retry_budget: Optional[RetryBudget] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 time_budget_seconds: Optional[float] = None):
+        self.cache = cache if cache is not None else PVGISResponseCache(enabled=False)
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget()
+        # 为 None 时不熔断
+        self.circuit_breaker = circuit_breaker
+        self.set_time_budget(time_budget_seconds)
+        # 空间索引依赖缓存，缓存关闭时不使用
+        self.spatial_index = spatial_index if self.cache.enabled else None
+        self.spatial_reuses = 0
+
+        # 共享 Session 复用 TCP/TLS 连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # 进行中的请求：请求键 → Future
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self.coalesced_requests = 0
+
+    @classmethod
+    def from_config(cls, pvgis_config: Optional[Dict]) -> "PVGISClient":
+        """从配置文件的 pvgis 段创建客户端
+
+        max_retries 未设置时沿用旧配置项 surface_retries。
+        """
+        pvgis_config = pvgis_config or {}
+        rate = pvgis_config.get("requests_per_second", DEFAULT_REQUESTS_PER_SECOND)
+        cache = PVGISResponseCache.from_config(pvgis_config.get("cache"))
+        breaker_config = pvgis_config.get("circuit_breaker") or {}
+        return cls(
+            cache=cache,
+            rate_limiter=TokenBucket(rate) if rate else None,
+            pool_size=max(DEFAULT_POOL_SIZE, pvgis_config.get("max_workers", 1)),
+            spatial_index=RadiationSpatialIndex.from_config(pvgis_config.get("spatial_index"), cache.cache_dir),
+            retry_policy=RetryPolicy(
+                max_retries=pvgis_config.get("max_retries", pvgis_config.get("surface_retries", DEFAULT_MAX_RETRIES)),
+                backoff_seconds=pvgis_config.get("retry_backoff_seconds", DEFAULT_RETRY_BACKOFF_SECONDS),
+                max_backoff_seconds=pvgis_config.get("max_backoff_seconds", DEFAULT_MAX_BACKOFF_SECONDS),
+            ),
+            retry_budget=RetryBudget(
+                capacity=pvgis_config.get("retry_budget", DEFAULT_RETRY_BUDGET),
+                ratio=pvgis_config.get("retry_budget_ratio", DEFAULT_RETRY_BUDGET_RATIO),
+            ),
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=breaker_config.get("failure_threshold", DEFAULT_FAILURE_THRESHOLD),
+                reset_seconds=breaker_config.get("reset_seconds", DEFAULT_RESET_SECONDS),
+            ) if breaker_config.get("enabled", True) else None,
+            time_budget_seconds=pvgis_config.get("time_budget_seconds"),
+        )
+
+    def set_time_budget(self, seconds: Optional[float]):
+        """从现在起的总时间预算（秒）：用完后不再发起网络请求，单次请求的超时也不超过剩余时间；None 为不限制"""
+        self._deadline = time.monotonic() + seconds if seconds else None
+
+    def _remaining_time(self) -> Optional[float]:
+        return self._deadline - time.monotonic() if self._deadline is not None else None
+
+    def _request(self, url: str, params: Dict, timeout: float, stream: bool = False) -> requests.Response:
+        """发起网络请求：限流、熔断、时间预算、带抖动的指数退避重试
+
+        返回最后一次的响应（4xx 等不可重试的错误由调用方 raise_for_status）；
+        连接错误、超时和可重试状态码在重试用完后抛出。熔断或预算用完时抛出
+        CircuitOpenError / TimeBudgetExceeded（均为 requests 异常，调用方按网络错误处理）。
+        """
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None and not self.circuit_breaker.allow():
+                record_http(url, rejected=1)
+                raise CircuitOpenError(f"PVGIS 熔断中，跳过请求: {url}")
+            remaining = self._remaining_time()
+            if remaining is not None and remaining <= 0:
+                record_http(url, rejected=1)
+                raise TimeBudgetExceeded(f"时间预算已用完，跳过请求: {url}")
+            request_timeout = min(timeout, remaining) if remaining is not None else timeout
+
+            self._acquire_rate_limit(url)
+            start = time.perf_counter()
+            response = None
+            # 每次请求的结果都必须报告给熔断器，否则试探请求一直处于"进行中"，熔断永远不会恢复
+            breaker_resolved = False
+            try:
+                try:
+                    response = self.session.get(url, params=params, timeout=request_timeout, stream=stream)
+                    if response.status_code in RETRYABLE_STATUS_CODES:
+                        # 先读出错误响应体，调用方可以在连接关闭后打印
+                        _ = response.content
+                        response.raise_for_status()
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        requests.exceptions.HTTPError) as e:
+                    failure = e
+                else:
+                    failure = None
+                record_http(url, requests=1, errors=1 if failure else 0,
+                            network_seconds=time.perf_counter() - start)
+
+                if self.circuit_breaker is not None:
+                    # 429 说明服务正常、只是请求过快：不计入失败，试探请求收到 429 时同样恢复
+                    if failure is None or (response is not None and response.status_code == 429):
+                        self.circuit_breaker.record_success()
+                    else:
+                        self.circuit_breaker.record_failure()
+                breaker_resolved = True
+            finally:
+                # 其他异常（如 ChunkedEncodingError）按失败处理后继续抛出
+                if self.circuit_breaker is not None and not breaker_resolved:
+                    self.circuit_breaker.record_failure()
+
+            if failure is None:
+                return response
+
+            delay = self.retry_policy.delay(attempt, response)
+            remaining = self._remaining_time()
+            if (attempt >= self.retry_policy.max_retries
+                    or (remaining is not None and delay >= remaining)
+                    or not self.retry_budget.withdraw()):
+                raise failure
+            if response is not None:
+                response.close()
+            attempt += 1
+            record_http(url, retries=1)
+            reason = f"HTTP {response.status_code}" if response is not None else type(failure).__name__
+            print(f"  ↻ PVGIS 请求失败（{reason}），{delay:.1f}秒后重试 ({attempt}/{self.retry_policy.max_retries})")
+            time.sleep(delay)
+
+    def get_json(self, url: str, params: Dict, timeout: float = 30) -> Dict:
+        """GET 请求并解析 JSON；命中缓存时不发起网络请求
+
+        相同请求正在进行时直接等待其结果（返回同一个字典，调用方不应原地修改）。
+        网络或 HTTP 错误按 requests 的异常抛出，由调用方处理。
+        """
+        key = make_request_key(url, params)
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.coalesced_requests += 1
+
+        if not is_leader:
+            record_http(url, coalesced=1)
+            print(f"  ✓ 相同请求正在进行，等待其结果")
+            return future.result()
+
+        try:
+            data = self._fetch_json(url, params, timeout)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(data)
+            return data
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+
+    def _fetch_json(self, url: str, params: Dict, timeout: float) -> Dict:
+        start = time.perf_counter()
+        body = self._read_cached(url, params, self.cache.get)
+        if body is not None:
+            record_http(url, cache_read_seconds=time.perf_counter() - start, bytes_from_cache=len(body))
+            return json.loads(body)
+
+        response = self._request(url, params, timeout)
+        record_http(url, bytes_downloaded=len(response.content))
+        if response.status_code >= 400:
+            record_http(url, errors=1)
+        response.raise_for_status()
+
+        data = response.json()
+        # 只缓存能正常解析的响应
+        self.cache.put(url, params, response.content)
+        self._index_cached(url, params)
+        return data
+
+    def _read_cached(self, url: str, params: Dict, read):
+        """读取缓存（read 为 cache.get 或 cache.open）；先查空间索引中最近的邻近地址
+
+        邻近条目已不在缓存中时将其从索引移除，再按原始参数查找。
+        """
+        if self.spatial_index is not None and self.spatial_index.applies_to(url):
+            match = self.spatial_index.nearest(url, params)
+            if match is not None:
+                neighbour_params, distance = match
+                cached = read(url, neighbour_params)
+                if cached is not None:
+                    if distance > 0:
+                        with self._in_flight_lock:
+                            self.spatial_reuses += 1
+                        record_http(url, spatial_reuses=1)
+                        print(f"  ✓ 复用 {distance:.2f} km 外邻近地址的缓存辐照数据，跳过 API 请求")
+                    else:
+                        print(f"  ✓ 命中本地缓存，跳过 API 请求")
+                    record_http(url, cache_hits=1)
+                    return cached
+                self.spatial_index.remove(url, neighbour_params)
+                if distance == 0:
+                    record_http(url, cache_misses=1)
+                    return None
+
+        cached = read(url, params)
+        if cached is not None:
+            print(f"  ✓ 命中本地缓存，跳过 API 请求")
+            # 索引建立之前写入的缓存条目在命中时补充到索引中
+            self._index_cached(url, params)
+            record_http(url, cache_hits=1)
+        elif self.cache.enabled:
+            record_http(url, cache_misses=1)
+        return cached
+
+    def _is_cached(self, url: str, params: Dict) -> bool:
+        """缓存（或空间索引中的邻近地址）是否已有该请求的数据；不影响命中统计、LRU 顺序和运行指标"""
+        if self.spatial_index is not None and self.spatial_index.applies_to(url):
+            match = self.spatial_index.nearest(url, params)
+            if match is not None and self.cache.contains(url, match[0]):
+                return True
+        return self.cache.contains(url, params)
+
+    def _acquire_rate_limit(self, url: str):
+        if self.rate_limiter is not None:
+            record_http(url, rate_limit_wait_seconds=self.rate_limiter.acquire())
+
+    def _index_cached(self, url: str, params: Dict):
+        if self.spatial_index is not None and self.spatial_index.applies_to(url):
+            self.spatial_index.add(url, params)
+
+    @contextmanager
+    def stream_bytes(self, url: str, params: Dict, timeout: float = 30,
+                     chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Iterator[bytes]]:
+        """以字节块流式读取响应体（用于 seriescalc 这类大响应，配合 pvgis_stream 解析）
+
+        命中缓存时直接从缓存文件读取；否则边下载边写入缓存，
+        只有 with 块正常结束且响应完整读完时才提交缓存条目。
+        相同的流式请求正在进行时等待其完成：启用缓存时从缓存读取，缓存关闭时从其写出的临时文件读取；
+        进行中的请求失败时再自行请求。
+        """
+        key = "stream:" + make_request_key(url, params)
+        future = None
+        spool = None
+        with self._in_flight_lock:
+            leader_future = self._in_flight.get(key)
+            if leader_future is None:
+                future = Future()
+                future.spool = None if self.cache.enabled else _StreamSpool()
+                self._in_flight[key] = future
+            else:
+                self.coalesced_requests += 1
+                spool = getattr(leader_future, "spool", None)
+                if spool is not None:
+                    spool.acquire()
+        if leader_future is not None:
+            record_http(url, coalesced=1)
+            print(f"  ✓ 相同请求正在进行，等待其完成")
+            leader_future.exception()
+
+        try:
+            if spool is not None and spool.complete:
+                with open(spool.path, 'rb') as f:
+                    yield iter(lambda: f.read(chunk_size), b"")
+                return
+
+            reader = self._read_cached(url, params, self.cache.open)
+            if reader is not None:
+                with reader:
+                    yield timed_chunks(iter(lambda: reader.read(chunk_size), b""), url,
+                                       "cache_read_seconds", "bytes_from_cache")
+                return
+
+            response = self._request(url, params, timeout, stream=True)
+            try:
+                if response.status_code >= 400:
+                    # 先读出错误响应体，调用方可以在连接关闭后打印
+                    _ = response.content
+                    record_http(url, errors=1)
+                response.raise_for_status()
+                body = timed_chunks(response.iter_content(chunk_size), url, "network_seconds", "bytes_downloaded")
+                if future is not None and future.spool is not None:
+                    yield self._tee_to_cache(body, future.spool)      # 缓存关闭：写入临时文件供等待方读取
+                    return
+                with self.cache.writer(url, params) as entry:
+                    yield self._tee_to_cache(body, entry)
+                if entry.stored:
+                    self._index_cached(url, params)
+            finally:
+                response.close()
+        finally:
+            if spool is not None:
+                spool.release()
+            if future is not None:
+                with self._in_flight_lock:
+                    del self._in_flight[key]
+                future.set_result(None)
+                if future.spool is not None:
+                    future.spool.release()
+
+    def prefetch(self, url: str, params: Dict, timeout: float = 120, stream: bool = False) -> bool:
+        """预取请求到缓存（已缓存或空间索引中有邻近数据时不请求），返回是否实际发起了请求
+
+        stream=True 时按流式请求下载（大响应不进内存），与 stream_bytes 的调用方共享缓存条目。
+        """
+        if self._is_cached(url, params):
+            return False
+        if stream:
+            with self.stream_bytes(url, params, timeout=timeout) as chunks:
+                for _ in chunks:
+                    pass
+        else:
+            self.get_json(url, params, timeout=timeout)
+        return True
+
+    @staticmethod
+    def _tee_to_cache(chunks: Iterator[bytes], entry) -> Iterator[bytes]:
+        """逐块转发响应体并写入缓存条目（或临时文件）；完整读完后才标记为可提交"""
+        for chunk in chunks:
+            entry.write(chunk)
+            yield chunk
+        entry.commit()
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+    def cache_stats(self) -> Dict:
+        """返回缓存命中统计（含合并到进行中请求的次数、复用邻近地址缓存的次数、熔断次数）"""
+        stats = self.cache.stats()
+        stats["coalesced"] = self.coalesced_requests
+        stats["spatial_reuses"] = self.spatial_reuses
+        stats["circuit_trips"] = self.circuit_breaker.trips if self.circuit_breaker is not None else 0
+        return stats
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+PVGIS 缓存预取守护进程
+报价流程在用户请求设计前几小时就知道地址。守护进程监视待处理坐标队列（JSONL）
+和/或布局数据目录（layout 解析/data/*/final.json），以低速率把计算器将要发出的
+seriescalc 和 PVcalc 请求提前下载到共享的响应缓存中，交互式计算时直接命中缓存。
+
+用法:
+    python3 pvgis_prefetch.py --config config_australia.json --watch-dir "../layout 解析/data"
+    python3 pvgis_prefetch.py --config config_australia.json --queue prefetch_queue.jsonl --rate 1
+    python3 pvgis_prefetch.py --config config_australia.json --queue prefetch_queue.jsonl --once
+
+    # 向队列追加一个坐标（其他程序也可以直接追加 JSON 行）
+    python3 pvgis_prefetch.py enqueue prefetch_queue.jsonl -42.752 147.275
+
+队列每行一个 JSON:
+    {"lat": -42.752, "lon": 147.275}                                  只预取小时辐射数据
+    {"lat": ..., "lon": ..., "surfaces": [{"tilt": 23, "aspect": -55.6}]}  另外预取各朝向的 1 kWp PVcalc
+    完整的计算器配置（location + roof_surfaces）                       与计算器的请求完全一致
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from pv_yield import (
+    build_pvcalc_params, build_seriescalc_params, build_seriescalc_pv_params, normalize_aspect, surface_group_key
+)
+from pvgis_client import PVGISClient, resolve_api_base_url
+
+
+DEFAULT_PREFETCH_RATE = 2.0       # 次/秒，远低于 PVGIS 的 30 次/秒上限，给交互式计算留出余量
+DEFAULT_POLL_SECONDS = 60
+DEFAULT_STATE_FILE = "prefetch_state.json"
+MAX_ATTEMPTS = 3
+DEFAULT_TILT = 23
+
+
+def enqueue(queue_file: str, entry: Dict):
+    """向队列追加一条记录（整行写入，守护进程只读取完整的行）"""
+    with open(queue_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def site_from_entry(entry: Dict) -> Dict:
+    """队列记录 → 站点 {"latitude", "longitude", "surfaces", 可选 "system_loss"/"annual_degradation"}"""
+    if "location" in entry:
+        # 完整的计算器配置
+        site = {
+            "latitude": entry["location"]["latitude"],
+            "longitude": entry["location"]["longitude"],
+            "surfaces": [
+                {"tilt": s.get("tilt_angle") if s.get("tilt_angle") is not None else DEFAULT_TILT,
+                 "aspect": s["azimuth"]}
+                for s in entry.get("roof_surfaces", [])
+            ],
+        }
+        if "system_loss" in entry:
+            site["system_loss"] = entry["system_loss"]
+        if "annual_degradation" in entry.get("panel_spec", {}):
+            site["annual_degradation"] = entry["panel_spec"]["annual_degradation"]
+        return site
+    lat = entry.get("lat", entry.get("latitude"))
+    lon = entry.get("lon", entry.get("longitude"))
+    if not isinstance(lat, (int, float)) or not isinstance(lon, (int, float)):
+        raise ValueError(f"缺少有效的坐标: {entry}")
+    return {"latitude": lat, "longitude": lon, "surfaces": entry.get("surfaces", [])}
+
+
+def site_from_final_json(path: Path) -> Dict:
+    """布局 final.json → 站点
+
+    面板朝向按 convert_config_for_pvgis.py 的规则从方位（0°=北，顺时针）换算为 PVGIS aspect（0°=南），
+    坡度由弧度换算为角度（保留一位小数）。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f).get("data", {})
+
+    surfaces = []
+    for design in data.get("designs") or []:
+        layout = json.loads(design.get("layout") or "{}")
+        for panel in layout.get("panelLocationInfos", []):
+            surfaces.append({
+                "tilt": round(math.degrees(panel.get("slope", 0)), 1),
+                "aspect": normalize_aspect(180.0 - panel.get("aspect", 0)),
+            })
+    return {"latitude": data["latitude"], "longitude": data["longitude"], "surfaces": surfaces}
+
+
+class PrefetchDaemon:
+    """轮询队列和布局目录，把新地址的请求预取到缓存"""
+
+    def __init__(self, client: PVGISClient, base_config: Dict, api_base_url: str,
+                 queue_file: Optional[str] = None, watch_dir: Optional[str] = None,
+                 state_file: Optional[str] = None, engine: Optional[str] = None):
+        self.client = client
+        self.base_config = base_config
+        self.seriescalc_url = f"{api_base_url}/seriescalc"
+        self.pvcalc_url = f"{api_base_url}/PVcalc"
+        self.queue_file = queue_file
+        self.watch_dir = Path(watch_dir) if watch_dir else None
+        # 按计算器将使用的引擎决定预取哪些请求
+        self.engine = engine or base_config.get("calculation", {}).get("engine", "pvcalc")
+
+        self.state_file = Path(state_file or os.path.join(client.cache.cache_dir, DEFAULT_STATE_FILE))
+        self.state = {"queue_offset": 0, "seen_files": {}, "retry": []}
+        if self.state_file.exists():
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self.state.update(json.load(f))
+
+        self.stats = {"sites": 0, "fetched": 0, "cached": 0, "failed": 0}
+
+    def _save_state(self):
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_file.with_name(self.state_file.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def _read_queue(self) -> List[Tuple[str, Dict]]:
+        """读取队列中新追加的完整行，返回 [(来源, 站点)]"""
+        if not self.queue_file or not os.path.exists(self.queue_file):
+            return []
+        sites = []
+        with open(self.queue_file, 'rb') as f:
+            f.seek(self.state["queue_offset"])
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 生产者尚未写完这一行，下次再读
+                    break
+                self.state["queue_offset"] += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    sites.append((f"queue:{self.state['queue_offset']}", site_from_entry(json.loads(line))))
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"  ✗ 忽略无法解析的队列记录: {e}")
+        return sites
+
+    def _scan_watch_dir(self) -> List[Tuple[str, Dict]]:
+        """扫描布局目录中新增或修改过的 final.json"""
+        if self.watch_dir is None or not self.watch_dir.exists():
+            return []
+        sites = []
+        for path in sorted(self.watch_dir.glob("**/final.json")):
+            mtime = path.stat().st_mtime
+            if self.state["seen_files"].get(str(path)) == mtime:
+                continue
+            try:
+                sites.append((str(path), site_from_final_json(path)))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"  ✗ 无法解析 {path}: {e}")
+            self.state["seen_files"][str(path)] = mtime
+        return sites
+
+    def jobs_for_site(self, site: Dict) -> List[Tuple[str, Dict, bool]]:
+        """站点 → [(URL, 参数, 是否流式)]，参数与计算器发出的请求完全相同"""
+        lat, lon = site["latitude"], site["longitude"]
+        jobs = []
+        if self.engine in ("pvcalc", "local"):
+            jobs.append((self.seriescalc_url,
+                         build_seriescalc_params(lat, lon, 2023, components=self.engine == "local"), True))
+
+        if self.engine == "pvcalc":
+            loss = site.get("system_loss", self.base_config["system_loss"])
+            degradation = site.get("annual_degradation", self.base_config["panel_spec"]["annual_degradation"])
+            groups = {}
+            for surface in site["surfaces"]:
+                key = surface_group_key(lat, lon, surface["tilt"], surface["aspect"], loss, degradation)
+                groups.setdefault(key, surface)
+            for surface in groups.values():
+                jobs.append((self.pvcalc_url,
+                             build_pvcalc_params(lat, lon, surface["tilt"], surface["aspect"], loss, degradation), False))
+            # calculation.hourly_profile: 各朝向的逐小时发电曲线
+            if self.base_config.get("calculation", {}).get("hourly_profile", False):
+                for surface in groups.values():
+                    jobs.append((self.seriescalc_url,
+                                 build_seriescalc_pv_params(lat, lon, surface["tilt"], surface["aspect"], loss), True))
+        return jobs
+
+    def prefetch_site(self, source: str, site: Dict) -> bool:
+        """预取一个站点的全部请求，返回是否全部成功"""
+        print(f"\n预取 {source} ({site['latitude']}, {site['longitude']})")
+        ok = True
+        for url, params, stream in self.jobs_for_site(site):
+            try:
+                if self.client.prefetch(url, params, stream=stream):
+                    self.stats["fetched"] += 1
+                    print(f"  ✓ 已下载 {url.rsplit('/', 1)[-1]}")
+                else:
+                    self.stats["cached"] += 1
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self.stats["failed"] += 1
+                ok = False
+                print(f"  ✗ {url.rsplit('/', 1)[-1]} 预取失败: {e}")
+        self.stats["sites"] += 1
+        return ok
+
+    def run_once(self) -> int:
+        """处理一轮新地址（含上一轮失败待重试的），返回处理的站点数"""
+        retry = [(entry["source"], entry["site"], entry["attempts"]) for entry in self.state["retry"]]
+        pending = retry + [(source, site, 0) for source, site in self._read_queue() + self._scan_watch_dir()]
+        self.state["retry"] = []
+
+        for source, site, attempts in pending:
+            if not self.prefetch_site(source, site):
+                if attempts + 1 < MAX_ATTEMPTS:
+                    self.state["retry"].append({"source": source, "site": site, "attempts": attempts + 1})
+                else:
+                    print(f"  ✗ {source} 已重试 {MAX_ATTEMPTS} 次，放弃")
+            self._save_state()
+        self._save_state()
+        return len(pending)
+
+    def run_forever(self, poll_seconds: float = DEFAULT_POLL_SECONDS):
+        print(f"预取守护进程已启动（引擎: {self.engine}，每 {poll_seconds:.0f} 秒检查一次，Ctrl-C 退出）")
+        try:
+            while True:
+                if self.run_once():
+                    print(f"累计: {self.stats['sites']} 个站点, 下载 {self.stats['fetched']} 次, "
+                          f"已缓存 {self.stats['cached']} 次, 失败 {self.stats['failed']} 次")
+                time.sleep(poll_seconds)
+        except KeyboardInterrupt:
+            print("\n预取守护进程已停止")
+
+
+def main():
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "enqueue":
+        parser = argparse.ArgumentParser(description='向预取队列追加坐标')
+        parser.add_argument('command')
+        parser.add_argument('queue')
+        parser.add_argument('lat', type=float)
+        parser.add_argument('lon', type=float)
+        args = parser.parse_args()
+        enqueue(args.queue, {"lat": args.lat, "lon": args.lon})
+        print(f"✓ 已加入队列: {args.queue}")
+        return
+
+    parser = argparse.ArgumentParser(description='PVGIS 缓存预取守护进程')
+    parser.add_argument('--config', default='config_australia.json',
+                        help='计算器配置文件（pvgis 缓存设置、系统损耗、衰减率、计算引擎）')
+    parser.add_argument('--queue', default=None, help='待处理坐标队列（JSONL，追加写入）')
+    parser.add_argument('--watch-dir', default=None, help='布局数据目录（监视其中的 final.json）')
+    parser.add_argument('--rate', type=float, default=DEFAULT_PREFETCH_RATE, help='请求速率上限（次/秒）')
+    parser.add_argument('--interval', type=float, default=DEFAULT_POLL_SECONDS, help='轮询间隔（秒）')
+    parser.add_argument('--engine', choices=['pvcalc', 'local'], default=None,
+                        help='按哪种计算引擎预取（默认取配置文件 calculation.engine）')
+    parser.add_argument('--state-file', default=None, help='进度文件，默认为缓存目录下的 prefetch_state.json')
+    parser.add_argument('--once', action='store_true', help='只处理一轮后退出')
+    args = parser.parse_args()
+
+    if not args.queue and not args.watch_dir:
+        parser.error("需要 --queue 或 --watch-dir")
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    pvgis_config = dict(config.get("pvgis", {}))
+    pvgis_config["requests_per_second"] = args.rate
+    client = PVGISClient.from_config(pvgis_config)
+    if not client.cache.enabled:
+        print("✗ 响应缓存未启用，预取没有意义（请设置 pvgis.cache.enabled）")
+        return
+
+    daemon = PrefetchDaemon(
+        client, config, resolve_api_base_url(pvgis_config.get("api_base_url")),
+        queue_file=args.queue, watch_dir=args.watch_dir, state_file=args.state_file, engine=args.engine
+    )
+    try:
+        if args.once:
+            daemon.run_once()
+            print(f"\n完成: {daemon.stats['sites']} 个站点, 下载 {daemon.stats['fetched']} 次, "
+                  f"已缓存 {daemon.stats['cached']} 次, 失败 {daemon.stats['failed']} 次")
+        else:
+            daemon.run_forever(args.interval)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
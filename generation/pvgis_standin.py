@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+PVGIS 本地替身服务器
+离线回放录制好的 PVcalc / seriescalc 响应，可注入延迟和错误，用于回归测试和压测。
+
+回放:
+    python3 pvgis_standin.py --fixtures fixtures/ --port 8080
+    PVGIS_API_BASE_URL=http://127.0.0.1:8080/api python3 pv_calculator_2023.py config_australia.json
+
+录制（未命中的请求转发到官方 API，并把响应保存为 fixture）:
+    python3 pvgis_standin.py --fixtures fixtures/ --port 8080 --record
+
+注入延迟和错误:
+    python3 pvgis_standin.py --fixtures fixtures/ --latency-ms 300 --latency-jitter-ms 100 \\
+        --error-rate 0.1 --error-codes 429,503
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlparse
+
+import requests
+
+from pvgis_cache import make_request_key, normalize_params
+from pvgis_client import DEFAULT_API_BASE_URL
+
+
+SUPPORTED_ENDPOINTS = ("PVcalc", "seriescalc")
+
+
+class FixtureStore:
+    """fixture 目录：<目录>/<接口名>/<请求键>.json，请求键与响应缓存使用相同的参数规范化规则"""
+
+    def __init__(self, fixtures_dir: str):
+        self.fixtures_dir = Path(fixtures_dir)
+
+    def _path(self, endpoint: str, params: Dict) -> Path:
+        return self.fixtures_dir / endpoint / f"{make_request_key(endpoint, params)}.json"
+
+    def load(self, endpoint: str, params: Dict) -> Optional[bytes]:
+        path = self._path(endpoint, params)
+        return path.read_bytes() if path.exists() else None
+
+    def save(self, endpoint: str, params: Dict, body: bytes):
+        path = self._path(endpoint, params)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+        # 旁边保存一份请求参数，便于人工查看 fixture 对应的请求
+        meta_path = path.with_suffix(".params.json")
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(normalize_params(params), f, indent=2, ensure_ascii=False)
+
+
+class StandinConfig:
+    """替身服务器行为配置"""
+
+    def __init__(self, fixtures: FixtureStore, latency_ms: float = 0, latency_jitter_ms: float = 0,
+                 error_rate: float = 0, error_codes: List[int] = None,
+                 record: bool = False, upstream_url: str = DEFAULT_API_BASE_URL):
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.error_codes = error_codes or [503]
+        self.record = record
+        self.upstream_url = upstream_url.rstrip("/")
+        self.random = random.Random()
+        self.stats = {"requests": 0, "replayed": 0, "recorded": 0, "missing": 0, "injected_errors": 0}
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def sample_latency(self) -> float:
+        """按正态分布采样延迟（秒），不小于0"""
+        with self._lock:
+            delay_ms = self.random.gauss(self.latency_ms, self.latency_jitter_ms) if self.latency_jitter_ms else self.latency_ms
+        return max(0.0, delay_ms) / 1000
+
+    def sample_error(self) -> Optional[int]:
+        """按错误率决定是否返回错误状态码"""
+        with self._lock:
+            if self.error_rate > 0 and self.random.random() < self.error_rate:
+                return self.random.choice(self.error_codes)
+        return None
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """处理 /api/<接口名>?... 请求（也兼容 /api/v5_2/<接口名> 这类带版本的路径）"""
+
+    server_version = "PVGISStandin/1.0"
+    standin: StandinConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error_json(self, status: int, message: str):
+        self._send(status, json.dumps({"status": status, "message": message}).encode("utf-8"))
+
+    @staticmethod
+    def _is_json(body: bytes) -> bool:
+        """只录制能正常解析的响应"""
+        try:
+            json.loads(body)
+            return True
+        except ValueError:
+            return False
+
+    def do_GET(self):
+        standin = self.standin
+        url = urlparse(self.path)
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+
+        if endpoint == "_stats":
+            with standin._lock:
+                body = json.dumps(standin.stats).encode("utf-8")
+            self._send(200, body)
+            return
+
+        if endpoint not in SUPPORTED_ENDPOINTS:
+            self._send_error_json(404, f"unknown endpoint: {endpoint}")
+            return
+
+        standin.count("requests")
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+
+        time.sleep(standin.sample_latency())
+
+        error_status = standin.sample_error()
+        if error_status is not None:
+            standin.count("injected_errors")
+            self._send_error_json(error_status, "injected error")
+            return
+
+        body = standin.fixtures.load(endpoint, params)
+        if body is not None:
+            standin.count("replayed")
+            self._send(200, body)
+            return
+
+        if not standin.record:
+            standin.count("missing")
+            self._send_error_json(404, f"no fixture for {endpoint} {normalize_params(params)}")
+            return
+
+        # 录制模式：转发到上游并保存
+        try:
+            response = requests.get(f"{standin.upstream_url}/{endpoint}", params=params, timeout=120)
+        except requests.exceptions.RequestException as e:
+            self._send_error_json(502, f"upstream request failed: {e}")
+            return
+
+        if response.status_code == 200 and self._is_json(response.content):
+            standin.fixtures.save(endpoint, params, response.content)
+            standin.count("recorded")
+        self._send(response.status_code, response.content,
+                   response.headers.get("Content-Type", "application/json"))
+
+
+def create_server(config: StandinConfig, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    """创建替身服务器（未启动），port=0 时由系统分配端口"""
+    handler = type("BoundStandinHandler", (StandinHandler,), {"standin": config})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PVGIS 本地替身服务器（回放/录制）')
+    parser.add_argument('--fixtures', default='fixtures', help='fixture 目录')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=0, help='平均响应延迟（毫秒）')
+    parser.add_argument('--latency-jitter-ms', type=float, default=0, help='延迟标准差（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0, help='注入错误的概率 (0-1)')
+    parser.add_argument('--error-codes', default='503', help='注入的错误状态码，逗号分隔')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，便于复现')
+    parser.add_argument('--record', action='store_true', help='录制模式：未命中时转发到上游并保存')
+    parser.add_argument('--upstream', default=DEFAULT_API_BASE_URL, help='录制模式的上游 API 地址')
+    args = parser.parse_args()
+
+    config = StandinConfig(
+        fixtures=FixtureStore(args.fixtures),
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        error_codes=[int(code) for code in args.error_codes.split(',') if code.strip()],
+        record=args.record,
+        upstream_url=args.upstream,
+    )
+    if args.seed is not None:
+        config.random.seed(args.seed)
+
+    server = create_server(config, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"PVGIS 替身服务器已启动: http://{host}:{port}/api")
+    print(f"  fixture目录: {args.fixtures}")
+    print(f"  模式: {'录制 (上游 ' + config.upstream_url + ')' if args.record else '回放'}")
+    if args.latency_ms or args.latency_jitter_ms:
+        print(f"  延迟: {args.latency_ms}±{args.latency_jitter_ms} ms")
+    if args.error_rate:
+        print(f"  错误注入: {args.error_rate:.0%} → {config.error_codes}")
+    print(f"  统计: http://{host}:{port}/api/_stats")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
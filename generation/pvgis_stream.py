@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+seriescalc 响应的流式解析
+HTTP 响应体按块读入，outputs.hourly 中的记录逐条解析后立即交给调用方
+（写 CSV、按列收集、累加统计），不再整体保存响应文本和解析后的字典列表。
+内存占用与请求的小时数无关。
+
+用法:
+    with client.stream_bytes(url, params) as chunks:
+        stream = SeriescalcStream(chunks)
+        for record in stream:
+            ...
+        stream.document   # 除 hourly 外的其余字段（inputs、meta 等），hourly 为空列表
+"""
+
+import codecs
+import json
+import re
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO
+
+
+HOURLY_ARRAY_PATTERN = re.compile(r'"hourly"\s*:\s*\[')
+_WHITESPACE_AND_COMMAS = " \t\r\n,"
+
+
+class SeriescalcStream:
+    """把响应体字节块解析为 outputs.hourly 记录的迭代器（只能迭代一次）"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = chunks
+        self.count = 0
+        self.document = None
+
+    def __iter__(self) -> Iterator[Dict]:
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        prefix = None
+        suffix_parts = []
+        in_array = True
+
+        for chunk in self._chunks:
+            buffer += text_decoder.decode(chunk)
+
+            if prefix is None:
+                match = HOURLY_ARRAY_PATTERN.search(buffer)
+                if match is None:
+                    continue
+                prefix = buffer[:match.end()]
+                buffer = buffer[match.end():]
+
+            if not in_array:
+                suffix_parts.append(buffer)
+                buffer = ""
+                continue
+
+            position = 0
+            while True:
+                while position < len(buffer) and buffer[position] in _WHITESPACE_AND_COMMAS:
+                    position += 1
+                if position == len(buffer):
+                    break
+                if buffer[position] == "]":
+                    in_array = False
+                    suffix_parts.append(buffer[position:])
+                    position = len(buffer)
+                    break
+                try:
+                    record, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # 记录跨越了块边界，等待下一块
+                    break
+                position = end
+                self.count += 1
+                yield record
+            buffer = buffer[position:]
+
+        buffer += text_decoder.decode(b"", final=True)
+        if prefix is None:
+            raise ValueError("API 返回数据格式不符合预期：缺少 outputs.hourly")
+        if in_array:
+            raise ValueError(f"响应不完整：outputs.hourly 在第 {self.count} 条记录后中断")
+
+        suffix_parts.append(buffer)
+        self.document = json.loads(prefix + "".join(suffix_parts))
+
+
+class HourlyColumnCollector:
+    """按列收集小时记录（时间为字符串列表，数值为 array('d')），比字典列表紧凑得多"""
+
+    def __init__(self, fields: Sequence[str]):
+        self.times = []
+        self.fields = [name for name in fields if name != "time"]
+        self.values = {name: array("d") for name in self.fields}
+
+    def add(self, record: Dict):
+        self.times.append(record["time"])
+        for name in self.fields:
+            if name in record:
+                self.values[name].append(record[name])
+
+    def columns(self) -> Dict:
+        """返回 {"time": [...], 字段: array}，缺失的字段不返回"""
+        columns = {"time": self.times}
+        for name in self.fields:
+            if len(self.values[name]) == len(self.times):
+                columns[name] = self.values[name]
+        return columns
+
+
+def _nested_json(value: Any, level: int) -> str:
+    """缩进格式的 JSON 片段，用于嵌入到逐段写出的 JSON 文件中"""
+    return json.dumps(value, indent=2, ensure_ascii=False).replace("\n", "\n" + " " * level)
+
+
+class SeriescalcJSONWriter:
+    """逐批写出 seriescalc 风格的 JSON 文件（hourly 每条记录一行）
+
+    extra 中的字段（请求参数等）写在开头；finish() 写入 hourly 之外的其余字段并闭合文件。
+    """
+
+    def __init__(self, f: TextIO, extra: Optional[Dict] = None):
+        self.f = f
+        f.write('{\n')
+        for key, value in (extra or {}).items():
+            f.write(f'  {json.dumps(key)}: {_nested_json(value, 2)},\n')
+        f.write('  "outputs": {\n    "hourly": [')
+        self._separator = '\n      '
+
+    def write_records(self, records: Iterable[Dict]):
+        for record in records:
+            self.f.write(self._separator + json.dumps(record, ensure_ascii=False))
+            self._separator = ',\n      '
+
+    def finish(self, document: Dict):
+        """document 为 SeriescalcStream.document（outputs 的其余字段以及 inputs、meta 等）"""
+        self.f.write('\n    ]')
+        for key, value in document.get("outputs", {}).items():
+            if key != "hourly":
+                self.f.write(f',\n    {json.dumps(key)}: {_nested_json(value, 4)}')
+        self.f.write('\n  }')
+        for key, value in document.items():
+            if key != "outputs":
+                self.f.write(f',\n  {json.dumps(key)}: {_nested_json(value, 2)}')
+        self.f.write('\n}\n')
+
+
+def iter_batches(records: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    """把记录流切成固定大小的批次（最后一批可能较小）"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_seriescalc(chunks: Iterable[bytes], collector: Optional[HourlyColumnCollector] = None) -> Dict:
+    """读取整个响应；若给出 collector 则只按列收集 hourly，返回的文档中 hourly 为空列表"""
+    stream = SeriescalcStream(chunks)
+    for record in stream:
+        if collector is not None:
+            collector.add(record)
+    return stream.document
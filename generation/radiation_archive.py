@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+小时辐射数据归档（跨站点、跨年份）
+把各次运行写在 output/lat_*_lon_*/ 下的小时辐射数据按"站点 × 月份"切成块，存为列存储（.pvcol），
+并在 index.jsonl 中记录每块的站点、时间范围和字段。查询时先查索引，只打开需要的块：
+
+    archive = RadiationArchive("radiation_archive")
+    archive.add_output_dir("output")                                   # 导入已有的运行结果
+    archive.site_hours(-41.1677, 146.3473, "2023-07-01", "2023-07-31")  # 某站点一段时间的所有小时
+    archive.hours_across_sites(month=7, hour=12, fields=["G(i)"])       # 所有站点 7 月正午的辐照度
+
+目录结构:
+    <归档目录>/index.jsonl                        每块一行，同一站点同一月份以最后一行为准
+    <归档目录>/chunks/lat_*_lon_*/YYYYMM.pvcol    按 UTC 月份切分的块（含 time、local_time 和数值列）
+
+重新导入同一站点同一年份时覆盖对应的块，不会重复计数。
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import threading
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from artifact_io import COMPRESSION_SUFFIXES, open_artifact
+from artifact_store import location_dir_name
+from hourly_store import (FILE_SUFFIX, NUMPY_SUPPORT, TIME_COLUMNS, HourlyColumnStore,
+                          minutes_to_pvgis_time, pvgis_time_to_minutes, write_hourly_columns)
+
+if NUMPY_SUPPORT:
+    import numpy as np
+
+INDEX_FILE = "index.jsonl"
+CHUNKS_DIR = "chunks"
+
+_LOCATION_DIR = re.compile(r"lat_([\d.]+)([NS])_lon_([\d.]+)([EW])")
+# 同一进程内多个线程（批量模式）向同一索引追加时串行化
+_index_locks: Dict[str, threading.Lock] = {}
+_index_locks_guard = threading.Lock()
+
+
+def _index_lock(path: Path) -> threading.Lock:
+    with _index_locks_guard:
+        return _index_locks.setdefault(str(path.resolve()), threading.Lock())
+
+
+def parse_location_dir_name(name: str) -> Optional[Tuple[float, float]]:
+    """lat_41.1677S_lon_146.3473E → (-41.1677, 146.3473)；不是地点目录时返回 None"""
+    match = _LOCATION_DIR.fullmatch(name)
+    if not match:
+        return None
+    lat = float(match.group(1)) * (-1 if match.group(2) == "S" else 1)
+    lon = float(match.group(3)) * (-1 if match.group(4) == "W" else 1)
+    return lat, lon
+
+
+def parse_time(value: str, end: bool = False) -> int:
+    """时间字符串 → 自 1970-01-01 起的分钟数
+
+    支持 "2023-07-01"、"2023-07-01 12:00" 和 PVGIS 的 "20230701:1210"；
+    end=True 且只给出日期时取当天最后一分钟（结束日期包含当天）。
+    """
+    value = value.strip()
+    for fmt in ("%Y%m%d:%H%M", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M"):
+        try:
+            moment = datetime.strptime(value, fmt)
+            return pvgis_time_to_minutes([moment.strftime("%Y%m%d:%H%M")])[0]
+        except ValueError:
+            continue
+    day = datetime.strptime(value, "%Y-%m-%d")
+    minutes = pvgis_time_to_minutes([day.strftime("%Y%m%d:0000")])[0]
+    return minutes + 1439 if end else minutes
+
+
+def _month_runs(times: Sequence[str]) -> Iterator[Tuple[str, int, int]]:
+    """按时间字符串的年月（前 6 位）把连续的行分段，返回 (YYYYMM, 起始行, 结束行)"""
+    start = 0
+    for i in range(1, len(times) + 1):
+        if i == len(times) or times[i][:6] != times[start][:6]:
+            yield times[start][:6], start, i
+            start = i
+
+
+class RadiationArchive:
+    """按站点和月份分块的小时辐射归档"""
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = Path(archive_dir)
+        self.index_path = self.archive_dir / INDEX_FILE
+        self._index = None
+        self.stats = {"chunks_written": 0, "chunks_read": 0}
+
+    # ------------------------------------------------------------------ 写入
+
+    def add_columns(self, lat: float, lon: float, columns: Dict[str, Sequence],
+                    source: Optional[str] = None) -> int:
+        """归档一个站点的小时数据（time 为 UTC 的 PVGIS 时间字符串，可带 local_time），返回写出的块数"""
+        times = list(columns["time"])
+        if not times:
+            return 0
+        local_times = list(columns["local_time"]) if "local_time" in columns else None
+        site = location_dir_name(lat, lon)
+        site_dir = self.archive_dir / CHUNKS_DIR / site
+        site_dir.mkdir(parents=True, exist_ok=True)
+
+        entries = []
+        for month, start, end in _month_runs(times):
+            chunk = {"time": times[start:end]}
+            if local_times is not None:
+                chunk["local_time"] = local_times[start:end]
+            for name, values in columns.items():
+                if name not in TIME_COLUMNS:
+                    chunk[name] = values[start:end]
+
+            path = site_dir / f"{month}{FILE_SUFFIX}"
+            write_hourly_columns(str(path), chunk, {"site": site, "latitude": lat, "longitude": lon, "source": source})
+            minutes = pvgis_time_to_minutes([chunk["time"][0], chunk["time"][-1]])
+            entry = {
+                "site": site,
+                "latitude": lat,
+                "longitude": lon,
+                "chunk": month,
+                "path": str(path.relative_to(self.archive_dir)),
+                "start": minutes[0],
+                "end": minutes[1],
+                "n_rows": end - start,
+                "columns": list(chunk),
+                "source": source,
+            }
+            if local_times is not None:
+                local_minutes = pvgis_time_to_minutes([chunk["local_time"][0], chunk["local_time"][-1]])
+                entry["local_start"], entry["local_end"] = local_minutes[0], local_minutes[1]
+                entry["local_months"] = sorted({t[:6] for t in chunk["local_time"]})
+            entries.append(entry)
+
+        with _index_lock(self.index_path):
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+            if self._index is not None:
+                for entry in entries:
+                    self._index[(entry["site"], entry["chunk"])] = entry
+        self.stats["chunks_written"] += len(entries)
+        return len(entries)
+
+    def add_store(self, path: str) -> int:
+        """导入小时辐射列存储（hourly_radiation_2023_*.pvcol）"""
+        with HourlyColumnStore(path) as store:
+            params = store.metadata.get("request_params", {})
+            if "lat" not in params or "lon" not in params:
+                location = parse_location_dir_name(Path(path).parent.name)
+                if location is None:
+                    raise ValueError(f"{path} 的元数据中没有坐标")
+                params = {"lat": location[0], "lon": location[1]}
+            # 复制数值列，关闭文件后不再引用内存映射
+            columns = {name: values if isinstance(values, list) else (values.copy() if NUMPY_SUPPORT else array("d", values))
+                       for name, values in store.columns().items()}
+        return self.add_columns(float(params["lat"]), float(params["lon"]), columns, source=str(path))
+
+    def add_csv(self, path: str, lat: Optional[float] = None, lon: Optional[float] = None) -> int:
+        """导入小时辐射 CSV（hourly_radiation_2023_*.csv，可为 .csv.gz / .csv.xz）；未给出坐标时从所在的地点目录名解析"""
+        if lat is None or lon is None:
+            location = parse_location_dir_name(Path(path).parent.name)
+            if location is None:
+                raise ValueError(f"无法从 {path} 的目录名确定坐标，请指定 lat/lon")
+            lat, lon = location
+        with open_artifact(path, 'r', newline='') as f:
+            reader = csv.reader(f)
+            headers = next(reader)
+            columns = {name: ([] if name in TIME_COLUMNS else array("d")) for name in headers}
+            for row in reader:
+                for name, value in zip(headers, row):
+                    columns[name].append(value if name in TIME_COLUMNS else float(value))
+        return self.add_columns(lat, lon, columns, source=str(path))
+
+    def add_output_dir(self, output_dir: str) -> Dict[str, int]:
+        """导入输出目录下所有地点的小时辐射数据（有列存储时用列存储，否则读 CSV；按修改时间先旧后新）"""
+        summary = {"files": 0, "chunks": 0, "failed": 0}
+        for location_dir in sorted(Path(output_dir).glob("lat_*_lon_*")):
+            stores = sorted(location_dir.glob(f"hourly_radiation_*{FILE_SUFFIX}"), key=os.path.getmtime)
+            csvs = sorted((path for suffix in ("", *COMPRESSION_SUFFIXES.values())
+                           for path in location_dir.glob(f"hourly_radiation_*.csv{suffix}")), key=os.path.getmtime)
+            for path in stores or csvs:
+                try:
+                    summary["chunks"] += self.add_store(str(path)) if path.suffix == FILE_SUFFIX else self.add_csv(str(path))
+                    summary["files"] += 1
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"警告: 无法导入 {path}: {e}")
+                    summary["failed"] += 1
+        return summary
+
+    # ------------------------------------------------------------------ 索引
+
+    def index(self) -> Dict[Tuple[str, str], Dict]:
+        """(站点, YYYYMM) → 索引记录（同一块以最后一次写入为准）"""
+        if self._index is None:
+            index = {}
+            if self.index_path.exists():
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        index[(entry["site"], entry["chunk"])] = entry
+            self._index = index
+        return self._index
+
+    def sites(self) -> List[Dict]:
+        """归档中的站点：坐标、块数、小时数和时间范围"""
+        sites = {}
+        for entry in self.index().values():
+            site = sites.setdefault(entry["site"], {
+                "site": entry["site"], "latitude": entry["latitude"], "longitude": entry["longitude"],
+                "chunks": 0, "hours": 0, "start": entry["start"], "end": entry["end"],
+            })
+            site["chunks"] += 1
+            site["hours"] += entry["n_rows"]
+            site["start"] = min(site["start"], entry["start"])
+            site["end"] = max(site["end"], entry["end"])
+        for site in sites.values():
+            site["start"], site["end"] = minutes_to_pvgis_time([site["start"], site["end"]])
+        return sorted(sites.values(), key=lambda site: site["site"])
+
+    # ------------------------------------------------------------------ 查询
+
+    def _read_chunk(self, entry: Dict, fields: Optional[Sequence[str]], select) -> Dict:
+        """读取一块，select(store) 返回要保留的行（numpy 布尔掩码或行号列表）"""
+        self.stats["chunks_read"] += 1
+        with HourlyColumnStore(str(self.archive_dir / entry["path"])) as store:
+            rows = select(store)
+            names = [name for name in store.names if fields is None or name in fields or name in TIME_COLUMNS]
+            # 按行选取后得到副本，不再引用内存映射，块可以立即关闭
+            result = {name: self._select_rows(store.column(name), rows, name in TIME_COLUMNS) for name in names}
+        return result
+
+    @staticmethod
+    def _select_rows(values, rows, is_time: bool):
+        if NUMPY_SUPPORT:
+            values = values[rows]
+            return minutes_to_pvgis_time(values.view("<i8")) if is_time else values
+        values = [values[i] for i in rows]
+        return minutes_to_pvgis_time(values) if is_time else values
+
+    @staticmethod
+    def _concat(parts: List[Dict]) -> Dict:
+        names = [name for name in parts[0] if all(name in part for part in parts)] if parts else []
+        if NUMPY_SUPPORT:
+            return {name: (sum((part[name] for part in parts), []) if name in TIME_COLUMNS
+                           else np.concatenate([part[name] for part in parts])) for name in names}
+        return {name: sum((part[name] for part in parts), []) for name in names}
+
+    def site_hours(self, lat: float, lon: float, start: str, end: str,
+                   fields: Optional[Sequence[str]] = None, local: bool = False) -> Dict:
+        """某站点 [start, end] 内的所有小时（结束时间包含在内）
+
+        local=True 时按本地时间（local_time 列）筛选；返回 {列名: 值}，时间列为 PVGIS 时间字符串。
+        """
+        site = location_dir_name(lat, lon)
+        start_minutes, end_minutes = parse_time(start), parse_time(end, end=True)
+        time_column = "local_time" if local else "time"
+        start_key, end_key = ("local_start", "local_end") if local else ("start", "end")
+
+        def select(store):
+            minutes = store.column(time_column)
+            if NUMPY_SUPPORT:
+                minutes = minutes.view("<i8")
+                return (minutes >= start_minutes) & (minutes <= end_minutes)
+            return [i for i, m in enumerate(minutes) if start_minutes <= m <= end_minutes]
+
+        parts = []
+        for (entry_site, _), entry in sorted(self.index().items()):
+            if entry_site != site or start_key not in entry:
+                continue
+            if entry[start_key] <= end_minutes and entry[end_key] >= start_minutes:
+                parts.append(self._read_chunk(entry, fields, select))
+        return self._concat(parts)
+
+    def hours_across_sites(self, month: int, hour: Optional[int] = None,
+                           fields: Optional[Sequence[str]] = None, local: bool = True,
+                           year: Optional[int] = None) -> Dict[str, Dict]:
+        """所有站点某月（可选某小时、某年）的数据，返回 {站点: {列名: 值}}
+
+        默认按本地时间筛选（"7 月正午"指当地时间）；没有 local_time 列的块按 UTC 筛选。
+        """
+        wanted_month = f"{month:02d}"
+
+        def select_for(time_column):
+            def select(store):
+                minutes = store.column(time_column)
+                if NUMPY_SUPPORT:
+                    stamps = minutes.view("<i8").astype("datetime64[m]")
+                    months = stamps.astype("datetime64[M]").astype(int)
+                    mask = months % 12 + 1 == month
+                    if year is not None:
+                        mask &= months // 12 + 1970 == year
+                    if hour is not None:
+                        mask &= (stamps - stamps.astype("datetime64[D]")).astype(int) // 60 == hour
+                    return mask
+                times = minutes_to_pvgis_time(minutes)
+                return [i for i, t in enumerate(times)
+                        if t[4:6] == wanted_month and (year is None or int(t[:4]) == year)
+                        and (hour is None or int(t[9:11]) == hour)]
+            return select
+
+        results = {}
+        for (site, chunk), entry in sorted(self.index().items()):
+            use_local = local and "local_months" in entry
+            months = entry["local_months"] if use_local else [chunk]
+            if not any(m[4:6] == wanted_month and (year is None or int(m[:4]) == year) for m in months):
+                continue
+            part = self._read_chunk(entry, fields, select_for("local_time" if use_local else "time"))
+            results.setdefault(site, []).append(part)
+        return {site: self._concat(parts) for site, parts in results.items()}
+
+
+def _write_csv(path: str, columns_by_site: Dict[str, Dict]):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = None
+        for site, columns in columns_by_site.items():
+            names = list(columns)
+            if writer is None:
+                writer = csv.writer(f)
+                writer.writerow(["site", *names])
+            for row in zip(*(columns[name] for name in names)):
+                writer.writerow([site, *row])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='小时辐射数据归档（按站点和月份分块）')
+    parser.add_argument('--archive', default='radiation_archive', help='归档目录（默认: radiation_archive）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help='导入输出目录或单个 .pvcol/.csv 文件')
+    add_parser.add_argument('paths', nargs='+')
+
+    subparsers.add_parser('sites', help='列出归档中的站点')
+
+    site_parser = subparsers.add_parser('site', help='某站点一段时间的所有小时')
+    site_parser.add_argument('--lat', type=float, required=True)
+    site_parser.add_argument('--lon', type=float, required=True)
+    site_parser.add_argument('--start', required=True, help='开始时间，如 2023-07-01 或 "2023-07-01 06:00"')
+    site_parser.add_argument('--end', required=True, help='结束时间（包含），如 2023-07-31')
+    site_parser.add_argument('--local', action='store_true', help='按本地时间筛选')
+
+    slice_parser = subparsers.add_parser('slice', help='所有站点某月（某小时）的数据')
+    slice_parser.add_argument('--month', type=int, required=True)
+    slice_parser.add_argument('--hour', type=int)
+    slice_parser.add_argument('--year', type=int)
+    slice_parser.add_argument('--utc', action='store_true', help='按 UTC 时间筛选（默认按本地时间）')
+
+    for sub in (site_parser, slice_parser):
+        sub.add_argument('--fields', nargs='+', help='只读取这些列（如 "G(i)" T2m）')
+        sub.add_argument('--csv', help='把结果写入 CSV 文件')
+
+    args = parser.parse_args()
+    archive = RadiationArchive(args.archive)
+
+    if args.command == 'add':
+        for path in args.paths:
+            if os.path.isdir(path):
+                summary = archive.add_output_dir(path)
+                print(f"✓ {path}: 导入 {summary['files']} 个文件，{summary['chunks']} 个块"
+                      + (f"，{summary['failed']} 个失败" if summary['failed'] else ""))
+            else:
+                chunks = archive.add_store(path) if path.endswith(FILE_SUFFIX) else archive.add_csv(path)
+                print(f"✓ {path}: {chunks} 个块")
+        return
+
+    if args.command == 'sites':
+        for site in archive.sites():
+            print(f"{site['site']}  ({site['latitude']}, {site['longitude']})  "
+                  f"{site['hours']} 小时  {site['start']} ~ {site['end']}")
+        return
+
+    if args.command == 'site':
+        columns = archive.site_hours(args.lat, args.lon, args.start, args.end, args.fields, args.local)
+        results = {location_dir_name(args.lat, args.lon): columns} if columns else {}
+    else:
+        results = archive.hours_across_sites(args.month, args.hour, args.fields, not args.utc, args.year)
+
+    rows = sum(len(columns["time"]) for columns in results.values())
+    print(f"✓ {len(results)} 个站点，{rows} 小时；读取 {archive.stats['chunks_read']}/{len(archive.index())} 个块")
+    if args.csv:
+        _write_csv(args.csv, results)
+        print(f"✓ 已写入: {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
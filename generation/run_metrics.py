@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+运行指标
+记录计算流程各阶段的耗时，以及每次 PVGIS HTTP 调用的网络耗时、传输字节数、重试、
+缓存命中/未命中和限流等待，写入 results_2023.json 的 metrics 字段；批量模式下按站点汇总。
+
+PVGISClient 通过 record_http() 向"当前运行"的指标记录，不需要在调用链中逐层传递：
+    metrics = RunMetrics()
+    with metrics.activate():
+        ...                                    # 本线程内的所有 PVGIS 调用都计入 metrics
+        executor.submit(bind(func))            # 工作线程需要用 bind() 继承当前指标
+
+耗时按线程累计：并发请求的网络耗时会叠加，可能超过阶段的墙钟时间。
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+HTTP_FIELDS = (
+    "requests", "cache_hits", "cache_misses", "coalesced", "spatial_reuses", "retries", "errors", "rejected",
+    "bytes_downloaded", "bytes_from_cache",
+    "network_seconds", "cache_read_seconds", "rate_limit_wait_seconds",
+)
+# 时间分解的各项，bound 取其中最大的一项
+BREAKDOWN_FIELDS = (
+    "network_seconds", "rate_limit_wait_seconds", "cache_read_seconds", "file_write_seconds", "processing_seconds",
+)
+BOUND_LABELS = {
+    "network_seconds": "network",
+    "rate_limit_wait_seconds": "rate_limit",
+    "cache_read_seconds": "io",
+    "file_write_seconds": "io",
+    "processing_seconds": "processing",
+}
+
+_active = contextvars.ContextVar("pvgis_run_metrics", default=None)
+
+
+def endpoint_name(url: str) -> str:
+    """接口名（URL 最后一段，如 PVcalc、seriescalc）"""
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+
+def _empty_http() -> Dict:
+    return {field: 0 for field in HTTP_FIELDS}
+
+
+class RunMetrics:
+    """单次运行的指标（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = None
+        self._wall_seconds = None
+        self.stages = {}
+        self.http = {}
+        self.file_write_seconds = 0.0
+        self.bytes_written = 0
+
+    @contextmanager
+    def activate(self):
+        """在 with 块内把本对象设为当前运行的指标，并记录墙钟时间"""
+        token = _active.set(self)
+        self._started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self._wall_seconds = time.perf_counter() - self._started
+            _active.reset(token)
+
+    @contextmanager
+    def stage(self, name: str):
+        """记录一个阶段的耗时（同名阶段累加）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+                stage["seconds"] += elapsed
+                stage["calls"] += 1
+
+    @contextmanager
+    def file_write(self, *paths: str):
+        """记录写输出文件的耗时，with 块结束后按 paths 的文件大小计入写出字节数"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_file_write(time.perf_counter() - start, paths)
+
+    def add_file_write(self, seconds: float, paths: Iterable[Optional[str]] = ()):
+        nbytes = sum(os.path.getsize(path) for path in paths if path and os.path.exists(path))
+        with self._lock:
+            self.file_write_seconds += seconds
+            self.bytes_written += nbytes
+
+    def record_http(self, endpoint: str, **values):
+        """累加某个接口的 HTTP 计数（字段见 HTTP_FIELDS）"""
+        with self._lock:
+            counters = self.http.setdefault(endpoint, _empty_http())
+            for field, value in values.items():
+                counters[field] += value
+
+    def wall_seconds(self) -> float:
+        if self._wall_seconds is not None:
+            return self._wall_seconds
+        return time.perf_counter() - self._started if self._started is not None else 0.0
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+            endpoints = {name: dict(counters) for name, counters in self.http.items()}
+            file_write_seconds = self.file_write_seconds
+            bytes_written = self.bytes_written
+
+        http_total = _sum_http(endpoints.values())
+        stage_seconds = sum(stage["seconds"] for stage in stages.values())
+        breakdown = {
+            "network_seconds": http_total["network_seconds"],
+            "rate_limit_wait_seconds": http_total["rate_limit_wait_seconds"],
+            "cache_read_seconds": http_total["cache_read_seconds"],
+            "file_write_seconds": file_write_seconds,
+        }
+        # 阶段耗时中除网络、限流、读缓存、写文件以外的部分：响应解析、时区转换、发电量计算等
+        breakdown["processing_seconds"] = max(0.0, stage_seconds - sum(breakdown.values()))
+        return _rounded({
+            "wall_seconds": self.wall_seconds(),
+            "stages": stages,
+            "http": {"total": http_total, "endpoints": endpoints},
+            "bytes_written": bytes_written,
+            "time_breakdown": breakdown,
+            "bound": classify_bound(breakdown),
+        })
+
+
+def _sum_http(counters_list: Iterable[Dict]) -> Dict:
+    total = _empty_http()
+    for counters in counters_list:
+        for field in HTTP_FIELDS:
+            total[field] += counters.get(field, 0)
+    return total
+
+
+def _rounded(value):
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, dict):
+        return {key: _rounded(item) for key, item in value.items()}
+    return value
+
+
+def classify_bound(breakdown: Dict) -> Optional[str]:
+    """按时间分解判断瓶颈: network / rate_limit / io / processing；没有耗时记录时返回 None"""
+    totals = {}
+    for field in BREAKDOWN_FIELDS:
+        label = BOUND_LABELS[field]
+        totals[label] = totals.get(label, 0.0) + breakdown.get(field, 0.0)
+    label, seconds = max(totals.items(), key=lambda item: item[1])
+    return label if seconds > 0 else None
+
+
+def aggregate_metrics(metrics_list: List[Dict]) -> Dict:
+    """汇总多个站点的 metrics（各项耗时、计数直接相加，bound 按汇总后的时间分解重新判断）"""
+    stages = {}
+    endpoints = {}
+    breakdown = {field: 0.0 for field in BREAKDOWN_FIELDS}
+    wall_seconds = 0.0
+    bytes_written = 0
+    for metrics in metrics_list:
+        wall_seconds += metrics.get("wall_seconds", 0)
+        bytes_written += metrics.get("bytes_written", 0)
+        for name, stage in metrics.get("stages", {}).items():
+            total = stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            total["seconds"] += stage["seconds"]
+            total["calls"] += stage["calls"]
+        for name, counters in metrics.get("http", {}).get("endpoints", {}).items():
+            endpoints[name] = _sum_http([endpoints.get(name, _empty_http()), counters])
+        for field in BREAKDOWN_FIELDS:
+            breakdown[field] += metrics.get("time_breakdown", {}).get(field, 0)
+
+    bounds = {}
+    for metrics in metrics_list:
+        if metrics.get("bound"):
+            bounds[metrics["bound"]] = bounds.get(metrics["bound"], 0) + 1
+    return _rounded({
+        "sites": len(metrics_list),
+        "site_wall_seconds": wall_seconds,
+        "stages": stages,
+        "http": {"total": _sum_http(endpoints.values()), "endpoints": endpoints},
+        "bytes_written": bytes_written,
+        "time_breakdown": breakdown,
+        "bound": classify_bound(breakdown),
+        "sites_by_bound": bounds,
+    })
+
+
+def current_metrics() -> Optional[RunMetrics]:
+    return _active.get()
+
+
+def record_http(url: str, **values):
+    """向当前运行的指标记录一次 HTTP 相关计数；没有激活的指标时不做任何事"""
+    metrics = _active.get()
+    if metrics is not None:
+        metrics.record_http(endpoint_name(url), **values)
+
+
+def bind(func: Callable) -> Callable:
+    """让 func 在其他线程中执行时继承当前运行的指标（线程池提交前调用）"""
+    metrics = _active.get()
+    if metrics is None:
+        return func
+
+    def bound(*args, **kwargs):
+        token = _active.set(metrics)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _active.reset(token)
+    return bound
+
+
+def timed_chunks(chunks: Iterator[bytes], url: str, seconds_field: str, bytes_field: str) -> Iterator[bytes]:
+    """逐块转发，记录等待每块的耗时（网络下载或读缓存文件）和字节数"""
+    metrics = _active.get()
+    if metrics is None:
+        yield from chunks
+        return
+    endpoint = endpoint_name(url)
+    seconds = 0.0
+    nbytes = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                seconds += time.perf_counter() - start
+                break
+            seconds += time.perf_counter() - start
+            nbytes += len(chunk)
+            yield chunk
+    finally:
+        metrics.record_http(endpoint, **{seconds_field: seconds, bytes_field: nbytes})
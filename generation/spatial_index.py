@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+已缓存辐照数据的空间索引
+PVGIS 辐照数据是网格化的（SARAH 约 0.05°），同一条街上的房子拿到的 seriescalc 几乎相同。
+索引记录每个已缓存请求的坐标，按网格单元分桶；查询"容差范围内最近的已缓存数据集"，
+命中时直接复用邻近地址的缓存响应，不再发起请求。
+
+只有坐标以外的参数（年份、components 等）完全相同的请求才会互相复用。
+索引为缓存目录下追加写入的 JSONL 文件，可多进程共享。
+"""
+
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pvgis_cache import DEFAULT_CACHE_DIR, normalize_params
+
+
+DEFAULT_CELL_DEG = 0.05
+DEFAULT_TOLERANCE_KM = 1.0
+DEFAULT_INDEX_FILE = "spatial_index.jsonl"
+
+# 只对辐照时间序列启用（PVcalc 结果还取决于朝向等参数，且请求很小）
+SPATIAL_ENDPOINTS = ("seriescalc",)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """两点间的大圆距离（公里）"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class RadiationSpatialIndex:
+    """按网格单元分桶的已缓存请求坐标索引（线程安全）"""
+
+    def __init__(self, path: str = os.path.join(DEFAULT_CACHE_DIR, DEFAULT_INDEX_FILE),
+                 cell_deg: float = DEFAULT_CELL_DEG, tolerance_km: float = DEFAULT_TOLERANCE_KM):
+        self.path = Path(path).expanduser()
+        self.cell_deg = float(cell_deg)
+        self.tolerance_km = float(tolerance_km)
+        # (参数签名, 纬度格, 经度格) → [(纬度, 经度, 规范化参数)]
+        self._cells = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def from_config(cls, index_config: Optional[Dict], cache_dir: str) -> Optional["RadiationSpatialIndex"]:
+        """从配置文件的 pvgis.spatial_index 段创建索引，未启用时返回 None"""
+        index_config = index_config or {}
+        if not index_config.get("enabled", False):
+            return None
+        return cls(
+            path=os.path.join(cache_dir, DEFAULT_INDEX_FILE),
+            cell_deg=index_config.get("cell_deg", DEFAULT_CELL_DEG),
+            tolerance_km=index_config.get("tolerance_km", DEFAULT_TOLERANCE_KM),
+        )
+
+    @staticmethod
+    def applies_to(url: str) -> bool:
+        return url.rstrip("/").rsplit("/", 1)[-1] in SPATIAL_ENDPOINTS
+
+    @staticmethod
+    def _signature(url: str, normalized: Dict[str, str]) -> str:
+        """除坐标外的请求参数签名"""
+        rest = {key: value for key, value in normalized.items() if key not in ("lat", "lon")}
+        return json.dumps([url, rest], sort_keys=True)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if entry.get("removed"):
+                        self._discard(entry["url"], entry["params"])
+                    else:
+                        self._insert(entry["url"], entry["params"])
+                except (ValueError, KeyError):
+                    # 忽略被并发写入截断的行
+                    continue
+
+    def _bucket(self, url: str, normalized: Dict[str, str]) -> List:
+        lat, lon = float(normalized["lat"]), float(normalized["lon"])
+        key = (self._signature(url, normalized), *self._cell(lat, lon))
+        return self._cells.setdefault(key, [])
+
+    def _insert(self, url: str, normalized: Dict[str, str]) -> bool:
+        bucket = self._bucket(url, normalized)
+        if any(existing == normalized for _, _, existing in bucket):
+            return False
+        bucket.append((float(normalized["lat"]), float(normalized["lon"]), normalized))
+        return True
+
+    def _discard(self, url: str, normalized: Dict[str, str]) -> bool:
+        bucket = self._bucket(url, normalized)
+        for i, (_, _, existing) in enumerate(bucket):
+            if existing == normalized:
+                del bucket[i]
+                return True
+        return False
+
+    def _append(self, entry: Dict):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"警告: 无法写入空间索引 {self.path}: {e}")
+
+    def add(self, url: str, params: Dict):
+        """记录一个已写入缓存的请求"""
+        normalized = normalize_params(params)
+        if "lat" not in normalized or "lon" not in normalized:
+            return
+        with self._lock:
+            if self._insert(url, normalized):
+                self._append({"url": url, "params": normalized})
+
+    def remove(self, url: str, params: Dict):
+        """移除已不在缓存中的条目（过期或被淘汰）"""
+        normalized = normalize_params(params)
+        with self._lock:
+            if self._discard(url, normalized):
+                self._append({"url": url, "params": normalized, "removed": True})
+
+    def nearest(self, url: str, params: Dict) -> Optional[Tuple[Dict[str, str], float]]:
+        """返回容差范围内最近的已缓存请求参数及距离 (公里)，没有则返回 None"""
+        normalized = normalize_params(params)
+        if "lat" not in normalized or "lon" not in normalized:
+            return None
+        lat, lon = float(normalized["lat"]), float(normalized["lon"])
+        signature = self._signature(url, normalized)
+
+        # 需要搜索的相邻网格圈数（经度方向随纬度变窄）
+        lat_span = self.tolerance_km / KM_PER_DEGREE
+        lon_span = self.tolerance_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        lat_rings = math.ceil(lat_span / self.cell_deg)
+        lon_rings = math.ceil(lon_span / self.cell_deg)
+        cell_lat, cell_lon = self._cell(lat, lon)
+
+        best = None
+        with self._lock:
+            for i in range(cell_lat - lat_rings, cell_lat + lat_rings + 1):
+                for j in range(cell_lon - lon_rings, cell_lon + lon_rings + 1):
+                    for entry_lat, entry_lon, entry_params in self._cells.get((signature, i, j), ()):
+                        distance = haversine_km(lat, lon, entry_lat, entry_lon)
+                        if distance <= self.tolerance_km and (best is None or distance < best[1]):
+                            best = (entry_params, distance)
+        return best
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(bucket) for bucket in self._cells.values())
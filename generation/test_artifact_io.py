@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+产物压缩读写测试：切换压缩设置后不会读到旧版本的文件
+
+    python3 -m pytest test_artifact_io.py
+"""
+
+import os
+import tempfile
+import unittest
+
+from artifact_io import dump_json, load_json, resolve_artifact
+
+
+class CompressionVariantTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "results.json")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_write_removes_other_variants(self):
+        dump_json({"run": "old"}, self.path)
+        written = dump_json({"run": "new"}, self.path, "lzma")
+        self.assertEqual(os.listdir(self._dir.name), [os.path.basename(written)])
+        self.assertEqual(load_json(self.path), {"run": "new"})
+
+    def test_newest_variant_wins(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{"run": "stale"}')
+        os.utime(self.path, (1, 1))
+        written = dump_json({"run": "fresh"}, self.path + ".tmp", "gzip")
+        os.replace(written, self.path + ".gz")      # 绕过写出时的清理，模拟手工复制进来的文件
+        self.assertEqual(resolve_artifact(self.path), self.path + ".gz")
+        self.assertEqual(load_json(self.path), {"run": "fresh"})
+
+
+if __name__ == "__main__":
+    unittest.main()
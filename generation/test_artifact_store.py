@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+产物存储测试：不带时间戳重复运行时，清单中记录的每个对象仍与其哈希一致
+（本地 HTTP 替身服务器提供合成的 PVGIS 数据，不访问网络）
+
+    python3 -m pytest test_artifact_store.py
+"""
+
+import json
+import math
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from artifact_store import MANIFEST_FILE, file_sha256
+from pv_calculator_2023 import PVGISCalculator2023
+
+
+def _seriescalc(params):
+    hourly = []
+    moment = datetime(2023, 1, 1, 0, 10)
+    while moment.year == 2023:
+        g = round(max(0.0, math.sin((moment.hour - 20) / 12 * math.pi)) * 800, 2)
+        hourly.append({"time": moment.strftime("%Y%m%d:%H%M"), "G(i)": g, "H_sun": g / 20,
+                       "T2m": 15.0, "WS10m": 3.0, "Int": 0.0})
+        moment += timedelta(hours=1)
+    return {"inputs": {}, "outputs": {"hourly": hourly}, "meta": {}}
+
+
+def _pvcalc(params):
+    peak = float(params["peakpower"])
+    monthly = [{"month": m, "E_d": peak * 3, "E_m": peak * 90, "H(i)_d": 4.0, "H(i)_m": 120.0, "SD_m": 1.0}
+               for m in range(1, 13)]
+    return {"inputs": {}, "outputs": {"monthly": {"fixed": monthly},
+                                      "totals": {"fixed": {"E_d": peak * 3, "E_m": peak * 90,
+                                                           "E_y": peak * 1080, "SD_y": 1.0}}}}
+
+
+class _FakePVGIS(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        handler = {"seriescalc": _seriescalc, "PVcalc": _pvcalc}.get(url.path.rsplit("/", 1)[-1])
+        if handler is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(handler(params)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class RerunWithoutTimestampTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakePVGIS)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def _config(self, output_dir: str, panel_count: int) -> dict:
+        return {
+            "location": {"latitude": -41.1677, "longitude": 146.3473, "description": "test"},
+            "system_loss": 14,
+            "panel_spec": {"brand": "JA Solar", "model": "JAM54D40-440", "power_watts": 440,
+                           "efficiency": 22, "first_year_degradation": 0, "annual_degradation": 0.4,
+                           "temperature_coefficient_pmax": -0.3},
+            "roof_surfaces": [{"name": "坡面1", "panel_count": panel_count, "tilt_angle": 23, "azimuth": 0}],
+            "pvgis": {"api_base_url": f"http://127.0.0.1:{self.server.server_port}/api",
+                      "cache": {"enabled": False}},
+            "calculation": {"incremental": False},
+            "output": {"output_directory": output_dir, "add_timestamp": False,
+                       "convert_to_local_time": False},
+        }
+
+    def test_manifest_hashes_survive_rerun(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            for panel_count in (10, 12):
+                PVGISCalculator2023(self._config(output_dir, panel_count)).run()
+
+            manifests = list(Path(output_dir).glob(f"*/{MANIFEST_FILE}"))
+            self.assertEqual(len(manifests), 1)
+            runs = [json.loads(line) for line in manifests[0].read_text(encoding="utf-8").splitlines()]
+            self.assertEqual(len(runs), 2)
+            for run in runs:
+                for role, artifact in run["artifacts"].items():
+                    self.assertIsNotNone(artifact["object"], role)
+                    self.assertEqual(file_sha256(artifact["object"]), artifact["sha256"], role)
+
+
+if __name__ == "__main__":
+    unittest.main()
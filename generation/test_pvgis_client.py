@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+PVGISClient 熔断器和 single-flight 测试（模拟 Session，不访问网络）
+
+    python3 -m pytest test_pvgis_client.py
+"""
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from pvgis_client import CircuitBreaker, CircuitOpenError, PVGISClient, RetryPolicy
+
+URL = "https://re.jrc.ec.europa.eu/api/v5_3/PVcalc"
+
+
+def _response(status_code: int, body: bytes = b"{}") -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response._content_consumed = True
+    response.url = URL
+    return response
+
+
+class CircuitBreakerTrialTest(unittest.TestCase):
+
+    def _client(self, *outcomes) -> PVGISClient:
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+        client = PVGISClient(retry_policy=RetryPolicy(max_retries=0), circuit_breaker=breaker)
+        client.session.get = mock.Mock(side_effect=[
+            outcome if isinstance(outcome, Exception) else _response(outcome) for outcome in outcomes
+        ])
+        return client
+
+    def test_429_on_trial_closes_breaker(self):
+        client = self._client(503, 429, 200, 200)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client._request(URL, {}, timeout=1)      # 503：熔断
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client._request(URL, {}, timeout=1)      # 试探请求收到 429：服务正常
+        self.assertFalse(client.circuit_breaker.is_open)
+        self.assertEqual(client._request(URL, {}, timeout=1).status_code, 200)
+        self.assertEqual(client._request(URL, {}, timeout=1).status_code, 200)
+
+    def test_unexpected_exception_on_trial_releases_trial(self):
+        client = self._client(503, requests.exceptions.ChunkedEncodingError("cut"), 200)
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client._request(URL, {}, timeout=1)
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            client._request(URL, {}, timeout=1)      # 试探失败，继续熔断
+        self.assertTrue(client.circuit_breaker.is_open)
+        self.assertEqual(client._request(URL, {}, timeout=1).status_code, 200)   # 下一次试探放行
+        self.assertFalse(client.circuit_breaker.is_open)
+
+    def test_open_breaker_rejects_until_reset(self):
+        client = self._client(503)
+        client.circuit_breaker.reset_seconds = 60
+        with self.assertRaises(requests.exceptions.HTTPError):
+            client._request(URL, {}, timeout=1)
+        with self.assertRaises(CircuitOpenError):
+            client._request(URL, {}, timeout=1)
+
+
+class StreamCoalescingTest(unittest.TestCase):
+
+    def test_streams_coalesce_without_cache(self):
+        body = b'{"outputs": {"hourly": []}}' * 1000
+        client = PVGISClient(retry_policy=RetryPolicy(max_retries=0))
+        self.assertFalse(client.cache.enabled)
+        release = threading.Event()
+
+        def get(*args, **kwargs):
+            release.wait(5)
+            return _response(200, body)
+        client.session.get = mock.Mock(side_effect=get)
+
+        received = []
+
+        def download():
+            with client.stream_bytes(URL, {"lat": 1}, chunk_size=4096) as chunks:
+                received.append(b"".join(chunks))
+
+        threads = [threading.Thread(target=download) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while client.coalesced_requests < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(client.session.get.call_count, 1)
+        self.assertEqual(received, [body] * 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+时区工具
+- 按坐标解析时区：timezonefinder/pytz 延迟导入，每个进程只创建一个 TimezoneFinder，
+  结果按 (纬度, 经度) 四舍五入后缓存在内存和磁盘上
+- 批量把 PVGIS 的 UTC 时间列 (YYYYMMDD:HHMM) 转换为本地时间：
+  时区的夏令时切换表只在创建转换器时解析一次，之后整列一次性平移
+"""
+
+import json
+import os
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from pvgis_cache import DEFAULT_CACHE_DIR
+
+
+PVGIS_TIME_FORMAT = "%Y%m%d:%H%M"
+
+# 坐标保留3位小数（约100米）作为时区缓存键
+COORDINATE_PRECISION = 3
+DEFAULT_TIMEZONE_CACHE_FILE = os.path.join(DEFAULT_CACHE_DIR, "timezones.jsonl")
+
+_support = None
+_finder = None
+_finder_lock = threading.Lock()
+_zone_cache = None
+_zone_cache_lock = threading.Lock()
+
+
+def timezone_support() -> bool:
+    """timezonefinder 和 pytz 是否可用（首次调用时才尝试导入）"""
+    global _support
+    if _support is None:
+        try:
+            import pytz  # noqa: F401
+            import timezonefinder  # noqa: F401
+            _support = True
+        except ImportError:
+            _support = False
+    return _support
+
+
+def _get_finder():
+    """每个进程只创建一个 TimezoneFinder（加载多边形数据开销较大）"""
+    global _finder
+    with _finder_lock:
+        if _finder is None:
+            from timezonefinder import TimezoneFinder
+            _finder = TimezoneFinder()
+        return _finder
+
+
+class TimezoneCache:
+    """(纬度, 经度) → 时区名 的持久化缓存（追加写入的 JSONL 文件，可多进程共享）"""
+
+    def __init__(self, path: str = DEFAULT_TIMEZONE_CACHE_FILE):
+        self.path = Path(path).expanduser()
+        self._zones = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def key(lat: float, lon: float) -> str:
+        return f"{round(lat, COORDINATE_PRECISION)},{round(lon, COORDINATE_PRECISION)}"
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._zones[entry["key"]] = entry["timezone"]
+                except (ValueError, KeyError):
+                    # 忽略被并发写入截断的行
+                    continue
+
+    def get(self, lat: float, lon: float) -> Optional[str]:
+        return self._zones.get(self.key(lat, lon))
+
+    def put(self, lat: float, lon: float, timezone_name: str):
+        key = self.key(lat, lon)
+        with self._lock:
+            if self._zones.get(key) == timezone_name:
+                return
+            self._zones[key] = timezone_name
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"key": key, "timezone": timezone_name}) + "\n")
+            except OSError as e:
+                print(f"警告: 无法写入时区缓存 {self.path}: {e}")
+
+
+def _get_zone_cache() -> TimezoneCache:
+    global _zone_cache
+    with _zone_cache_lock:
+        if _zone_cache is None:
+            _zone_cache = TimezoneCache()
+        return _zone_cache
+
+
+def resolve_timezone_name(lat: float, lon: float) -> Optional[str]:
+    """根据坐标返回 IANA 时区名；无法确定时返回 None
+
+    依次查询内存/磁盘缓存，未命中时才使用 TimezoneFinder。
+    """
+    cache = _get_zone_cache()
+    timezone_name = cache.get(lat, lon)
+    if timezone_name is not None:
+        return timezone_name
+
+    timezone_name = _get_finder().timezone_at(lat=lat, lng=lon)
+    if timezone_name:
+        cache.put(lat, lon, timezone_name)
+    return timezone_name
+
+
+def utc_offset_hours(timezone_name: str, sample_date: datetime) -> float:
+    """时区在指定日期（本地时间）的 UTC 偏移小时数（含夏令时）"""
+    import pytz
+    localized_date = pytz.timezone(timezone_name).localize(sample_date)
+    return localized_date.utcoffset().total_seconds() / 3600
+
+
+def convert_utc_to_local(utc_time_str: str, timezone_name: str) -> str:
+    """逐个转换 UTC 时间字符串为本地时间"""
+    import pytz
+    utc_dt = datetime.strptime(utc_time_str, PVGIS_TIME_FORMAT).replace(tzinfo=pytz.UTC)
+    return utc_dt.astimezone(pytz.timezone(timezone_name)).strftime(PVGIS_TIME_FORMAT)
+
+
+class LocalTimeConverter:
+    """UTC → 本地时间的批量转换器
+
+    直接使用 pytz 的 UTC 切换表（与 astimezone 的查表规则相同），
+    因此结果与逐行 strptime + astimezone + strftime 完全一致。
+    """
+
+    def __init__(self, timezone_name: str):
+        import pytz
+        try:
+            import numpy as np
+            self._np = np
+        except ImportError:
+            self._np = None
+
+        self.timezone_name = timezone_name
+        tz = pytz.timezone(timezone_name)
+
+        if hasattr(tz, "_utc_transition_times"):
+            # 有夏令时/历史变更的时区
+            self._transitions = list(tz._utc_transition_times)
+            self._offsets = [info[0] for info in tz._transition_info]
+        else:
+            # 固定偏移时区（包括 UTC）
+            self._transitions = [datetime.min]
+            self._offsets = [tz.utcoffset(datetime(2000, 1, 1))]
+
+        if self._np is not None:
+            np = self._np
+            self._transition_minutes = np.array(
+                [np.datetime64(t, "m") for t in self._transitions]
+            ).astype(np.int64)
+            self._offset_minutes = np.array(
+                [int(offset.total_seconds() // 60) for offset in self._offsets], dtype=np.int64
+            )
+
+    def convert(self, utc_times: Sequence[str]) -> List[str]:
+        """转换一批 UTC 时间字符串，返回同样格式的本地时间字符串列表"""
+        if len(utc_times) == 0:
+            return []
+        if self._np is not None:
+            return self._convert_vectorized(utc_times)
+        return [self._convert_one(t) for t in utc_times]
+
+    def _convert_one(self, utc_time: str) -> str:
+        utc_dt = datetime(int(utc_time[0:4]), int(utc_time[4:6]), int(utc_time[6:8]),
+                          int(utc_time[9:11]), int(utc_time[11:13]))
+        index = max(0, bisect_right(self._transitions, utc_dt) - 1)
+        return (utc_dt + self._offsets[index]).strftime(PVGIS_TIME_FORMAT)
+
+    def _convert_vectorized(self, utc_times: Sequence[str]) -> List[str]:
+        np = self._np
+        digits = np.frombuffer("".join(utc_times).encode("ascii"), dtype=np.uint8)
+        digits = digits.reshape(-1, 13).astype(np.int64) - ord("0")
+        year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+        month = digits[:, 4] * 10 + digits[:, 5]
+        day = digits[:, 6] * 10 + digits[:, 7]
+        minutes = (digits[:, 9] * 10 + digits[:, 10]) * 60 + digits[:, 11] * 10 + digits[:, 12]
+
+        date = ((year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (month - 1)).astype("datetime64[D]") + (day - 1)
+        utc_minutes = date.astype("datetime64[m]").astype(np.int64) + minutes
+
+        index = np.searchsorted(self._transition_minutes, utc_minutes, side="right") - 1
+        local = (utc_minutes + self._offset_minutes[np.maximum(index, 0)]).astype("datetime64[m]")
+
+        # "YYYY-MM-DDTHH:MM" → "YYYYMMDD:HHMM"
+        chars = np.datetime_as_string(local, unit="m").astype("U16").view("U1").reshape(-1, 16)
+        chars = chars[:, [0, 1, 2, 3, 5, 6, 8, 9, 10, 11, 12, 14, 15]]
+        chars[:, 8] = ":"
+        return np.ascontiguousarray(chars).view("U13").ravel().tolist()
+
+
+@lru_cache(maxsize=64)
+def get_local_time_converter(timezone_name: str) -> LocalTimeConverter:
+    """按时区名复用转换器，批量处理多个站点时切换表只解析一次"""
+    return LocalTimeConverter(timezone_name)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+区域单位容量发电量栅格（离线即时报价）
+在服务区域的经纬度网格上，为每个格点的一组标准 倾角×方位角 预先计算
+每 kWp 的月×小时发电量（12×24，各月平均一天中每小时的 kWh/kWp，本地时间）。
+之后区域内任意地址的估算只需在内存映射的数组上做双线性插值，不访问网络。
+
+文件: <名称>.npy（float32 数组，形状 纬度×经度×倾角×方位角×12×24，未计算/海上格点为 NaN）
+      <名称>.json（网格范围、朝向、计算参数等元数据）
+
+构建（每个格点一次 seriescalc 下载，经客户端缓存和限流；中断后重新运行会跳过已完成的格点）:
+    python3 yield_raster.py build config_australia.json --region tas --output rasters/tas
+    python3 yield_raster.py build config_australia.json --bounds -35.5 -34.5 138.3 139.0 --step 0.05 --output rasters/adelaide
+
+查询:
+    python3 yield_raster.py lookup rasters/tas -41.17 146.35 --tilt 23 --aspect -55.6
+"""
+
+import argparse
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from pv_engine import DEFAULT_ALBEDO, REQUIRED_FIELDS, LocalPVEngine
+from pv_multiyear import month_hour_profile
+from pv_yield import build_seriescalc_params
+from pvgis_client import PVGISClient, resolve_api_base_url
+from pvgis_stream import HourlyColumnCollector, read_seriescalc
+from yield_table import DAYS_IN_MONTH, YieldTable, aspect_weights, linear_weights
+
+
+DEFAULT_STEP_DEG = 0.1
+DEFAULT_YEAR = 2023
+DEFAULT_RASTER_TILTS = [10, 20, 30]
+DEFAULT_RASTER_ASPECTS = list(range(-180, 180, 45))
+
+# 预设服务区域 (纬度下限, 纬度上限, 经度下限, 经度上限)
+REGIONS = {
+    "tas": (-43.7, -39.5, 143.8, 148.5),
+    "sa": (-38.1, -25.9, 129.0, 141.0),
+}
+
+
+def _raster_paths(path: str) -> Tuple[Path, Path]:
+    """栅格文件名（可带或不带 .npy/.json 后缀） → (数组文件, 元数据文件)"""
+    base = Path(path)
+    if base.suffix in (".npy", ".json"):
+        base = base.with_suffix("")
+    return base.with_suffix(".npy"), base.with_suffix(".json")
+
+
+class YieldRaster:
+    """内存映射的区域栅格读取器"""
+
+    def __init__(self, path: str):
+        array_path, meta_path = _raster_paths(path)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            self.metadata = json.load(f)
+        self.path = str(array_path)
+        self.data = np.load(array_path, mmap_mode="r")
+
+        self.lat_min = self.metadata["lat_min"]
+        self.lon_min = self.metadata["lon_min"]
+        self.step = self.metadata["step_deg"]
+        self.n_lat, self.n_lon = self.data.shape[:2]
+        self.tilts = [float(t) for t in self.metadata["tilts"]]
+        self.aspects = [float(a) for a in self.metadata["aspects"]]
+
+    def contains(self, lat: float, lon: float) -> bool:
+        return (self.lat_min <= lat <= self.lat_min + (self.n_lat - 1) * self.step
+                and self.lon_min <= lon <= self.lon_min + (self.n_lon - 1) * self.step)
+
+    def profiles_at(self, lat: float, lon: float) -> Optional[np.ndarray]:
+        """在经纬度上双线性插值，返回 (倾角, 方位角, 12, 24) 的 kWh/kWp 数组
+
+        只使用周围已计算的格点（权重重新归一化）；超出范围或周围格点均无数据时返回 None。
+        """
+        if not self.contains(lat, lon):
+            return None
+        y = (lat - self.lat_min) / self.step
+        x = (lon - self.lon_min) / self.step
+        i0, j0 = min(int(y), self.n_lat - 1), min(int(x), self.n_lon - 1)
+        i1, j1 = min(i0 + 1, self.n_lat - 1), min(j0 + 1, self.n_lon - 1)
+        u, v = y - i0, x - j0
+
+        total = None
+        weight_sum = 0.0
+        for i, j, w in ((i0, j0, (1 - u) * (1 - v)), (i0, j1, (1 - u) * v),
+                        (i1, j0, u * (1 - v)), (i1, j1, u * v)):
+            cell = self.data[i, j]
+            if w <= 0 or np.isnan(cell[0, 0, 0, 0]):
+                continue
+            total = cell * w if total is None else total + cell * w
+            weight_sum += w
+        if total is None:
+            return None
+        return total / weight_sum
+
+    def profile_at(self, lat: float, lon: float, tilt: float, aspect: float) -> Optional[np.ndarray]:
+        """任意地址、任意朝向的 12×24 月均逐时发电量 (kWh/kWp)"""
+        profiles = self.profiles_at(lat, lon)
+        if profiles is None:
+            return None
+        t0, t1, u = linear_weights(self.tilts, tilt)
+        a0, a1, v = aspect_weights(self.aspects, aspect)
+        return ((1 - u) * (1 - v) * profiles[t0, a0] + (1 - u) * v * profiles[t0, a1]
+                + u * (1 - v) * profiles[t1, a0] + u * v * profiles[t1, a1])
+
+    def table_at(self, lat: float, lon: float) -> Optional[YieldTable]:
+        """该地址的 倾角×方位角 查找表（年/月 kWh/kWp），供计算器的查找表模式使用"""
+        profiles = self.profiles_at(lat, lon)
+        if profiles is None:
+            return None
+        monthly = profiles.sum(axis=-1) * np.array(DAYS_IN_MONTH)
+        return YieldTable(self.tilts, self.aspects, monthly.sum(axis=-1).tolist(), monthly.tolist(), {
+            "location": {"latitude": lat, "longitude": lon},
+            "system_loss": self.metadata.get("system_loss"),
+            "raster": self.path,
+        })
+
+
+def grid_axes(bounds: Sequence[float], step: float) -> Tuple[List[float], List[float]]:
+    """区域范围 → (纬度列表, 经度列表)，格点按 step 对齐"""
+    lat_min, lat_max, lon_min, lon_max = bounds
+    lat_start = math.floor(lat_min / step + 1e-9) * step
+    lon_start = math.floor(lon_min / step + 1e-9) * step
+    n_lat = int(math.ceil((lat_max - lat_start) / step - 1e-9)) + 1
+    n_lon = int(math.ceil((lon_max - lon_start) / step - 1e-9)) + 1
+    return ([round(lat_start + i * step, 6) for i in range(n_lat)],
+            [round(lon_start + j * step, 6) for j in range(n_lon)])
+
+
+def point_profiles(client: PVGISClient, seriescalc_url: str, lat: float, lon: float, year: int,
+                   tilts: Sequence[float], aspects: Sequence[float], system_loss: float,
+                   temperature_coefficient: float, albedo: float = DEFAULT_ALBEDO) -> np.ndarray:
+    """单个格点: 下载一年辐照，本地引擎计算所有标准朝向 → (倾角, 方位角, 12, 24)"""
+    collector = HourlyColumnCollector(REQUIRED_FIELDS)
+    with client.stream_bytes(seriescalc_url, build_seriescalc_params(lat, lon, year, components=True), timeout=120) as chunks:
+        read_seriescalc(chunks, collector)
+    if not collector.times:
+        raise ValueError("辐照数据为空")
+
+    engine = LocalPVEngine(collector.columns(), lat, lon)
+    surfaces = [{"tilt": tilt, "aspect": aspect, "peak_power_kw": 1.0} for tilt in tilts for aspect in aspects]
+    output = engine.simulate(surfaces, system_loss, temperature_coefficient, albedo)
+
+    times = engine.times
+    from timezone_utils import get_local_time_converter, resolve_timezone_name
+    timezone_name = resolve_timezone_name(lat, lon)
+    if timezone_name:
+        times = get_local_time_converter(timezone_name).convert(times)
+    profiles = np.stack([month_hour_profile(times, power) for power in output["hourly_power_w"]])
+    return profiles.reshape(len(tilts), len(aspects), 12, 24)
+
+
+def build_yield_raster(client: PVGISClient, seriescalc_url: str, output: str, bounds: Sequence[float],
+                       step: float, system_loss: float, temperature_coefficient: float,
+                       albedo: float = DEFAULT_ALBEDO, year: int = DEFAULT_YEAR,
+                       tilts: Sequence[float] = DEFAULT_RASTER_TILTS,
+                       aspects: Sequence[float] = DEFAULT_RASTER_ASPECTS, max_workers: int = 4) -> Dict:
+    """构建（或续建）区域栅格，返回元数据
+
+    数组直接以内存映射方式创建并逐格点写入；已存在且网格一致的栅格只补算缺失的格点。
+    海上等 PVGIS 无数据的格点保持 NaN。
+    """
+    array_path, meta_path = _raster_paths(output)
+    array_path.parent.mkdir(parents=True, exist_ok=True)
+    lats, lons = grid_axes(bounds, step)
+    shape = (len(lats), len(lons), len(tilts), len(aspects), 12, 24)
+    metadata = {
+        "lat_min": lats[0],
+        "lon_min": lons[0],
+        "step_deg": step,
+        "n_lat": len(lats),
+        "n_lon": len(lons),
+        "tilts": list(tilts),
+        "aspects": list(aspects),
+        "year": year,
+        "system_loss": system_loss,
+        "temperature_coefficient": temperature_coefficient,
+        "albedo": albedo,
+        "units": "kWh/kWp（各月平均一天中每小时的发电量，本地时间）",
+    }
+
+    resume = False
+    if array_path.exists() and meta_path.exists():
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        resume = all(previous.get(key) == value for key, value in metadata.items())
+    if resume:
+        data = np.load(array_path, mmap_mode="r+")
+        print(f"续建已有栅格: {array_path}")
+    else:
+        data = np.lib.format.open_memmap(array_path, mode="w+", dtype="<f4", shape=shape)
+        data[:] = np.nan
+        data.flush()
+        # 先写元数据，构建中断后可以续建
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+    pending = [(i, j) for i in range(len(lats)) for j in range(len(lons)) if np.isnan(data[i, j, 0, 0, 0, 0])]
+    print(f"网格: {len(lats)} × {len(lons)} = {len(lats) * len(lons)} 个格点，"
+          f"每点 {len(tilts) * len(aspects)} 个朝向，待计算 {len(pending)} 个")
+
+    failed = {}
+    done = 0
+
+    def compute(point):
+        i, j = point
+        return point_profiles(client, seriescalc_url, lats[i], lons[j], year, tilts, aspects,
+                              system_loss, temperature_coefficient, albedo)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(compute, point): point for point in pending}
+        for future in as_completed(futures):
+            i, j = futures[future]
+            try:
+                data[i, j] = future.result()
+                done += 1
+            except Exception as e:
+                failed[f"{lats[i]},{lons[j]}"] = f"{type(e).__name__}: {e}"
+            if (done + len(failed)) % 100 == 0:
+                data.flush()
+                print(f"  进度: {done + len(failed)}/{len(pending)}（失败 {len(failed)}）")
+
+    data.flush()
+    metadata["filled_points"] = int((~np.isnan(data[:, :, 0, 0, 0, 0])).sum())
+    metadata["failed_points"] = failed
+    metadata["created_at"] = datetime.now().isoformat()
+    del data
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
+
+    print(f"✓ 栅格已保存到: {array_path}（{metadata['filled_points']} 个格点有数据，{len(failed)} 个失败）")
+    return metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description='区域单位容量发电量栅格')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='构建或续建区域栅格')
+    build.add_argument('config', help='计算器配置文件（使用其中的 pvgis、系统损耗、组件参数）')
+    area = build.add_mutually_exclusive_group(required=True)
+    area.add_argument('--region', choices=sorted(REGIONS), help='预设区域')
+    area.add_argument('--bounds', type=float, nargs=4, metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'))
+    build.add_argument('--step', type=float, default=DEFAULT_STEP_DEG, help='格点间距（度）')
+    build.add_argument('--year', type=int, default=DEFAULT_YEAR, help='辐照数据年份')
+    build.add_argument('--output', required=True, help='输出文件名（生成 .npy 和 .json）')
+
+    lookup = subparsers.add_parser('lookup', help='查询任意地址')
+    lookup.add_argument('raster')
+    lookup.add_argument('lat', type=float)
+    lookup.add_argument('lon', type=float)
+    lookup.add_argument('--tilt', type=float, default=23)
+    lookup.add_argument('--aspect', type=float, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'lookup':
+        profile = YieldRaster(args.raster).profile_at(args.lat, args.lon, args.tilt, args.aspect)
+        if profile is None:
+            print("✗ 该地址不在栅格范围内或附近格点无数据")
+            return
+        monthly = profile.sum(axis=-1) * np.array(DAYS_IN_MONTH)
+        print(f"年发电量: {monthly.sum():.1f} kWh/kWp")
+        print("月发电量: " + ", ".join(f"{e:.1f}" for e in monthly))
+        return
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    pvgis_config = config.get("pvgis", {})
+    client = PVGISClient.from_config(pvgis_config)
+    seriescalc_url = f"{resolve_api_base_url(pvgis_config.get('api_base_url'))}/seriescalc"
+    try:
+        build_yield_raster(
+            client, seriescalc_url, args.output,
+            REGIONS[args.region] if args.region else args.bounds, args.step,
+            system_loss=config["system_loss"],
+            temperature_coefficient=config["panel_spec"].get("temperature_coefficient_pmax", 0),
+            albedo=config.get("calculation", {}).get("albedo", DEFAULT_ALBEDO),
+            year=args.year,
+            max_workers=pvgis_config.get("max_workers", 4),
+        )
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+单地点 倾角×方位角 单位容量(per-kWp)发电量查找表
+预先在倾角×方位角网格上计算每 kWp 的年/月发电量，之后任意坡面通过双线性插值
+（方位角按 360° 周期）在微秒级得到估算值，不需要任何网络请求。
+
+构建（二选一）:
+    python3 yield_table.py config_australia.json                 # 本地引擎，一次 seriescalc 下载
+    python3 yield_table.py config_australia.json --engine pvcalc # 每个网格点一次 1 kWp PVcalc（经缓存/限流）
+
+使用:
+    table = YieldTable.load("output/lat_.../yield_table.json")
+    table.lookup(tilt=25, aspect=-30)   # {"annual_kwh_per_kwp": ..., "monthly_kwh_per_kwp": [...]}
+
+计算器中设置 calculation.engine 为 "table" 即可离线计算所有坡面。
+"""
+
+import argparse
+import json
+import os
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from pv_yield import build_pvcalc_params, normalize_aspect
+
+
+DEFAULT_TILTS = list(range(0, 91, 5))
+DEFAULT_ASPECTS = list(range(-180, 180, 15))
+DEFAULT_TABLE_FILE = "yield_table.json"
+DAYS_IN_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
+def linear_weights(grid: Sequence[float], value: float):
+    """升序网格上的线性插值: 返回 (下标0, 下标1, 下标1的权重)，超出范围时取边界值"""
+    if value <= grid[0]:
+        return 0, 0, 0.0
+    if value >= grid[-1]:
+        last = len(grid) - 1
+        return last, last, 0.0
+    i = bisect_right(grid, value) - 1
+    return i, i + 1, (value - grid[i]) / (grid[i + 1] - grid[i])
+
+
+def aspect_weights(aspects: Sequence[float], aspect: float):
+    """方位角按 360° 周期插值（aspects 为 -180~180 的升序）: 返回 (下标0, 下标1, 下标1的权重)"""
+    aspect = normalize_aspect(aspect)
+    if aspect < aspects[0]:
+        aspect += 360
+    n = len(aspects)
+    j = min(bisect_right(aspects, aspect) - 1, n - 1)
+    upper = aspects[j + 1] if j + 1 < n else aspects[0] + 360
+    return j, (j + 1) % n, (aspect - aspects[j]) / (upper - aspects[j])
+
+
+class YieldTable:
+    """倾角×方位角 网格上的单位容量发电量表"""
+
+    def __init__(self, tilts: Sequence[float], aspects: Sequence[float],
+                 annual: List[List[float]], monthly: List[List[List[float]]], metadata: Optional[Dict] = None):
+        """annual[i][j]、monthly[i][j][m] 对应 tilts[i]、aspects[j]（aspects 为 -180~180 的升序）"""
+        self.tilts = [float(t) for t in tilts]
+        self.aspects = [float(a) for a in aspects]
+        self.annual = annual
+        self.monthly = monthly
+        self.metadata = metadata or {}
+
+    def lookup(self, tilt: float, aspect: float) -> Dict:
+        """双线性插值任意坡面的单位容量发电量（倾角超出网格时取边界值）"""
+        i0, i1, u = linear_weights(self.tilts, tilt)
+        j0, j1, v = aspect_weights(self.aspects, aspect)
+        w00, w01, w10, w11 = (1 - u) * (1 - v), (1 - u) * v, u * (1 - v), u * v
+
+        annual = (w00 * self.annual[i0][j0] + w01 * self.annual[i0][j1]
+                  + w10 * self.annual[i1][j0] + w11 * self.annual[i1][j1])
+        m00, m01, m10, m11 = self.monthly[i0][j0], self.monthly[i0][j1], self.monthly[i1][j0], self.monthly[i1][j1]
+        monthly = [w00 * a + w01 * b + w10 * c + w11 * d for a, b, c, d in zip(m00, m01, m10, m11)]
+        return {"annual_kwh_per_kwp": annual, "monthly_kwh_per_kwp": monthly}
+
+    def to_dict(self) -> Dict:
+        return {
+            "metadata": self.metadata,
+            "tilts": self.tilts,
+            "aspects": self.aspects,
+            "annual_kwh_per_kwp": self.annual,
+            "monthly_kwh_per_kwp": self.monthly,
+        }
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "YieldTable":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data["tilts"], data["aspects"], data["annual_kwh_per_kwp"],
+                   data["monthly_kwh_per_kwp"], data.get("metadata"))
+
+
+def build_yield_table_local(columns: Dict, lat: float, lon: float, system_loss: float,
+                            temperature_coefficient: float, albedo: float = 0.2,
+                            tilts: Sequence[float] = DEFAULT_TILTS,
+                            aspects: Sequence[float] = DEFAULT_ASPECTS) -> YieldTable:
+    """用本地引擎构建（一次 seriescalc 辐照数据，按倾角逐行批量计算以限制内存）"""
+    from pv_engine import LocalPVEngine
+
+    engine = LocalPVEngine(columns, lat, lon)
+    annual, monthly = [], []
+    for tilt in tilts:
+        surfaces = [{"tilt": tilt, "aspect": aspect, "peak_power_kw": 1.0} for aspect in aspects]
+        output = engine.simulate(surfaces, system_loss, temperature_coefficient, albedo)
+        annual.append([round(float(e), 3) for e in output["annual_energy_kwh"]])
+        monthly.append([[round(float(e), 3) for e in row] for row in output["monthly_energy_kwh"]])
+    return YieldTable(tilts, aspects, annual, monthly)
+
+
+def build_yield_table_pvcalc(client, pvcalc_url: str, lat: float, lon: float, system_loss: float,
+                             degradation: float, tilts: Sequence[float] = DEFAULT_TILTS,
+                             aspects: Sequence[float] = DEFAULT_ASPECTS, max_workers: int = 4) -> YieldTable:
+    """每个网格点请求一次 1 kWp 的 PVcalc（经客户端缓存和限流，可并发）"""
+    grid = [(tilt, aspect) for tilt in tilts for aspect in aspects]
+
+    def fetch(point):
+        tilt, aspect = point
+        params = build_pvcalc_params(lat, lon, tilt, aspect, system_loss, degradation)
+        outputs = client.get_json(pvcalc_url, params, timeout=30)["outputs"]
+        return (outputs["totals"]["fixed"]["E_y"],
+                [month["E_m"] for month in outputs["monthly"]["fixed"]])
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        values = list(executor.map(fetch, grid))
+
+    n = len(aspects)
+    annual = [[values[i * n + j][0] for j in range(n)] for i in range(len(tilts))]
+    monthly = [[values[i * n + j][1] for j in range(n)] for i in range(len(tilts))]
+    return YieldTable(tilts, aspects, annual, monthly)
+
+
+def monthly_records_per_kwp(monthly_kwh_per_kwp: Sequence[float], peak_power_kw: float) -> List[Dict]:
+    """按装机容量缩放，返回与 PVcalc monthly.fixed 相同结构的月度数据"""
+    return [
+        {"month": m + 1, "E_d": e * peak_power_kw / DAYS_IN_MONTH[m], "E_m": e * peak_power_kw}
+        for m, e in enumerate(monthly_kwh_per_kwp)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建 倾角×方位角 单位容量发电量查找表')
+    parser.add_argument('config', help='计算器配置文件（使用其中的位置、系统损耗、组件参数）')
+    parser.add_argument('--engine', choices=['local', 'pvcalc'], default='local',
+                        help='local: 本地引擎（一次下载）；pvcalc: 每个网格点一次 PVcalc 请求')
+    parser.add_argument('--tilt-step', type=float, default=5, help='倾角步长（度），范围 0-90')
+    parser.add_argument('--aspect-step', type=float, default=15, help='方位角步长（度），需整除 360')
+    parser.add_argument('--output', default=None, help='输出文件，默认写入该地点输出目录下的 yield_table.json')
+    args = parser.parse_args()
+
+    from pv_calculator_2023 import PVGISCalculator2023
+
+    calculator = PVGISCalculator2023(args.config)
+    config = calculator.config
+    lat = config["location"]["latitude"]
+    lon = config["location"]["longitude"]
+    tilts = [i * args.tilt_step for i in range(int(90 // args.tilt_step) + 1)]
+    aspects = [-180 + j * args.aspect_step for j in range(int(round(360 / args.aspect_step)))]
+    print(f"网格: {len(tilts)} 个倾角 × {len(aspects)} 个方位角 = {len(tilts) * len(aspects)} 个点")
+
+    if args.engine == "local":
+        config["calculation"]["engine"] = "local"
+        calculator.get_hourly_radiation_2023()
+        if calculator.hourly_radiation_columns is None:
+            print("✗ 无法获取辐照数据")
+            return
+        table = build_yield_table_local(
+            calculator.hourly_radiation_columns, lat, lon, config["system_loss"],
+            config["panel_spec"].get("temperature_coefficient_pmax", 0),
+            config["calculation"].get("albedo", 0.2), tilts, aspects
+        )
+    else:
+        table = build_yield_table_pvcalc(
+            calculator.client, calculator.PVCALC_API, lat, lon, config["system_loss"],
+            config["panel_spec"]["annual_degradation"], tilts, aspects,
+            max_workers=config.get("pvgis", {}).get("max_workers", 4)
+        )
+
+    table.metadata = {
+        "location": config["location"],
+        "engine": args.engine,
+        "system_loss": config["system_loss"],
+        "annual_degradation": config["panel_spec"]["annual_degradation"],
+        "created_at": datetime.now().isoformat(),
+    }
+    output_file = args.output or os.path.join(calculator.output_dir, DEFAULT_TABLE_FILE)
+    table.save(output_file)
+    print(f"✓ 查找表已保存到: {output_file}")
+
+
+if __name__ == "__main__":
+    main()